@@ -0,0 +1,310 @@
+"""Headless HTTP API for DocQuery Chat.
+
+Serves the same pipeline as the Streamlit app to programs and load tests:
+
+    uvicorn api:app --host 0.0.0.0 --port 8000 --workers 4
+
+Requests authenticate with HTTP Basic credentials from ``users.json`` (see
+``create_users.py``); each user reads and writes only their own tenant.
+"""
+import hmac
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import secrets
+import threading
+from contextlib import asynccontextmanager
+from dotenv import load_dotenv
+from fastapi import FastAPI, Depends, HTTPException, UploadFile, File, status
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
+from fastapi.security import HTTPBasic, HTTPBasicCredentials
+from passlib.hash import sha256_crypt
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
+from rag_pipeline.rag_pipeline import open_vector_store, initialize_prompt, aquery_rag, stream_query_rag
+from rag_pipeline.manifest import file_fingerprint
+from rag_pipeline.file_loader import validate_filename
+from rag_pipeline.tenants import tenant_name, tenant_scope, tenant_tracker
+from rag_pipeline.answer_cache import get_answer_cache
+from rag_pipeline.metrics import metrics
+from rag_pipeline.config import (
+    VECTOR_BACKEND,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_MAX_ENTRIES,
+    RESOURCE_WARM_UP,
+    MULTI_TENANCY_ENABLED,
+    API_MAX_CONCURRENT_QUERIES,
+    API_QUERY_TIMEOUT_SECONDS,
+)
+from rag_pipeline.resources import (
+    registry, get_embeddings, get_llm, get_weaviate_client, get_ingest_manifest, get_ingest_jobs
+)
+
+# Configure logging
+logging.basicConfig(
+    filename='app.log',
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+# Weaviate class / local index holding the uploaded documents (shared with app.py)
+COLLECTION_NAME = "Document"
+USERS_PATH = "users.json"
+# Same limits as the Streamlit uploader
+MAX_UPLOAD_FILES = 50
+MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+# How often tenants idle for TENANT_IDLE_SECONDS are looked for and offloaded
+OFFLOAD_INTERVAL_SECONDS = 60
+
+security = HTTPBasic()
+prompt_template = initialize_prompt()
+# Queries answered at once by this worker; the rest wait for a slot within their timeout
+query_slots = asyncio.Semaphore(API_MAX_CONCURRENT_QUERIES)
+# Verified credentials, so the deliberately slow password hash is checked once per user. Passwords
+# are kept as HMACs under a key that only this process knows, never as plain fast hashes.
+_verified = {}
+_verified_lock = threading.Lock()
+_verified_key = secrets.token_bytes(32)
+
+
+def shared_weaviate_client():
+    return get_weaviate_client() if VECTOR_BACKEND != "local" else None
+
+
+async def _offload_idle_tenants():
+    while True:
+        await asyncio.sleep(OFFLOAD_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(tenant_tracker.offload_idle, shared_weaviate_client)
+        except Exception as e:
+            logger.error(f"Offloading idle tenants failed: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Shared clients are created once per worker process, ahead of the first request
+    if RESOURCE_WARM_UP:
+        registry.warm_up()
+    offloader = asyncio.create_task(_offload_idle_tenants())
+    try:
+        yield
+    finally:
+        offloader.cancel()
+        await asyncio.to_thread(registry.shutdown)
+
+
+app = FastAPI(title="DocQuery Chat API", lifespan=lifespan)
+
+
+class QueryRequest(BaseModel):
+    question: str = Field(min_length=1, max_length=4000)
+
+
+def authenticate(credentials: HTTPBasicCredentials = Depends(security)):
+    """Username of a user in ``users.json`` whose password matches."""
+    try:
+        with open(USERS_PATH, "r") as f:
+            users = json.load(f)
+    except FileNotFoundError:
+        raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "User database not found.")
+    stored_hash = users.get(credentials.username)
+    password_digest = hmac.new(_verified_key, credentials.password.encode("utf-8"), hashlib.sha256).hexdigest()
+    key = (credentials.username, stored_hash)
+    with _verified_lock:
+        verified = stored_hash is not None and secrets.compare_digest(_verified.get(key, ""), password_digest)
+    if not verified:
+        if stored_hash is None or not sha256_crypt.verify(credentials.password, stored_hash):
+            raise HTTPException(status.HTTP_401_UNAUTHORIZED, "Invalid username or password.",
+                                headers={"WWW-Authenticate": "Basic"})
+        with _verified_lock:
+            _verified[key] = password_digest
+    return credentials.username
+
+
+def user_tenant(username):
+    """Tenant holding a user's documents (None without multi-tenancy)."""
+    return tenant_name(username) if MULTI_TENANCY_ENABLED else None
+
+
+def answer_cache(tenant):
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    return get_answer_cache(tenant_scope(COLLECTION_NAME, tenant),
+                            threshold=ANSWER_CACHE_SIMILARITY, max_entries=ANSWER_CACHE_MAX_ENTRIES)
+
+
+def user_vector_store(tenant):
+    """The tenant's vector store, or 404 if nothing has been processed for it yet."""
+    if not get_ingest_manifest().sources(tenant_scope(COLLECTION_NAME, tenant)):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "No documents have been processed yet.")
+    tenant_tracker.touch(COLLECTION_NAME, tenant)
+    return open_vector_store(COLLECTION_NAME, shared_weaviate_client(), get_embeddings(), tenant=tenant)
+
+
+def user_job(job_id, tenant):
+    job = get_ingest_jobs().status(job_id)
+    if job is None or job["collection"] != COLLECTION_NAME or job["tenant"] != tenant:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Unknown job.")
+    return job
+
+
+@app.get("/health")
+def health():
+    """Status of the shared clients; 503 if any failed to start or is unhealthy."""
+    report = registry.health()
+    healthy = all(resource["status"] in ("ok", "not_started") for resource in report.values())
+    return JSONResponse(report, status_code=status.HTTP_200_OK if healthy else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """This worker's metrics in the Prometheus text format."""
+    return metrics.render()
+
+
+def _submit_uploads(uploads, tenant):
+    """Queue new or changed uploads for ingestion; returns (job ID or None, skipped file names)."""
+    manifest = get_ingest_manifest()
+    scope = tenant_scope(COLLECTION_NAME, tenant)
+    fingerprints, pending, skipped = {}, [], []
+    for name, data in uploads:
+        fingerprint = file_fingerprint(data)
+        if manifest.is_unchanged(scope, name, fingerprint):
+            skipped.append(name)
+            continue
+        fingerprints[name] = fingerprint
+        pending.append((name, data))
+    if not pending:
+        return None, skipped
+    tenant_tracker.touch(COLLECTION_NAME, tenant)
+    return get_ingest_jobs().submit(pending, COLLECTION_NAME, tenant, fingerprints), skipped
+
+
+@app.post("/documents", status_code=status.HTTP_202_ACCEPTED)
+async def upload_documents(files: list[UploadFile] = File(...), username: str = Depends(authenticate)):
+    """Queue PDF, DOCX and TXT files for background ingestion; poll ``/jobs/{job_id}`` for progress."""
+    if len(files) > MAX_UPLOAD_FILES:
+        raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, f"At most {MAX_UPLOAD_FILES} files per request.")
+    uploads, total_size = [], 0
+    for upload in files:
+        safe_filename = validate_filename(upload.filename or "")
+        if not safe_filename:
+            raise HTTPException(status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                f"Invalid file type: {upload.filename}. Supported: PDF, DOCX, TXT.")
+        data = await upload.read()
+        total_size += len(data)
+        if total_size > MAX_UPLOAD_BYTES:
+            raise HTTPException(status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, "Total file size exceeds 200 MB.")
+        uploads.append((safe_filename, data))
+    # Hashing and spooling the uploads to disk would block the event loop
+    job_id, skipped = await run_in_threadpool(_submit_uploads, uploads, user_tenant(username))
+    return {"job_id": job_id, "skipped": skipped}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str, username: str = Depends(authenticate)):
+    """Status and per-file progress of one of the user's ingestion jobs."""
+    return user_job(job_id, user_tenant(username))
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str, username: str = Depends(authenticate)):
+    user_job(job_id, user_tenant(username))
+    if not get_ingest_jobs().cancel(job_id):
+        raise HTTPException(status.HTTP_409_CONFLICT, "The job has already finished.")
+    return {"job_id": job_id, "cancelled": True}
+
+
+@app.post("/query")
+async def query(request: QueryRequest, username: str = Depends(authenticate)):
+    """Answer a question from the user's documents.
+
+    Fails with 503 if no query slot frees up, or 504 if the answer takes
+    longer than API_QUERY_TIMEOUT_SECONDS, waiting included.
+    """
+    tenant = user_tenant(username)
+    vector_store = await run_in_threadpool(user_vector_store, tenant)
+    started = time.perf_counter()
+    answering = False
+    try:
+        async with asyncio.timeout(API_QUERY_TIMEOUT_SECONDS):
+            async with query_slots:
+                answering = True
+                result = await aquery_rag(request.question, vector_store, get_llm(), prompt_template,
+                                          answer_cache=answer_cache(tenant))
+    except TimeoutError:
+        metrics.inc("rag_stage_errors_total", stage="api_timeout")
+        if not answering:
+            raise HTTPException(status.HTTP_503_SERVICE_UNAVAILABLE, "Too many queries in progress; try again later.")
+        raise HTTPException(status.HTTP_504_GATEWAY_TIMEOUT,
+                            f"No answer within {API_QUERY_TIMEOUT_SECONDS:g}s.")
+    metrics.observe("rag_stage_duration_seconds", time.perf_counter() - started, stage="api_query")
+    if result["metadata"].get("error"):
+        raise HTTPException(status.HTTP_500_INTERNAL_SERVER_ERROR, result["answer"])
+    return result
+
+
+async def _answer_events(question, vector_store, tenant):
+    """NDJSON events: ``{"type": "token", "text": ...}`` per piece, then ``{"type": "result", ...}``.
+
+    Generation runs in worker threads; a timeout or missing query slot ends
+    the stream with ``{"type": "error", ...}``. Generation is stopped once the
+    stream ends early, so the LLM stream doesn't keep running.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + API_QUERY_TIMEOUT_SECONDS
+    try:
+        await asyncio.wait_for(query_slots.acquire(), deadline - loop.time())
+    except TimeoutError:
+        metrics.inc("rag_stage_errors_total", stage="api_timeout")
+        yield json.dumps({"type": "error", "error": "Too many queries in progress; try again later."}) + "\n"
+        return
+    answer_stream, pieces, piece_ready = None, None, None
+    try:
+        answer_stream = await run_in_threadpool(stream_query_rag, question, vector_store, get_llm(),
+                                                prompt_template, answer_cache=answer_cache(tenant))
+        pieces = iter(answer_stream)
+        while True:
+            piece_ready = asyncio.ensure_future(run_in_threadpool(next, pieces, None))
+            # Shielded: a piece still being generated when we give up must finish before the stream is closed
+            piece = await asyncio.wait_for(asyncio.shield(piece_ready), deadline - loop.time())
+            if piece is None:
+                break
+            yield json.dumps({"type": "token", "text": piece}) + "\n"
+        yield json.dumps({"type": "result", **answer_stream.result}, default=str) + "\n"
+    except TimeoutError:
+        metrics.inc("rag_stage_errors_total", stage="api_timeout")
+        yield json.dumps({"type": "error", "error": f"No answer within {API_QUERY_TIMEOUT_SECONDS:g}s."}) + "\n"
+    finally:
+        query_slots.release()
+        if answer_stream is not None:
+            _close_answer_stream(answer_stream, pieces, piece_ready)
+
+
+def _close_answer_stream(answer_stream, pieces, piece_ready):
+    """Close a stream in a worker thread, after the piece being generated (if any) is done."""
+    def close():
+        if pieces is not None:
+            pieces.close()
+        answer_stream.close()
+
+    loop = asyncio.get_running_loop()
+    if piece_ready is None or piece_ready.done():
+        loop.run_in_executor(None, close)
+    else:
+        piece_ready.add_done_callback(lambda _: loop.run_in_executor(None, close))
+
+
+@app.post("/query/stream")
+async def query_stream(request: QueryRequest, username: str = Depends(authenticate)):
+    """Stream the answer as newline-delimited JSON while it is generated."""
+    tenant = user_tenant(username)
+    vector_store = await run_in_threadpool(user_vector_store, tenant)
+    return StreamingResponse(_answer_events(request.question, vector_store, tenant),
+                             media_type="application/x-ndjson")
@@ -1,6 +1,5 @@
 import streamlit as st
 import os
-import shutil
 import json
 import time
 import uuid
@@ -8,12 +7,28 @@ import html
 import logging
 from dotenv import load_dotenv
 from passlib.hash import sha256_crypt
-from pathlib import Path
-from langsmith import Client
-from rag_pipeline.embedder import initialize_embeddings, initialize_llm
-from rag_pipeline.weviate_helper import initialize_weaviate, create_or_connect_class
-from rag_pipeline.file_loader import load_documents, split_documents
-from rag_pipeline.rag_pipeline import store_embeddings, initialize_prompt, query_rag
+from rag_pipeline.weviate_helper import create_or_connect_class
+from rag_pipeline.rag_pipeline import open_vector_store as open_collection, initialize_prompt, stream_query_rag
+from rag_pipeline.manifest import file_fingerprint
+from rag_pipeline.file_loader import validate_filename
+from rag_pipeline.tenants import tenant_name, tenant_scope, delete_tenant, offload_tenant, tenant_tracker
+from rag_pipeline.config import (
+    VECTOR_BACKEND,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_SIMILARITY,
+    ANSWER_CACHE_MAX_ENTRIES,
+    RESOURCE_WARM_UP,
+    METRICS_PORT,
+    METRICS_HOST,
+    MULTI_TENANCY_ENABLED,
+    VECTOR_QUANTIZATION,
+    PQ_SEGMENTS,
+)
+from rag_pipeline.answer_cache import get_answer_cache
+from rag_pipeline.metrics import metrics, start_metrics_server
+from rag_pipeline.resources import (
+    registry, get_embeddings, get_llm, get_feedback_queue, get_weaviate_client, get_ingest_manifest, get_ingest_jobs
+)
 
 # Configure logging
 logging.basicConfig(
@@ -25,16 +40,22 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
-# Initialize LangSmith client
-langsmith_client = Client()
-
 # Validate environment variables
-required_env_vars = ["GOOGLE_API_KEY", "WEAVIATE_URL", "WEAVIATE_API_KEY", "LANGCHAIN_API_KEY"]
+required_env_vars = ["GOOGLE_API_KEY", "LANGCHAIN_API_KEY"]
+if VECTOR_BACKEND != "local":
+    required_env_vars += ["WEAVIATE_URL", "WEAVIATE_API_KEY"]
 missing_vars = [var for var in required_env_vars if not os.getenv(var)]
 if missing_vars:
     st.error(f"Missing environment variables: {', '.join(missing_vars)}. Please check .env file.")
     st.stop()
 
+# Shared clients are created once per process, in the background, ahead of the first request
+if RESOURCE_WARM_UP:
+    registry.warm_up()
+# Prometheus text endpoint, started once per process
+if METRICS_PORT:
+    start_metrics_server(METRICS_PORT, host=METRICS_HOST)
+
 # Initialize Streamlit app
 st.set_page_config(page_title="DocQuery Chat", page_icon="📚", layout="wide")
 
@@ -61,46 +82,71 @@ if "vector_store" not in st.session_state:
     st.session_state.vector_store = None
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
-if "weaviate_client" not in st.session_state:
-    st.session_state.weaviate_client = None
 if "prompt_template" not in st.session_state:
     st.session_state.prompt_template = None
 if "last_activity" not in st.session_state:
     st.session_state.last_activity = time.time()
+if "username" not in st.session_state:
+    st.session_state.username = None
+if "ingest_job_id" not in st.session_state:
+    st.session_state.ingest_job_id = None
+    st.session_state.ingest_job_loaded = False
+
+# Weaviate class / local index holding the uploaded documents
+COLLECTION_NAME = "Document"
+
+def current_tenant():
+    """Tenant holding the logged-in user's documents (None without multi-tenancy)."""
+    if not MULTI_TENANCY_ENABLED or not st.session_state.username:
+        return None
+    return tenant_name(st.session_state.username)
+
+def shared_weaviate_client():
+    return get_weaviate_client() if VECTOR_BACKEND != "local" else None
 
-# Create temporary directory for uploaded files
-TEMP_DIR = "temp_uploads"
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
-
-def clear_temp_dir():
-    """Remove all files in the temporary directory."""
-    if os.path.exists(TEMP_DIR):
-        shutil.rmtree(TEMP_DIR)
-        os.makedirs(TEMP_DIR)
-
-def cleanup():
-    """Close Weaviate client and clear session state."""
-    if st.session_state.weaviate_client is not None:
-        logger.info("Closing Weaviate client...")
-        st.session_state.weaviate_client.close()
-        st.session_state.weaviate_client = None
+def cleanup(delete_documents=False):
+    """Clear session state; shared clients stay open for other sessions.
+
+    The user's tenant is offloaded from memory, or with ``delete_documents``
+    deleted along with everything stored for it.
+    """
+    tenant = current_tenant()
+    if tenant is not None:
+        try:
+            active_jobs = [job for job in get_ingest_jobs().jobs(COLLECTION_NAME, tenant)
+                           if job["status"] in ("queued", "running")]
+            if delete_documents:
+                for job in active_jobs:
+                    get_ingest_jobs().cancel(job["id"])
+                delete_tenant(COLLECTION_NAME, tenant, shared_weaviate_client(), get_ingest_manifest())
+                tenant_tracker.forget(COLLECTION_NAME, tenant)
+            elif not active_jobs:
+                # A tenant whose documents are still being processed stays loaded
+                offload_tenant(COLLECTION_NAME, tenant, shared_weaviate_client())
+                tenant_tracker.forget(COLLECTION_NAME, tenant)
+        except Exception as e:
+            logger.error(f"Failed to release tenant {tenant}: {e}")
     st.session_state.vector_store = None
     st.session_state.prompt_template = None
     st.session_state.chat_history = []
     st.session_state.authenticated = False
-    clear_temp_dir()
+    st.session_state.username = None
+    st.session_state.ingest_job_id = None
     st.success("Session cleared and resources cleaned up.")
 
-def validate_filename(filename):
-    """Sanitize and validate filename to prevent path traversal."""
-    safe_filename = Path(filename).name
-    if not safe_filename.endswith((".pdf", ".docx", ".txt")):
+def answer_cache():
+    """Process-wide semantic answer cache for the user's documents, if enabled."""
+    if not ANSWER_CACHE_ENABLED:
         return None
-    return safe_filename
+    return get_answer_cache(tenant_scope(COLLECTION_NAME, current_tenant()),
+                            threshold=ANSWER_CACHE_SIMILARITY, max_entries=ANSWER_CACHE_MAX_ENTRIES)
+
+def open_vector_store(weaviate_client, embeddings):
+    """The user's vector store, with hybrid search when enabled."""
+    return open_collection(COLLECTION_NAME, weaviate_client, embeddings, tenant=current_tenant())
 
 def process_documents(uploaded_files):
-    """Process uploaded documents and store embeddings in Weaviate."""
+    """Queue uploaded documents for background ingestion into the user's collection."""
     st.session_state.last_activity = time.time()
     if not uploaded_files:
         st.error("Please upload at least one document.")
@@ -109,58 +155,102 @@ def process_documents(uploaded_files):
         st.warning("Uploading more than 50 documents may cause performance issues. Consider processing in batches.")
         return
 
-    # Save uploaded files to temporary directory
-    file_paths = []
+    manifest = get_ingest_manifest()
+    collection_name = COLLECTION_NAME
+    tenant = current_tenant()
+    scope = tenant_scope(collection_name, tenant)
+    tenant_tracker.touch(collection_name, tenant)
+
+    # Uploads already stored unchanged are skipped
+    uploads = []
+    fingerprints = {}
+    skipped_files = []
     total_size = 0
     for uploaded_file in uploaded_files:
         safe_filename = validate_filename(uploaded_file.name)
         if not safe_filename:
             st.error(f"Invalid file type: {uploaded_file.name}. Supported: PDF, DOCX, TXT.")
             continue
-        file_path = os.path.join(TEMP_DIR, safe_filename)
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        file_paths.append(file_path)
         total_size += uploaded_file.size
+        fingerprint = file_fingerprint(uploaded_file.getbuffer())
+        if manifest.is_unchanged(scope, safe_filename, fingerprint):
+            skipped_files.append(safe_filename)
+            continue
+        fingerprints[safe_filename] = fingerprint
+        uploads.append((safe_filename, uploaded_file))
     if total_size > 200 * 1024 * 1024:  # 200 MB
         st.error("Total file size exceeds 200 MB. Please upload fewer or smaller files.")
-        clear_temp_dir()
         return
 
     try:
-        with st.spinner("Initializing embeddings and LLM..."):
-            embeddings = initialize_embeddings()
-            llm = initialize_llm()
-
-        with st.spinner("Initializing Weaviate..."):
-            if st.session_state.weaviate_client is None:
-                st.session_state.weaviate_client = initialize_weaviate()
-            collection = create_or_connect_class(st.session_state.weaviate_client, class_name="Document")
-
-        with st.spinner("Loading and splitting documents..."):
-            documents = load_documents(file_paths)
-            if not documents:
-                st.error("No valid documents loaded.")
-                return
-            st.markdown(f"<div class='file-info'>Loaded {len(documents)} document(s): {[Path(fp).name for fp in file_paths]}</div>", unsafe_allow_html=True)
-            chunks = split_documents(documents)
-            if not chunks:
-                st.error("No document chunks created.")
-                return
-
-        with st.spinner("Generating and storing embeddings..."):
-            st.session_state.vector_store = store_embeddings(
-                chunks, collection.name, st.session_state.weaviate_client, embeddings
-            )
-
-        with st.spinner("Initializing prompt..."):
+        if skipped_files:
+            st.markdown(f"<div class='file-info'>Skipped {len(skipped_files)} unchanged document(s): {skipped_files}</div>", unsafe_allow_html=True)
+        if not uploads:
+            with st.spinner("Initializing embeddings..."):
+                embeddings = get_embeddings()
+            weaviate_client = None
+            if VECTOR_BACKEND != "local":
+                with st.spinner("Initializing Weaviate..."):
+                    weaviate_client = get_weaviate_client()
+                    create_or_connect_class(weaviate_client, class_name=collection_name, multi_tenancy=MULTI_TENANCY_ENABLED,
+                                            quantization=VECTOR_QUANTIZATION, pq_segments=PQ_SEGMENTS)
+            st.session_state.vector_store = open_vector_store(weaviate_client, embeddings)
             st.session_state.prompt_template = initialize_prompt()
+            st.success("Documents are already up to date! You can now ask questions.")
+            return
 
-        st.success("Documents processed successfully! You can now ask questions.")
+        # Loading, splitting and embedding run in a background job; the sidebar shows its progress
+        st.session_state.ingest_job_id = get_ingest_jobs().submit(uploads, collection_name, tenant, fingerprints)
+        st.session_state.ingest_job_loaded = False
     except Exception as e:
         st.error(f"Error processing documents: {e}")
-    finally:
-        clear_temp_dir()
+
+def latest_ingest_job():
+    """The session's ingestion job, or after a page refresh the user's latest one."""
+    jobs = get_ingest_jobs()
+    if st.session_state.ingest_job_id is None:
+        user_jobs = jobs.jobs(COLLECTION_NAME, current_tenant())
+        if not user_jobs:
+            return None
+        st.session_state.ingest_job_id = user_jobs[-1]["id"]
+        st.session_state.ingest_job_loaded = st.session_state.vector_store is not None
+    return jobs.status(st.session_state.ingest_job_id)
+
+@st.fragment(run_every=2)
+def ingest_job_panel():
+    """Per-file and per-batch progress of the ingestion job, refreshed every 2 seconds."""
+    job = latest_ingest_job()
+    if job is None:
+        return
+    files = job["files"]
+    progress = job["progress"]
+    finished_files = sum(entry["status"] in ("parsed", "done", "failed") for entry in files)
+    st.markdown(f"**Processing job:** {job['status']}")
+    if job["status"] in ("queued", "running"):
+        st.progress(finished_files / len(files), text=f"{finished_files} of {len(files)} file(s) parsed")
+        if st.button("Cancel processing"):
+            get_ingest_jobs().cancel(job["id"])
+    for entry in files:
+        st.markdown(f"<div class='file-info'>{html.escape(entry['name'])}: {entry['status']}, {entry['pages']} page(s), {entry['chunks']} chunk(s)</div>", unsafe_allow_html=True)
+        if entry["error"]:
+            st.warning(f"Failed to load {entry['name']}: {entry['error']}")
+    if progress:
+        st.markdown(f"<div class='file-info'>Stored {progress['chunks']} chunk(s) in {progress['batches']} batch(es), {progress['embedded']} embedded</div>", unsafe_allow_html=True)
+        if progress.get("duplicates"):
+            st.markdown(f"<div class='file-info'>Collapsed {progress['duplicates']} duplicate chunk(s), saving as many embedding calls and index entries</div>", unsafe_allow_html=True)
+    if job["resumed_chunks"]:
+        st.markdown(f"<div class='file-info'>Resumed with {job['resumed_chunks']} chunk(s) already embedded</div>", unsafe_allow_html=True)
+    if job["status"] == "failed":
+        st.error(f"Error processing documents: {job['error']}")
+    if job["status"] == "completed" and not st.session_state.ingest_job_loaded:
+        st.session_state.ingest_job_loaded = True
+        if not progress.get("chunks"):
+            st.error("No document chunks created.")
+            return
+        st.session_state.vector_store = open_vector_store(shared_weaviate_client(), get_embeddings())
+        st.session_state.prompt_template = initialize_prompt()
+        # Rerun the whole page so the chat appears
+        st.rerun()
 
 # Authentication
 if not st.session_state.authenticated:
@@ -173,6 +263,7 @@ if not st.session_state.authenticated:
                 users = json.load(f)
             if username in users and sha256_crypt.verify(password, users[username]):
                 st.session_state.authenticated = True
+                st.session_state.username = username
                 st.session_state.last_activity = time.time()
                 st.success("Logged in successfully!")
                 st.rerun()
@@ -183,6 +274,9 @@ if not st.session_state.authenticated:
         except Exception as e:
             st.error(f"Login error: {e}")
 else:
+    # Free the indexes of users who have been idle for TENANT_IDLE_SECONDS
+    tenant_tracker.offload_idle(shared_weaviate_client)
+
     # Check for session timeout (30 minutes)
     if time.time() - st.session_state.last_activity > 1800:
         cleanup()
@@ -204,12 +298,23 @@ else:
         )
         if st.button("Process Documents"):
             process_documents(uploaded_files)
+        ingest_job_panel()
         if st.button("Clear Session"):
-            cleanup()
+            cleanup(delete_documents=True)
             st.rerun()
         if st.button("Logout"):
             cleanup()
             st.rerun()
+        if answer_cache() is not None:
+            cache_stats = answer_cache().stats()
+            st.markdown(f"<div class='file-info'>Answer cache: {cache_stats['hits']} hit(s) of {cache_stats['hits'] + cache_stats['misses']} question(s), {cache_stats['seconds_saved']:.1f}s saved</div>", unsafe_allow_html=True)
+        with st.expander("Pipeline metrics"):
+            snapshot = metrics.snapshot()
+            st.table([
+                {"series": series, "count": summary["count"], "mean ms": round(summary["mean"] * 1000, 1)}
+                for series, summary in sorted(snapshot["histograms"].items())
+            ])
+            st.json(snapshot["counters"])
 
     # Chat interface
     st.subheader("Chat")
@@ -229,6 +334,17 @@ else:
                 else:  # assistant
                     escaped_content = html.escape(message['content'])
                     st.markdown(f"<div class='chat-message-assistant'>{escaped_content}</div>", unsafe_allow_html=True)
+                    timings = message.get("timings")
+                    if timings:
+                        tokens_per_second = timings["tokens_per_second"]
+                        st.caption(
+                            f"First token after {timings['time_to_first_token_seconds']:.2f}s · "
+                            f"{timings['output_tokens']} tokens"
+                            + (f" at {tokens_per_second:.0f} tokens/s" if tokens_per_second else "")
+                        )
+                    if message.get("debug"):
+                        with st.expander("Debug"):
+                            st.json(message["debug"])
                 
                 # Show feedback UI for the latest assistant message
                 if message["role"] == "assistant":
@@ -249,14 +365,18 @@ else:
                                 st.warning("Please select a feedback option before submitting.")
                             elif message.get("run_id"):
                                 feedback_score = 1 if feedback == "👍 Yes" else 0
-                                langsmith_client.create_feedback(
-                                    run_id=message["run_id"],
+                                # Sent to LangSmith in the background
+                                if get_feedback_queue().submit(
+                                    message["run_id"],
                                     key="user-feedback",
                                     score=feedback_score,
-                                    comment=f"User feedback for message {idx}"
-                                )
-                                message["feedback"] = feedback
-                                st.rerun()
+                                    comment=f"User feedback for message {idx}",
+                                    trace_id=message.get("trace_id")
+                                ):
+                                    message["feedback"] = feedback
+                                    st.rerun()
+                                else:
+                                    st.error("Unable to log feedback: LangSmith feedback queue is full.")
                             else:
                                 st.error("Unable to log feedback: No LangSmith run ID found.")
 
@@ -273,39 +393,50 @@ else:
             with chat_container:
                 escaped_question = html.escape(question)
                 st.markdown(f"<div class='chat-message-user'>{escaped_question}</div>", unsafe_allow_html=True)
-                with st.spinner("Processing..."):
-                    try:
-                        llm = initialize_llm()
-                        runs = list(langsmith_client.list_runs(project_name="DocQuery-Chat-Eval", limit=1))
-                        pre_run_id = runs[0].id if runs else None
-
-                        result = query_rag(
+                try:
+                    answer_placeholder = st.empty()
+                    with st.spinner("Processing..."):
+                        if tenant_tracker.touch(COLLECTION_NAME, current_tenant()):
+                            # The tenant was offloaded while idle; reopen its indexes
+                            st.session_state.vector_store = open_vector_store(shared_weaviate_client(), get_embeddings())
+                        llm = get_llm()
+                        answer_stream = stream_query_rag(
                             question,
                             st.session_state.vector_store,
                             llm,
                             st.session_state.prompt_template,
-                            run_id=pre_run_id
+                            answer_cache=answer_cache()
                         )
-
-                        answer = result["answer"]
-                        rewritten_query = result["metadata"]["rewritten_query"]
-
-                        st.session_state.chat_history.append({"role": "rewritten_query", "content": rewritten_query})
-                        escaped_rewritten_query = html.escape(rewritten_query)
-                        st.markdown(f"<div class='chat-message-rewritten'>Rewritten Query: {escaped_rewritten_query}</div>", unsafe_allow_html=True)
-
-                        runs = list(langsmith_client.list_runs(project_name="DocQuery-Chat-Eval", limit=1))
-                        post_run_id = runs[0].id if runs else None
-
-                        assistant_message = {
-                            "role": "assistant",
-                            "content": answer,
-                            "run_id": post_run_id if pre_run_id != post_run_id else None
-                        }
-                        st.session_state.chat_history.append(assistant_message)
-                        st.rerun()
-
-                    except Exception as e:
-                        st.error(f"Error generating answer: {e}")
-                        st.session_state.chat_history.append({"role": "assistant", "content": f"Error: {e}"})
-                        st.rerun()
\ No newline at end of file
+                        pieces = iter(answer_stream)
+                        # The spinner covers rewrite and retrieval, until the first token arrives
+                        streamed_text = next(pieces, "")
+
+                    # Render tokens as they arrive
+                    answer_placeholder.markdown(f"<div class='chat-message-assistant'>{html.escape(streamed_text)}</div>", unsafe_allow_html=True)
+                    for piece in pieces:
+                        streamed_text += piece
+                        answer_placeholder.markdown(f"<div class='chat-message-assistant'>{html.escape(streamed_text)}</div>", unsafe_allow_html=True)
+
+                    result = answer_stream.result
+                    answer = result["answer"]
+                    rewritten_query = result["metadata"]["rewritten_query"]
+
+                    st.session_state.chat_history.append({"role": "rewritten_query", "content": rewritten_query})
+
+                    assistant_message = {
+                        "role": "assistant",
+                        "content": answer,
+                        "run_id": answer_stream.run_id,
+                        "trace_id": answer_stream.trace_id,
+                        "timings": result["metadata"].get("timings"),
+                        "debug": {key: result["metadata"].get(key) for key in (
+                            "original_query", "rewritten_query", "cache_hit", "sources", "timings"
+                        )} | {"run_id": str(answer_stream.run_id) if answer_stream.run_id else None}
+                    }
+                    st.session_state.chat_history.append(assistant_message)
+                    st.rerun()
+
+                except Exception as e:
+                    st.error(f"Error generating answer: {e}")
+                    st.session_state.chat_history.append({"role": "assistant", "content": f"Error: {e}"})
+                    st.rerun()
\ No newline at end of file
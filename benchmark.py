@@ -0,0 +1,377 @@
+"""Offline ingestion and query benchmark for DocQuery Chat.
+
+Generates synthetic PDF, DOCX and TXT corpora, ingests them into the local
+vector store with deterministic fake embeddings, then answers questions with
+``query_rag`` using a fake rewriter and LLM. No Gemini, Weaviate or
+LangSmith account is needed. Results are printed (or written) as JSON:
+
+    python benchmark.py --documents 12,48 --concurrency 1,4,16 --output bench.json
+
+``--compression-report`` also compares vector compression modes on each
+corpus's chunks, padded to ``--compression-vectors``: recall@k against exact
+full-precision search, search latency, code bytes per vector and codebook
+bytes, with and without rescoring, at full and reduced dimensions.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import platform
+from concurrent.futures import ThreadPoolExecutor
+
+_work_dir = tempfile.mkdtemp(prefix="docquery-bench-")
+# Configure the pipeline before it is imported: local store, no tracing, no disk caches
+os.environ["VECTOR_BACKEND"] = "local"
+os.environ["LOCAL_VECTOR_STORE_DIR"] = os.path.join(_work_dir, "vector_store")
+os.environ["LANGCHAIN_TRACING_V2"] = "false"
+os.environ["LANGSMITH_TRACING"] = "false"
+
+import numpy as np
+from docx import Document as DocxDocument
+from langchain_core.documents import Document
+from rag_pipeline.config import (
+    LOADER_WORKERS, INGEST_BATCH_SIZE, EMBED_MAX_CONCURRENCY, QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX_SIZE,
+    VECTOR_RESCORE_FACTOR, PQ_SEGMENTS
+)
+from rag_pipeline.fakes import FakeEmbeddings, FakeLLM, FakeQueryRewriter
+from rag_pipeline.file_loader import load_documents, split_documents
+from rag_pipeline.keyword_index import BM25Index, HybridRetriever
+from rag_pipeline.rag_pipeline import store_embeddings, initialize_prompt, query_rag
+from rag_pipeline.query_batcher import QueryBatcher
+from rag_pipeline.local_vector_store import LocalVectorStore
+from rag_pipeline.quantization import QUANTIZATION_MODES
+from rag_pipeline.resources import registry
+
+WORDS = (
+    "contract payment invoice delivery warranty liability schedule clause party notice term renewal "
+    "pressure valve turbine sensor calibration voltage current torque bearing housing assembly "
+    "revenue margin forecast budget audit compliance policy retention encryption access backup "
+    "network latency throughput cache cluster replica shard index query vector embedding model"
+).split()
+
+
+def _sentence(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(8, 18))]
+    return " ".join(words).capitalize() + "."
+
+
+def _pages(rng, pages, words_per_page):
+    """Synthetic pages of (heading, paragraphs) with numbered sections."""
+    result = []
+    for page in range(pages):
+        heading = f"Section {page + 1}.{rng.randint(1, 9)} {rng.choice(WORDS).title()}"
+        paragraphs, count = [], 0
+        while count < words_per_page:
+            paragraph = " ".join(_sentence(rng) for _ in range(rng.randint(3, 6)))
+            paragraphs.append(paragraph)
+            count += len(paragraph.split())
+        result.append((heading, paragraphs))
+    return result
+
+
+def _pdf_text(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text, width=90):
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def write_pdf(path, pages):
+    """Write a minimal multi-page PDF with one Helvetica text block per page."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for heading, paragraphs in pages:
+        lines = [heading, ""] + [line for paragraph in paragraphs for line in _wrap(paragraph) + [""]]
+        stream = "BT /F1 9 Tf 11 TL 40 800 Td " + " ".join(f"({_pdf_text(line)}) Tj T*" for line in lines) + " ET"
+        stream = stream.encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def write_docx(path, pages):
+    document = DocxDocument()
+    for heading, paragraphs in pages:
+        document.add_heading(heading, level=2)
+        for paragraph in paragraphs:
+            document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def write_txt(path, pages):
+    with open(path, "w") as f:
+        for heading, paragraphs in pages:
+            f.write(heading.upper() + "\n\n" + "\n\n".join(paragraphs) + "\n\n")
+
+
+WRITERS = {"pdf": write_pdf, "docx": write_docx, "txt": write_txt}
+
+
+def generate_corpus(directory, documents, pages_per_document, words_per_page, formats, seed=0):
+    """Write ``documents`` files, cycling through ``formats``; returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for index in range(documents):
+        extension = formats[index % len(formats)]
+        path = os.path.join(directory, f"doc_{index:04d}.{extension}")
+        WRITERS[extension](path, _pages(rng, pages_per_document, words_per_page))
+        paths.append(path)
+    return paths
+
+
+def generate_questions(count, seed=1):
+    rng = random.Random(seed)
+    return [f"What about {rng.choice(WORDS)} {rng.choice(WORDS)}?" for _ in range(count)]
+
+
+def _timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def _rate(count, seconds):
+    return round(count / seconds, 2) if seconds > 0 else None
+
+
+def _latency_summary(latencies):
+    values = np.asarray(latencies) * 1000
+    return {
+        "p50_ms": round(float(np.percentile(values, 50)), 2),
+        "p95_ms": round(float(np.percentile(values, 95)), 2),
+        "p99_ms": round(float(np.percentile(values, 99)), 2),
+        "mean_ms": round(float(values.mean()), 2),
+        "max_ms": round(float(values.max()), 2),
+    }
+
+
+def run_queries(vector_store, llm, prompt_template, questions, concurrency):
+    def ask(question):
+        started = time.perf_counter()
+        result = query_rag(question, vector_store, llm, prompt_template)
+        return time.perf_counter() - started, "error" in result["metadata"]
+
+    embedding_requests = vector_store.embeddings.calls
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(ask, questions))
+    wall = time.perf_counter() - started
+    latencies = [latency for latency, _ in outcomes]
+    return {
+        "concurrency": concurrency,
+        "queries": len(questions),
+        "errors": sum(1 for _, failed in outcomes if failed),
+        "embedding_requests": vector_store.embeddings.calls - embedding_requests,
+        "throughput_qps": _rate(len(questions), wall),
+        **_latency_summary(latencies),
+    }
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+
+def compression_report(chunks, questions, dimensions, rescore_factor, k=10, min_vectors=20_000):
+    """Recall@k, search latency and index size per compression mode, dimensions and rescore factor.
+
+    A hit counts towards recall if its exact full-dimension similarity is at
+    least that of the k-th exact result, so ties don't count as misses. The
+    chunks are padded with synthetic paragraphs up to ``min_vectors``, so PQ
+    has far more vectors than centroids and recall isn't trivially perfect.
+    Code bytes per vector and the fixed codebook bytes are reported apart.
+    """
+    texts = [chunk.page_content for chunk in chunks]
+    rng = random.Random(len(texts))
+    while len(texts) < min_vectors:
+        texts.append(" ".join(_sentence(rng) for _ in range(rng.randint(3, 6))))
+    chunks = [Document(page_content=text) for text in texts]
+    ids = [str(index) for index in range(len(texts))]
+    expected = min(k, len(texts))
+    full = FakeEmbeddings()
+    exact_scores = _unit([full.embed_query(question) for question in questions]) @ _unit(full.embed_documents(texts)).T
+    kth = np.sort(exact_scores, axis=1)[:, -expected]
+    rows = []
+    for dims in dict.fromkeys([full.dimensions] + dimensions):
+        embeddings = FakeEmbeddings(dimensions=dims)
+        vectors = embeddings.embed_documents(texts)
+        query_vectors = [embeddings.embed_query(question) for question in questions]
+        for mode in QUANTIZATION_MODES:
+            for factor in ([1] if mode == "none" else sorted({1, rescore_factor})):
+                store = LocalVectorStore(embeddings, quantization=mode, rescore_factor=factor, pq_segments=PQ_SEGMENTS)
+                store.add_vectors(chunks, vectors, ids)
+                index_bytes = store.index_nbytes  # also trains the quantizer
+                codebook_bytes = store.codebook_nbytes
+                latencies, recalls = [], []
+                for question, query_vector in enumerate(query_vectors):
+                    hits, seconds = _timed(store.similarity_search_by_vector_with_score, query_vector, k)
+                    latencies.append(seconds)
+                    found = [int(doc.id) for doc, _ in hits]
+                    recalls.append(np.sum(exact_scores[question, found] >= kth[question] - 1e-6) / expected)
+                rows.append({
+                    "quantization": mode,
+                    "dimensions": dims,
+                    "rescore_factor": factor,
+                    f"recall_at_{k}": round(float(np.mean(recalls)), 4),
+                    "vectors": len(texts),
+                    "index_bytes": index_bytes,
+                    "bytes_per_vector": round(index_bytes / len(texts), 2),
+                    "codebook_bytes": codebook_bytes,
+                    **{key: value for key, value in _latency_summary(latencies).items() if key in ("p50_ms", "p95_ms")},
+                })
+    return rows
+
+
+def benchmark_corpus(args, documents, embeddings, llm, prompt_template):
+    corpus_dir = os.path.join(_work_dir, f"corpus_{documents}")
+    paths = generate_corpus(corpus_dir, documents, args.pages, args.words_per_page, args.formats, seed=documents)
+    corpus_bytes = sum(os.path.getsize(path) for path in paths)
+
+    pages, load_seconds = _timed(load_documents, paths, max_workers=args.workers)
+    chunks, split_seconds = _timed(split_documents, pages)
+    keyword_index = BM25Index() if args.hybrid else None
+    vector_store, store_seconds = _timed(
+        store_embeddings, chunks, f"Bench{documents}", None, embeddings,
+        batch_size=args.batch_size, max_concurrency=args.embed_concurrency, keyword_index=keyword_index
+    )
+    if keyword_index is not None:
+        vector_store = HybridRetriever(vector_store, keyword_index)
+
+    questions = generate_questions(args.queries)
+    queries = [
+        run_queries(vector_store, llm, prompt_template, questions, concurrency)
+        for concurrency in args.concurrency
+    ]
+    result = {
+        "documents": documents,
+        "bytes": corpus_bytes,
+        "pages": len(pages),
+        "chunks": len(chunks),
+        "ingestion": {
+            "load_documents": {"seconds": round(load_seconds, 4), "pages_per_second": _rate(len(pages), load_seconds),
+                               "chunks_per_second": _rate(len(chunks), load_seconds)},
+            "split_documents": {"seconds": round(split_seconds, 4), "chunks_per_second": _rate(len(chunks), split_seconds)},
+            "store_embeddings": {"seconds": round(store_seconds, 4), "chunks_per_second": _rate(len(chunks), store_seconds)},
+        },
+        "query_rag": queries,
+    }
+    if args.compression_report:
+        result["compression"] = compression_report(chunks, questions, args.compression_dimensions, args.rescore_factor,
+                                                   min_vectors=args.compression_vectors)
+    return result
+
+
+def _int_list(value):
+    return [int(item) for item in re.split(r"[,\s]+", value.strip()) if item]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline DocQuery Chat benchmark (fake models, local vector store).")
+    parser.add_argument("--documents", type=_int_list, default=[12, 48], help="corpus sizes in documents, comma separated")
+    parser.add_argument("--pages", type=int, default=5, help="pages per document")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--formats", type=lambda value: value.split(","), default=["pdf", "docx", "txt"])
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 4, 16], help="concurrent query_rag callers")
+    parser.add_argument("--queries", type=int, default=64, help="questions per concurrency level")
+    parser.add_argument("--workers", type=int, default=LOADER_WORKERS, help="document loader processes")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--embed-concurrency", type=int, default=EMBED_MAX_CONCURRENCY)
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per embedding request")
+    parser.add_argument("--embed-text-latency", type=float, default=0.0005, help="extra seconds per embedded text")
+    parser.add_argument("--rewrite-latency", type=float, default=0.3, help="seconds per query rewrite")
+    parser.add_argument("--llm-latency", type=float, default=0.4, help="seconds to the first answer token")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="seconds between answer tokens")
+    parser.add_argument("--hybrid", action="store_true", help="also search the BM25 keyword index")
+    parser.add_argument("--query-batch-window", type=float, default=QUERY_BATCH_WINDOW_MS,
+                        help="milliseconds to collect concurrent queries into one embedding/search batch")
+    parser.add_argument("--query-batch-size", type=int, default=QUERY_BATCH_MAX_SIZE,
+                        help="largest query micro-batch (1 disables batching)")
+    parser.add_argument("--compression-report", action="store_true",
+                        help="compare vector quantization modes and reduced dimensions on each corpus")
+    parser.add_argument("--compression-dimensions", type=_int_list, default=[256],
+                        help="reduced embedding sizes to include in the compression report")
+    parser.add_argument("--compression-vectors", type=int, default=20_000,
+                        help="pad each corpus's chunks with synthetic paragraphs to this many vectors in the compression report")
+    parser.add_argument("--rescore-factor", type=int, default=max(2, VECTOR_RESCORE_FACTOR),
+                        help="candidates rescored per result in the compression report")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The loaders print progress (also from worker processes); keep stdout for the JSON report
+    sys.stdout.flush()
+    report_stream = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+    embeddings = FakeEmbeddings(latency=args.embed_latency, per_text_latency=args.embed_text_latency)
+    llm = FakeLLM(latency=args.llm_latency, token_latency=args.llm_token_latency)
+    rewriter = FakeQueryRewriter(latency=args.rewrite_latency)
+    # The pipeline takes its models from the shared registry; swap in the fakes
+    registry.register("embeddings", lambda: embeddings)
+    registry.register("llm", lambda: llm)
+    registry.register("query_agent", lambda: rewriter)
+    registry.register("query_batcher", lambda: QueryBatcher(window=args.query_batch_window / 1000,
+                                                           max_batch_size=args.query_batch_size))
+    prompt_template = initialize_prompt()
+
+    started = time.perf_counter()
+    try:
+        results = [benchmark_corpus(args, documents, embeddings, llm, prompt_template) for documents in args.documents]
+    finally:
+        shutil.rmtree(_work_dir, ignore_errors=True)
+    report = {
+        "benchmark": "docquery-chat",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": results,
+        "total_seconds": round(time.perf_counter() - started, 2),
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        report_stream.write(text + "\n")
+    report_stream.close()
+    return report
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
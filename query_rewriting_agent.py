@@ -1,9 +1,23 @@
 import uuid
 import os
+import re
+import time
+import queue
 import logging
-from langsmith import Client
+import threading
+from collections import OrderedDict
+import numpy as np
 from agno.agent import Agent
 from agno.models.google import Gemini
+from rag_pipeline.config import (
+    REWRITE_CACHE_SIZE,
+    REWRITE_CACHE_TTL_SECONDS,
+    REWRITE_CACHE_SEMANTIC,
+    REWRITE_CACHE_SIMILARITY,
+    REWRITE_CONCURRENCY,
+)
+from rag_pipeline.resources import get_feedback_queue
+from rag_pipeline.metrics import metrics
 
 # Configure logging
 logging.basicConfig(
@@ -13,43 +27,133 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def normalize_query(query):
+    """Case-, whitespace- and trailing-punctuation-insensitive cache key."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?!. ").lower()
+
+class RewriteCache:
+    """LRU cache of query rewrites with a TTL.
+
+    Lookups match on the normalized query text first. When ``embeddings`` is
+    set, a miss falls back to the most similar cached query whose cosine
+    similarity is at least ``similarity_threshold``, so near-identical
+    questions reuse an earlier rewrite.
+    """
+
+    def __init__(self, max_size=1024, ttl_seconds=3600, embeddings=None, similarity_threshold=0.95):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query):
+        key = normalize_query(query)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["rewrite"]
+            if self.embeddings is None or not self._entries:
+                self.misses += 1
+                return None
+        vector = self._embed(query)
+        with self._lock:
+            best_key, best_score = None, -1.0
+            for cached_key, entry in self._entries.items():
+                if entry["vector"] is not None:
+                    score = float(np.dot(vector, entry["vector"]))
+                    if score > best_score:
+                        best_key, best_score = cached_key, score
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                self.semantic_hits += 1
+                return self._entries[best_key]["rewrite"]
+            self.misses += 1
+            return None
+
+    def put(self, query, rewrite):
+        vector = self._embed(query) if self.embeddings is not None else None
+        with self._lock:
+            key = normalize_query(query)
+            self._entries[key] = {"rewrite": rewrite, "vector": vector, "expires": time.monotonic() + self.ttl_seconds}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        return {"hits": self.hits, "semantic_hits": self.semantic_hits, "misses": self.misses, "size": len(self._entries)}
+
+    def _embed(self, query):
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if entry["expires"] <= now]
+        for key in expired:
+            del self._entries[key]
+
+REWRITE_INSTRUCTIONS = [
+    "You are an expert query rewriter. Your task is to rewrite the user query to make it more precise, clear, and optimized for retrieving relevant information from a document database.",
+    "Always produce a rewritten query that differs from the input while preserving its core intent. Output only the rewritten query, with no additional text, explanations, or markdown formatting.",
+    "For example, if the user query is 'What’s new in HTML5?', rewrite it as 'HTML5 new features and specifications'.",
+    "For example, if the user query is 'what is the basics of engineering economics?', rewrite it as 'Fundamental principles of engineering economics'.",
+    "For example, if the user query is 'How do you make a form?', rewrite it as 'Steps to create an HTML form'.",
+    "For example, if the user query is 'Tell me about machine learning', rewrite it as 'Overview of machine learning concepts and techniques'.",
+    "For example, if the user query is 'What is blockchain?', rewrite it as 'Fundamentals and applications of blockchain technology'.",
+    "For example, if the user query is 'How to code a website?', rewrite it as 'Steps to develop a website using HTML and CSS'.",
+    "For example, if the user query is 'What is the latest version of Python?', rewrite it as 'Current version of Python'."
+]
+
 class QueryRewritingAgent:
-    def __init__(self):
+    def __init__(self, cache=None, pool_size=REWRITE_CONCURRENCY):
         """Initialize the Query Rewriting Agent with an Agno Agent using Gemini 1.5 Flash."""
         google_api_key = os.getenv("GOOGLE_API_KEY")
         if not google_api_key:
             logger.error("GOOGLE_API_KEY environment variable is not set.")
             raise ValueError("GOOGLE_API_KEY environment variable is not set.")
         
-        self.agno_agent = Agent(
-            model=Gemini(id="gemini-1.5-flash"),
-            instructions=[
-                "You are an expert query rewriter. Your task is to rewrite the user query to make it more precise, clear, and optimized for retrieving relevant information from a document database.",
-                "Always produce a rewritten query that differs from the input while preserving its core intent. Output only the rewritten query, with no additional text, explanations, or markdown formatting.",
-                "For example, if the user query is 'What’s new in HTML5?', rewrite it as 'HTML5 new features and specifications'.",
-                "For example, if the user query is 'what is the basics of engineering economics?', rewrite it as 'Fundamental principles of engineering economics'.",
-                "For example, if the user query is 'How do you make a form?', rewrite it as 'Steps to create an HTML form'.",
-                "For example, if the user query is 'Tell me about machine learning', rewrite it as 'Overview of machine learning concepts and techniques'.",
-                "For example, if the user query is 'What is blockchain?', rewrite it as 'Fundamentals and applications of blockchain technology'.",
-                "For example, if the user query is 'How to code a website?', rewrite it as 'Steps to develop a website using HTML and CSS'.",
-                "For example, if the user query is 'What is the latest version of Python?', rewrite it as 'Current version of Python'."
-            ],
-            markdown=False,
-        )
-        logger.info("Initialized Agno Agent with Gemini 1.5 Flash model.")
+        # The Gemini model (and its HTTP client) is shared; each Agent keeps its own per-run state,
+        # so up to ``pool_size`` rewrites run at once, each on an Agent no other rewrite is using
+        self.model = Gemini(id="gemini-1.5-flash")
+        self.pool_size = pool_size
+        self._agents = queue.Queue()
+        self._agents_created = 0
+        self._agents_lock = threading.Lock()
+        logger.info("Initialized Agno rewrite agents with Gemini 1.5 Flash model.")
+        self.cache = cache
         
-        # Initialize LangSmith client only if API key is set
-        self.langsmith_client = Client() if os.getenv("LANGCHAIN_API_KEY") else None
-        if not self.langsmith_client:
+        # Log feedback to LangSmith only if API key is set
+        self.feedback_queue = get_feedback_queue() if os.getenv("LANGCHAIN_API_KEY") else None
+        if not self.feedback_queue:
             logger.warning("LANGCHAIN_API_KEY not set. LangSmith feedback logging will be disabled.")
 
-    def rewrite_query(self, query, run_id=None):
+    def rewrite_query(self, query, run_id=None, trace_id=None):
         """Rewrite the user query using the Agno Agent and log to LangSmith."""
         try:
+            if self.cache is not None:
+                cached = self.cache.get(query)
+                if cached is not None:
+                    logger.info(f"Rewrite cache hit for query: {query}")
+                    self._log_feedback(cached, run_id, trace_id, cached=True)
+                    return cached
+
             logger.info(f"Rewriting query: {query}")
             # Use agent.run() to get the rewritten query
             logger.debug("Using agent.run() to rewrite query...")
-            response = self.agno_agent.run(query)
+            agent = self._acquire_agent()
+            try:
+                response = agent.run(query)
+            finally:
+                self._agents.put(agent)
 
             # Extract the rewritten query from the response
             if hasattr(response, 'content') and response.content:
@@ -69,31 +173,70 @@ class QueryRewritingAgent:
                 raise ValueError(f"Unexpected response type: {type(response)}")
 
             # Finalize and return the response
-            return self._finalize_response(rewritten_query, query, run_id)
+            final_query = self._finalize_response(rewritten_query, query, run_id, trace_id)
+            if self.cache is not None:
+                self.cache.put(query, final_query)
+            return final_query
 
         except Exception as e:
             logger.error(f"Error rewriting query with Agno: {e}")
+            metrics.inc("rag_stage_errors_total", stage="rewrite_query")
             logger.error(f"Response details: {dir(response) if 'response' in locals() else 'No response'}")
             return query  # Fallback to original query if rewriting fails
 
-    def _finalize_response(self, rewritten_query, original_query, run_id):
+    def _acquire_agent(self):
+        """An idle Agent, creating one while fewer than ``pool_size`` exist; otherwise waits for one."""
+        try:
+            return self._agents.get_nowait()
+        except queue.Empty:
+            pass
+        with self._agents_lock:
+            create = self._agents_created < self.pool_size
+            if create:
+                self._agents_created += 1
+        if create:
+            return Agent(model=self.model, instructions=REWRITE_INSTRUCTIONS, markdown=False)
+        return self._agents.get()
+
+    def _finalize_response(self, rewritten_query, original_query, run_id, trace_id=None):
         if not rewritten_query or rewritten_query.lower() == original_query.lower():
             logger.warning(f"Rewritten query is empty or unchanged: '{rewritten_query}'")
             return original_query
         
         logger.info(f"Final rewritten query: {rewritten_query}")
-        
-        # Log to LangSmith if client is initialized and run_id is provided
-        if self.langsmith_client and run_id:
-            try:
-                self.langsmith_client.create_feedback(
-                    run_id=run_id,
-                    key="query-rewrite",
-                    score=1,
-                    comment=f"Rewritten query: {rewritten_query}"
-                )
-                logger.info("Logged feedback to LangSmith")
-            except Exception as e:
-                logger.error(f"Error logging feedback to LangSmith: {e}")
-        
-        return rewritten_query
\ No newline at end of file
+        self._log_feedback(rewritten_query, run_id, trace_id)
+        return rewritten_query
+
+    def _log_feedback(self, rewritten_query, run_id, trace_id=None, cached=False):
+        # Queued for LangSmith in the background if feedback is enabled and run_id is provided
+        if self.feedback_queue and run_id:
+            self.feedback_queue.submit(
+                run_id,
+                key="query-rewrite",
+                score=1,
+                comment=f"Rewritten query{' (cached)' if cached else ''}: {rewritten_query}",
+                trace_id=trace_id
+            )
+
+_shared_agent = None
+_shared_agent_lock = threading.Lock()
+
+def get_query_rewriting_agent(embeddings=None):
+    """Return the process-wide QueryRewritingAgent, creating it on first use.
+
+    ``embeddings`` enables the similarity lookup of the rewrite cache when
+    REWRITE_CACHE_SEMANTIC is set; the first embeddings passed are kept.
+    """
+    global _shared_agent
+    with _shared_agent_lock:
+        if _shared_agent is None:
+            cache = RewriteCache(
+                max_size=REWRITE_CACHE_SIZE,
+                ttl_seconds=REWRITE_CACHE_TTL_SECONDS,
+                similarity_threshold=REWRITE_CACHE_SIMILARITY
+            )
+            _shared_agent = QueryRewritingAgent(cache=cache)
+        cache = _shared_agent.cache
+        if REWRITE_CACHE_SEMANTIC and embeddings is not None and cache is not None and cache.embeddings is None:
+            cache.embeddings = embeddings
+        return _shared_agent
\ No newline at end of file
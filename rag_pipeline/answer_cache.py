@@ -0,0 +1,156 @@
+import os
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+from rag_pipeline.config import CORPUS_VERSION_DIR
+from rag_pipeline.shared_files import file_version
+
+logger = logging.getLogger(__name__)
+
+
+class SemanticAnswerCache:
+    """Caches answers by question embedding for one collection.
+
+    An entry is (query vector, corpus version, answer, sources). A lookup hits
+    when a cached question from the current corpus version has cosine
+    similarity >= ``threshold`` with the new one. ``invalidate`` bumps the
+    corpus version, so answers computed against older documents are never
+    served.
+
+    With a ``version_path``, ``refresh`` also invalidates the cache when that
+    marker file was replaced, which ``notify_corpus_changed`` does in whichever
+    process changed the corpus.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=512, version_path=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.version_path = version_path
+        self._seen_version = file_version(version_path) if version_path else None
+        self.corpus_version = 0
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._keys = []
+        self._next_key = 0
+        self._lock = threading.Lock()
+
+    def lookup(self, vector):
+        """Return the best matching entry dict for ``vector``, or None."""
+        query = _unit(vector)
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._keys = list(self._entries)
+                self._matrix = np.vstack([self._entries[key]["vector"] for key in self._keys])
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            key = self._keys[best]
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.seconds_saved += entry["seconds"]
+            return dict(entry, similarity=float(scores[best]))
+
+    def store(self, vector, answer, sources, rewritten_query, seconds, corpus_version):
+        """Cache an answer computed in ``seconds`` against ``corpus_version``."""
+        with self._lock:
+            if corpus_version != self.corpus_version:
+                # The corpus changed while this answer was being generated
+                return
+            self._entries[self._next_key] = {
+                "vector": _unit(vector),
+                "answer": answer,
+                "sources": sources,
+                "rewritten_query": rewritten_query,
+                "seconds": seconds,
+                "corpus_version": corpus_version,
+            }
+            self._next_key += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def refresh(self):
+        """Invalidate the cache if another process changed the corpus since the last check."""
+        if self.version_path is None:
+            return
+        version = file_version(self.version_path)
+        with self._lock:
+            if version == self._seen_version:
+                return
+            self._seen_version = version
+        self.invalidate()
+
+    def invalidate(self):
+        with self._lock:
+            self.corpus_version += 1
+            self._entries.clear()
+            self._matrix = None
+        logger.info(f"Answer cache invalidated; corpus version is now {self.corpus_version}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "seconds_saved": self.seconds_saved,
+            "entries": len(self._entries),
+            "corpus_version": self.corpus_version,
+        }
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def _version_path(collection_name):
+    return os.path.join(CORPUS_VERSION_DIR, collection_name)
+
+
+def get_answer_cache(collection_name, threshold=0.95, max_entries=512):
+    """Return the process-wide answer cache for a collection."""
+    with _caches_lock:
+        cache = _caches.get(collection_name)
+        if cache is None:
+            cache = SemanticAnswerCache(threshold=threshold, max_entries=max_entries,
+                                        version_path=_version_path(collection_name))
+            _caches[collection_name] = cache
+        return cache
+
+
+def notify_corpus_changed(collection_name):
+    """Invalidate cached answers for a collection whose documents changed, in every process."""
+    path = _version_path(collection_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(uuid.uuid4().hex)
+    # Replacing the file gives it a new version that other processes' caches notice on their next lookup
+    os.replace(tmp_path, path)
+    with _caches_lock:
+        cache = _caches.get(collection_name)
+    if cache is not None:
+        cache.refresh()
+
+
+def drop_answer_cache(collection_name):
+    """Discard a collection's cached answers and their memory."""
+    with _caches_lock:
+        _caches.pop(collection_name, None)
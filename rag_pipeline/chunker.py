@@ -0,0 +1,169 @@
+import re
+from langchain_core.documents import Document
+from rag_pipeline.tokens import estimate_tokens
+
+# "Section 4.2 ...", "4.2 Payment Terms", "# Title" and ALL-CAPS lines start a new section
+SECTION_HEADING_PATTERN = re.compile(r"^section\s+(\d+(?:\.\d+)*)\b", re.IGNORECASE)
+NUMBERED_HEADING_PATTERN = re.compile(r"^(\d+(?:\.\d+)+)\.?\s+[A-Z]")
+CAPS_HEADING_PATTERN = re.compile(r"^[A-Z][A-Z0-9\s\-&,:/()]{4,}$")
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?;:])\s+")
+MAX_HEADING_LENGTH = 100
+
+
+def parse_heading(line):
+    """Return (section, heading) if ``line`` looks like a heading, else None.
+
+    ``section`` is normalised to "Section N.N" (None for unnumbered headings).
+    """
+    line = line.strip()
+    if not line or len(line) > MAX_HEADING_LENGTH:
+        return None
+    match = SECTION_HEADING_PATTERN.match(line)
+    if match:
+        return f"Section {match.group(1)}", line
+    match = NUMBERED_HEADING_PATTERN.match(line)
+    if match and not line.endswith("."):
+        return f"Section {match.group(1)}", line
+    if line.startswith("#"):
+        return None, line.lstrip("#").strip()
+    if CAPS_HEADING_PATTERN.match(line) and any(c.isalpha() for c in line):
+        return None, line
+    return None
+
+
+def _blocks(text):
+    """Split page text into ("heading", line) and ("paragraph", text) blocks."""
+    paragraph = []
+    for line in text.splitlines():
+        heading = parse_heading(line)
+        if heading is None and line.strip():
+            paragraph.append(line.strip())
+            continue
+        if paragraph:
+            yield "paragraph", " ".join(paragraph)
+            paragraph = []
+        if heading is not None:
+            yield "heading", line.strip()
+    if paragraph:
+        yield "paragraph", " ".join(paragraph)
+
+
+def _pieces(paragraph, max_tokens):
+    """A paragraph as sentence groups of at most ``max_tokens`` (long sentences are cut by words)."""
+    if estimate_tokens(paragraph) <= max_tokens:
+        return [paragraph]
+    pieces = []
+    for sentence in SENTENCE_END_PATTERN.split(paragraph):
+        if estimate_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        words, current = sentence.split(), []
+        for word in words:
+            if current and estimate_tokens(" ".join(current + [word])) > max_tokens:
+                pieces.append(" ".join(current))
+                current = []
+            current.append(word)
+        if current:
+            pieces.append(" ".join(current))
+    return pieces
+
+
+class StructureAwareChunker:
+    """Splits page-level Documents on headings, sections and paragraphs.
+
+    Chunks never span a heading or a page, so each carries the exact
+    ``page_number``, ``section`` and ``heading`` it came from; the current
+    section carries over to the next page of the same source. Headings with
+    no text after them on their page are carried into the next chunk of the
+    same source instead of becoming chunks of their own; those at the end of
+    a source become a chunk once the next source starts, or on ``finish``
+    after the last one. Paragraphs are
+    packed up to ``max_tokens`` (estimated). Overlap is only added when a
+    section has to be cut mid-way: the trailing sentences of the previous
+    chunk, up to ``overlap_ratio`` of its size and at most ``overlap_tokens``.
+    """
+
+    def __init__(self, max_tokens=300, overlap_tokens=24, overlap_ratio=0.1):
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.overlap_ratio = overlap_ratio
+        self._source = None
+        self._section = None
+        self._heading = None
+        self._pending_headings = []
+        self._pending_metadata = None
+
+    def split_document(self, document):
+        metadata = dict(document.metadata)
+        chunks = []
+        if metadata.get("source") != self._source:
+            # The previous source's trailing headings are kept as a chunk of that source
+            chunks.extend(self.finish())
+            self._source = metadata.get("source")
+            self._section = None
+            self._heading = None
+
+        parts, has_body = self._pending_headings, False
+        tokens = sum(estimate_tokens(part) for part in parts)
+        self._pending_headings = []
+        section, heading = self._section, self._heading
+
+        def flush():
+            chunk_metadata = dict(metadata, section=section, heading=heading)
+            chunks.append(Document(page_content="\n".join(parts), metadata=chunk_metadata))
+
+        for kind, text in _blocks(document.page_content):
+            if kind == "heading":
+                if has_body:
+                    flush()
+                    parts, tokens, has_body = [], 0, False
+                new_section, new_heading = parse_heading(text)
+                self._section = new_section or self._section
+                self._heading = new_heading
+                if not has_body:
+                    section, heading = self._section, self._heading
+                # Headings stay attached to the text that follows them
+                parts.append(text)
+                tokens += estimate_tokens(text)
+                continue
+            for index, piece in enumerate(_pieces(text, self.max_tokens)):
+                piece_tokens = estimate_tokens(piece)
+                if has_body and tokens + piece_tokens > self.max_tokens:
+                    flush()
+                    parts = self._overlap(parts, tokens)
+                    tokens = sum(estimate_tokens(part) for part in parts)
+                    has_body = False
+                    section, heading = self._section, self._heading
+                if index and parts:
+                    # Later pieces of the same paragraph continue its line
+                    parts[-1] = f"{parts[-1]} {piece}"
+                else:
+                    parts.append(piece)
+                tokens += piece_tokens
+                has_body = True
+        if has_body:
+            flush()
+        elif parts:
+            self._pending_headings = parts
+            self._pending_metadata = dict(metadata, section=section, heading=heading)
+        return chunks
+
+    def finish(self):
+        """A chunk of the headings left without text at the end of the current source, if any."""
+        if not self._pending_headings:
+            return []
+        chunk = Document(page_content="\n".join(self._pending_headings), metadata=self._pending_metadata)
+        self._pending_headings, self._pending_metadata = [], None
+        return [chunk]
+
+    def _overlap(self, parts, tokens):
+        budget = min(self.overlap_tokens, int(tokens * self.overlap_ratio))
+        if budget <= 0:
+            return []
+        sentences = SENTENCE_END_PATTERN.split(parts[-1])
+        tail = []
+        for sentence in reversed(sentences):
+            if estimate_tokens(" ".join([sentence] + tail)) > budget:
+                break
+            tail.insert(0, sentence)
+        return [" ".join(tail)] if tail else []
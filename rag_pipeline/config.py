@@ -0,0 +1,158 @@
+import os
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value not in (None, "") else default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# Embedding model shared by ingestion and querying
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+
+# Disk-backed embedding cache (content-addressed by model + text)
+EMBEDDING_CACHE_ENABLED = _env_bool("EMBEDDING_CACHE_ENABLED", True)
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3")
+EMBEDDING_CACHE_MAX_ENTRIES = _env_int("EMBEDDING_CACHE_MAX_ENTRIES", 200_000)
+
+# Vector store backend: "weaviate" (Weaviate Cloud) or "local" (in-process NumPy index)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "weaviate").lower()
+LOCAL_VECTOR_STORE_DIR = os.getenv("LOCAL_VECTOR_STORE_DIR", "cache/vector_store")
+
+# Per-file fingerprints and chunk IDs of everything stored, for incremental ingestion.
+# The local backend keeps its manifest next to its vectors so both are wiped together.
+INGEST_MANIFEST_PATH = os.getenv(
+    "INGEST_MANIFEST_PATH",
+    os.path.join(LOCAL_VECTOR_STORE_DIR, "ingest_manifest.json") if VECTOR_BACKEND == "local"
+    else "cache/ingest_manifest.json"
+)
+
+# Number of chunks embedded and written to the vector store per batch
+INGEST_BATCH_SIZE = _env_int("INGEST_BATCH_SIZE", 64)
+
+# Worker processes used to parse uploaded files (1 parses in-process)
+LOADER_WORKERS = _env_int("LOADER_WORKERS", min(4, os.cpu_count() or 1))
+
+# Maximum embedding requests in flight during ingestion (reduced automatically on 429s)
+EMBED_MAX_CONCURRENCY = _env_int("EMBED_MAX_CONCURRENCY", 4)
+
+# Local backend search: "exact" brute-force search or "ivf" approximate search
+LOCAL_INDEX_TYPE = os.getenv("LOCAL_INDEX_TYPE", "exact").lower()
+LOCAL_IVF_LISTS = _env_int("LOCAL_IVF_LISTS", 0) or None
+LOCAL_IVF_PROBE = _env_int("LOCAL_IVF_PROBE", 8)
+
+# Compressed vectors: "sq" (8-bit scalar), "bq" (1-bit binary) or "pq" (product quantization,
+# PQ_SEGMENTS sub-vectors, 0 = one per 8 dimensions) in Weaviate and the local index; "none" keeps
+# float32. Searches fetch VECTOR_RESCORE_FACTOR x k candidates and re-rank them by full-precision
+# similarity (1 disables rescoring).
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION", "none").lower()
+VECTOR_RESCORE_FACTOR = _env_int("VECTOR_RESCORE_FACTOR", 4)
+PQ_SEGMENTS = _env_int("PQ_SEGMENTS", 0) or None
+# Reduced embedding size (e.g. 256) requested from the embedding model; 0 keeps its default.
+# Changing it requires re-ingesting into a new collection.
+EMBEDDING_DIMENSIONS = _env_int("EMBEDDING_DIMENSIONS", 0) or None
+
+# Hybrid retrieval: BM25 keyword index fused with vector results (reciprocal-rank fusion)
+HYBRID_SEARCH_ENABLED = _env_bool("HYBRID_SEARCH_ENABLED", True)
+KEYWORD_INDEX_DIR = os.getenv("KEYWORD_INDEX_DIR", os.path.join(os.path.dirname(INGEST_MANIFEST_PATH), "keyword_index"))
+HYBRID_FETCH_K = _env_int("HYBRID_FETCH_K", 10)
+RRF_K = _env_int("RRF_K", 60)
+
+# Query rewrite cache: exact (normalized text) LRU with TTL, plus optional embedding-similarity lookup
+REWRITE_CACHE_SIZE = _env_int("REWRITE_CACHE_SIZE", 1024)
+REWRITE_CACHE_TTL_SECONDS = _env_int("REWRITE_CACHE_TTL_SECONDS", 3600)
+REWRITE_CACHE_SEMANTIC = _env_bool("REWRITE_CACHE_SEMANTIC", False)
+REWRITE_CACHE_SIMILARITY = float(os.getenv("REWRITE_CACHE_SIMILARITY", "0.95"))
+
+# Semantic answer cache: reuse answers to near-identical questions on an unchanged corpus
+ANSWER_CACHE_ENABLED = _env_bool("ANSWER_CACHE_ENABLED", True)
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+ANSWER_CACHE_MAX_ENTRIES = _env_int("ANSWER_CACHE_MAX_ENTRIES", 512)
+# Ingestion replaces a per-collection marker file here, so every process drops answers cached before the change
+CORPUS_VERSION_DIR = os.getenv("CORPUS_VERSION_DIR", os.path.join(os.path.dirname(INGEST_MANIFEST_PATH), "corpus_versions"))
+
+# Questions with at least this many words are searched without an LLM rewrite
+REWRITE_SKIP_MIN_WORDS = _env_int("REWRITE_SKIP_MIN_WORDS", 16)
+# Retrieval stops waiting for the query rewrite after this long and uses the original question
+REWRITE_TIMEOUT_SECONDS = float(os.getenv("REWRITE_TIMEOUT_SECONDS", "3"))
+# Threads running blocking query stages (search, compression) concurrently
+QUERY_WORKER_THREADS = _env_int("QUERY_WORKER_THREADS", 16)
+# Query rewrites run at once per process, each on its own agent and thread; more wait their turn
+# in their own queue, so rewrites that timed out never hold up searches
+REWRITE_CONCURRENCY = _env_int("REWRITE_CONCURRENCY", 4)
+
+# Query micro-batching: embeddings and vector searches of questions arriving within
+# QUERY_BATCH_WINDOW_MS of each other (at most QUERY_BATCH_MAX_SIZE) share one request; 1 disables it
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "5"))
+QUERY_BATCH_MAX_SIZE = _env_int("QUERY_BATCH_MAX_SIZE", 32)
+QUERY_BATCH_WORKERS = _env_int("QUERY_BATCH_WORKERS", 4)
+
+# HTTP connection pool of the shared Weaviate client, sized for concurrent sessions
+WEAVIATE_POOL_CONNECTIONS = _env_int("WEAVIATE_POOL_CONNECTIONS", 20)
+WEAVIATE_POOL_MAXSIZE = _env_int("WEAVIATE_POOL_MAXSIZE", 100)
+# Start creating shared clients in the background as soon as the app starts
+RESOURCE_WARM_UP = _env_bool("RESOURCE_WARM_UP", True)
+
+# LangSmith feedback is sent from a bounded background queue; overflow is dropped
+FEEDBACK_QUEUE_SIZE = _env_int("FEEDBACK_QUEUE_SIZE", 1000)
+FEEDBACK_BATCH_SIZE = _env_int("FEEDBACK_BATCH_SIZE", 50)
+FEEDBACK_FLUSH_SECONDS = float(os.getenv("FEEDBACK_FLUSH_SECONDS", "1"))
+# Requests are not traced while this many operations are waiting to be uploaded
+TRACE_BACKLOG_LIMIT = _env_int("TRACE_BACKLOG_LIMIT", 1000)
+
+# Port of the Prometheus text endpoint (/metrics); 0 disables it. The endpoint is unauthenticated,
+# so it only listens on localhost unless METRICS_HOST is set (e.g. 0.0.0.0 for every interface).
+METRICS_PORT = _env_int("METRICS_PORT", 9108)
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Chunking: "structure" splits on headings, sections and paragraphs within a token budget;
+# "recursive" is the fixed-size character splitter (1000 characters, 200 overlap)
+CHUNKER = os.getenv("CHUNKER", "structure").lower()
+CHUNK_MAX_TOKENS = _env_int("CHUNK_MAX_TOKENS", 300)
+# Overlap is only added inside a section that has to be cut, at most this many tokens
+CHUNK_OVERLAP_TOKENS = _env_int("CHUNK_OVERLAP_TOKENS", 24)
+
+# Near-duplicate chunks (MinHash/LSH Jaccard >= DEDUP_THRESHOLD) are stored once with all their sources
+DEDUP_ENABLED = _env_bool("DEDUP_ENABLED", True)
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", "0.85"))
+DEDUP_INDEX_DIR = os.getenv("DEDUP_INDEX_DIR", os.path.join(os.path.dirname(INGEST_MANIFEST_PATH), "dedup_index"))
+
+# Retrieval over-fetches candidates, re-ranks them with MMR (1 = relevance only, 0 = diversity only)
+# and packs as many as fit CONTEXT_TOKEN_BUDGET estimated tokens into the prompt
+RETRIEVAL_FETCH_K = _env_int("RETRIEVAL_FETCH_K", 20)
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+# Candidates less similar to the query than this fraction of the best candidate are left out
+CONTEXT_RELATIVE_RELEVANCE = float(os.getenv("CONTEXT_RELATIVE_RELEVANCE", "0.75"))
+CONTEXT_TOKEN_BUDGET = _env_int("CONTEXT_TOKEN_BUDGET", 1500)
+CONTEXT_MAX_CHUNKS = _env_int("CONTEXT_MAX_CHUNKS", 8)
+
+# Extractive compression: keep only the context sentences closest to the question, up to
+# CONTEXT_COMPRESSION_TOKENS estimated tokens (0 = CONTEXT_COMPRESSION_RATIO of the packed context)
+CONTEXT_COMPRESSION_ENABLED = _env_bool("CONTEXT_COMPRESSION_ENABLED", False)
+CONTEXT_COMPRESSION_RATIO = float(os.getenv("CONTEXT_COMPRESSION_RATIO", "0.5"))
+CONTEXT_COMPRESSION_TOKENS = _env_int("CONTEXT_COMPRESSION_TOKENS", 0)
+
+# Multi-tenancy: each user's documents go to their own Weaviate tenant (or local index) and
+# only that tenant is searched. Tenants unused for TENANT_IDLE_SECONDS are moved out of memory.
+MULTI_TENANCY_ENABLED = _env_bool("MULTI_TENANCY_ENABLED", True)
+TENANT_IDLE_SECONDS = _env_int("TENANT_IDLE_SECONDS", 1800)
+
+# Background ingestion: at most INGEST_JOB_WORKERS jobs run at once across all users and all processes
+# sharing INGEST_JOB_DIR (server workers and the Streamlit app). Uploads and
+# checkpoints of unfinished jobs are kept under INGEST_JOB_DIR so they resume after a restart.
+# With INGEST_JOBS_RESUMABLE=false uploads are parsed from memory instead, without being written
+# to disk and read back, and a job interrupted by a restart fails and must be uploaded again.
+INGEST_JOB_WORKERS = _env_int("INGEST_JOB_WORKERS", 2)
+INGEST_JOB_DIR = os.getenv("INGEST_JOB_DIR", "cache/ingest_jobs")
+INGEST_JOBS_RESUMABLE = _env_bool("INGEST_JOBS_RESUMABLE", True)
+
+# HTTP API (api.py), per worker process: queries answered at once, and how long a query may
+# take, waiting for a slot included, before it fails with 503 (no slot) or 504 (too slow)
+API_MAX_CONCURRENT_QUERIES = _env_int("API_MAX_CONCURRENT_QUERIES", 32)
+API_QUERY_TIMEOUT_SECONDS = float(os.getenv("API_QUERY_TIMEOUT_SECONDS", "60"))
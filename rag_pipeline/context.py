@@ -0,0 +1,131 @@
+import re
+import numpy as np
+from langchain_core.documents import Document
+from rag_pipeline.tokens import estimate_tokens
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+|\n+")
+# Written between kept sentences that were not adjacent in the chunk
+GAP_MARKER = " ... "
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def mmr_rerank(query_vector, vectors, k, lambda_mult=0.7, relative_relevance=0.0):
+    """Indices of up to ``k`` candidates in Maximal Marginal Relevance order.
+
+    Each step picks the candidate maximising ``lambda_mult * sim(query, d)
+    - (1 - lambda_mult) * max sim(d, selected)``. All pairwise similarities
+    come from one matrix product and the running maximum is updated with one
+    vector operation per pick, so re-ranking n candidates costs O(n^2 d) once
+    plus O(k n). Candidates less similar to the query than
+    ``relative_relevance`` times the best one are dropped, so fewer chunks are
+    returned when only a few are relevant.
+    """
+    if len(vectors) == 0 or k <= 0:
+        return []
+    vectors = _normalize(vectors)
+    relevance = vectors @ _normalize(query_vector)
+    similarity = vectors @ vectors.T
+    redundancy = np.zeros(len(vectors), dtype=np.float32)
+    best_relevance = relevance.max()
+    available = relevance >= min(best_relevance, relative_relevance * best_relevance)
+    selected = []
+    for _ in range(min(k, int(available.sum()))):
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, similarity[best]) if len(selected) > 1 else similarity[best].copy()
+    return selected
+
+
+def source_label(doc):
+    """Label such as "[report.pdf, page 3, Section 4.2]" put in front of a chunk in the prompt."""
+    parts = [str(doc.metadata.get("source") or "unknown source")]
+    if doc.metadata.get("page_number") is not None:
+        parts.append(f"page {doc.metadata['page_number']}")
+    if doc.metadata.get("section"):
+        parts.append(str(doc.metadata["section"]))
+    return f"[{', '.join(parts)}]"
+
+
+def pack_context(documents, token_budget, max_chunks=None):
+    """Fit ranked chunks into ``token_budget`` estimated tokens; returns (context, packed).
+
+    Chunks are taken in rank order, skipping any that no longer fit (the
+    first is always kept), then written grouped by source and page, each
+    under its source label.
+    """
+    packed, used = [], 0
+    for doc in documents:
+        if max_chunks and len(packed) >= max_chunks:
+            break
+        tokens = estimate_tokens(source_label(doc)) + estimate_tokens(doc.page_content)
+        if packed and used + tokens > token_budget:
+            continue
+        packed.append(doc)
+        used += tokens
+    return format_context(packed), packed
+
+
+def format_context(documents):
+    """Chunks grouped by source and page (rank order within a page), each under its source label."""
+    ordered = sorted(
+        documents,
+        key=lambda doc: (str(doc.metadata.get("source") or ""), doc.metadata.get("page_number") or 0)
+    )
+    return "\n\n".join(f"{source_label(doc)}\n{doc.page_content}" for doc in ordered)
+
+
+def split_sentences(text):
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def compress_documents(query_vector, documents, embeddings, ratio=0.5, token_target=None):
+    """Keep only the sentences of ``documents`` closest to the query.
+
+    All sentences are embedded in one ``embed_documents`` call and scored
+    against ``query_vector`` with one matrix-vector product. The best ones
+    are kept until ``token_target`` estimated tokens (or ``ratio`` of the
+    original) are used, and each chunk is rebuilt from its kept sentences in
+    their original order. Chunks left without sentences are dropped; the
+    rest keep their metadata, so they are still labeled and cited.
+    """
+    spans = [(index, position, sentence)
+             for index, doc in enumerate(documents)
+             for position, sentence in enumerate(split_sentences(doc.page_content))]
+    original_tokens = sum(estimate_tokens(sentence) for _, _, sentence in spans)
+    target = token_target or max(1, int(original_tokens * ratio))
+    if original_tokens <= target:
+        return list(documents)
+    vectors = embeddings.embed_documents([sentence for _, _, sentence in spans])
+    scores = _normalize(vectors) @ _normalize(query_vector)
+    kept, used = set(), 0
+    for span in np.argsort(-scores, kind="stable"):
+        tokens = estimate_tokens(spans[span][2])
+        if kept and used + tokens > target:
+            continue
+        kept.add(int(span))
+        used += tokens
+    by_document = {}
+    for span in sorted(kept):
+        index, position, sentence = spans[span]
+        by_document.setdefault(index, []).append((position, sentence))
+    compressed = []
+    for index, doc in enumerate(documents):
+        if index not in by_document:
+            continue
+        text, previous = "", None
+        for position, sentence in by_document[index]:
+            if previous is not None:
+                text += " " if position == previous + 1 else GAP_MARKER
+            text += sentence
+            previous = position
+        compressed.append(Document(id=doc.id, page_content=text, metadata=doc.metadata))
+    return compressed
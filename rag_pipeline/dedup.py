@@ -0,0 +1,274 @@
+import os
+import re
+import json
+import zlib
+import hashlib
+import logging
+import threading
+import numpy as np
+from rag_pipeline.shared_files import file_lock, file_version
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime for the universal hash family (a * x + b) mod p
+_PRIME = (1 << 31) - 1
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def _normalize(text):
+    return " ".join(_WORD_PATTERN.findall(text.lower()))
+
+
+def chunk_reference(chunk):
+    """Where a chunk came from: file, page and section (the keys answers cite)."""
+    return {key: chunk.metadata.get(key) for key in ("source", "page_number", "section")
+            if chunk.metadata.get(key) is not None}
+
+
+class ChunkDeduplicator:
+    """Finds exact and near-duplicate chunks with MinHash signatures and LSH banding.
+
+    Exact duplicates (same words, ignoring case and punctuation) are found by
+    digest. Near duplicates are found by splitting each ``num_perm`` MinHash
+    signature into ``bands`` bands: chunks sharing any band bucket are
+    candidates, and a candidate whose estimated Jaccard similarity of word
+    ``shingle_size``-grams is >= ``threshold`` is a duplicate. Lookups cost
+    one signature plus a few bucket probes, so a run is roughly linear in the
+    number of chunks.
+
+    For every stored (representative) chunk the index keeps the references of
+    all chunks collapsed into it. With a ``path`` the signatures are saved as
+    a .npy file next to a JSON file of IDs, digests and references. Like
+    BM25Index, it is only changed by the tenant's ingestion job and reloads
+    itself (``refresh``) when another process saved it.
+    """
+
+    def __init__(self, path=None, threshold=0.85, num_perm=128, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError(f"num_perm ({num_perm}) must be a multiple of bands ({bands})")
+        self.path = path
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+        self._lock = threading.RLock()
+        self._clear()
+        self.checked = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+        self._version = None
+        self._dirty = False
+        if path:
+            self.refresh()
+
+    def _clear(self):
+        self._ids = []
+        self._digests = []
+        self._references = []
+        self._signatures = []
+        self._rows = {}
+        self._by_digest = {}
+        self._buckets = [{} for _ in range(self.bands)]
+
+    @property
+    def _records_path(self):
+        return os.path.join(self.path, "records.json")
+
+    @property
+    def _signatures_path(self):
+        return os.path.join(self.path, "signatures.npy")
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._rows
+
+    def signature(self, text):
+        words = _WORD_PATTERN.findall(text.lower()) or [""]
+        size = min(self.shingle_size, len(words))
+        shingles = {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+    def find(self, text, signature=None):
+        """ID of a stored chunk that duplicates ``text``, or None."""
+        with self._lock:
+            self.checked += 1
+            row = self._by_digest.get(self._digest(text))
+            if row is not None:
+                self.exact_duplicates += 1
+                return self._ids[row]
+            signature = self.signature(text) if signature is None else signature
+            candidates = set()
+            for band, key in enumerate(self._band_keys(signature)):
+                candidates.update(self._buckets[band].get(key, ()))
+            best_row, best_similarity = None, self.threshold
+            for row in candidates:
+                if self._ids[row] is None:
+                    continue
+                similarity = float(np.mean(self._signatures[row] == signature))
+                if similarity >= best_similarity:
+                    best_row, best_similarity = row, similarity
+            if best_row is None:
+                return None
+            self.near_duplicates += 1
+            return self._ids[best_row]
+
+    def add(self, chunk_id, text, reference, signature=None):
+        """Register a stored chunk, with the reference of its own source."""
+        with self._lock:
+            if chunk_id in self._rows:
+                return
+            row = len(self._ids)
+            signature = self.signature(text) if signature is None else signature
+            digest = self._digest(text)
+            self._ids.append(chunk_id)
+            self._digests.append(digest)
+            self._references.append([reference])
+            self._signatures.append(signature)
+            self._rows[chunk_id] = row
+            self._by_digest.setdefault(digest, row)
+            for band, key in enumerate(self._band_keys(signature)):
+                self._buckets[band].setdefault(key, []).append(row)
+            self._dirty = True
+
+    def add_reference(self, chunk_id, reference):
+        """Record that a chunk from ``reference`` was collapsed into ``chunk_id``."""
+        with self._lock:
+            references = self._references[self._rows[chunk_id]]
+            if reference not in references:
+                references.append(reference)
+                self._dirty = True
+
+    def references(self, chunk_id):
+        with self._lock:
+            row = self._rows.get(chunk_id)
+            return list(self._references[row]) if row is not None else []
+
+    def forget_source(self, source):
+        """Drop references from ``source`` before it is re-processed; returns the affected IDs."""
+        with self._lock:
+            changed = []
+            for chunk_id, row in self._rows.items():
+                references = self._references[row]
+                kept = [reference for reference in references if reference.get("source") != source]
+                if len(kept) != len(references):
+                    self._references[row] = kept
+                    changed.append(chunk_id)
+                    self._dirty = True
+            return changed
+
+    def remove(self, ids):
+        with self._lock:
+            for chunk_id in ids:
+                row = self._rows.pop(chunk_id, None)
+                if row is None:
+                    continue
+                self._ids[row] = None
+                if self._by_digest.get(self._digests[row]) == row:
+                    del self._by_digest[self._digests[row]]
+                self._dirty = True
+
+    def stats(self):
+        duplicates = self.exact_duplicates + self.near_duplicates
+        return {
+            "checked": self.checked,
+            "exact_duplicates": self.exact_duplicates,
+            "near_duplicates": self.near_duplicates,
+            "saved_embeddings": duplicates,
+            "saved_index_entries": duplicates,
+            "entries": len(self._rows),
+        }
+
+    def persist(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            alive = [row for row, chunk_id in enumerate(self._ids) if chunk_id is not None]
+            signatures = np.array([self._signatures[row] for row in alive], dtype=np.uint32).reshape(-1, self.num_perm)
+            with file_lock(self.path):
+                os.makedirs(self.path, exist_ok=True)
+                tmp_signatures = os.path.join(self.path, "signatures.tmp.npy")
+                np.save(tmp_signatures, signatures)
+                os.replace(tmp_signatures, self._signatures_path)
+                tmp_records = f"{self._records_path}.tmp"
+                with open(tmp_records, "w") as f:
+                    json.dump({
+                        "ids": [self._ids[row] for row in alive],
+                        "digests": [self._digests[row] for row in alive],
+                        "references": [self._references[row] for row in alive],
+                    }, f)
+                # Written last: its version stands for both files
+                os.replace(tmp_records, self._records_path)
+                self._version = file_version(self._records_path)
+            self._dirty = False
+
+    def refresh(self):
+        """Reload the index if another process saved it since it was loaded."""
+        if not self.path:
+            return
+        with self._lock:
+            if self._dirty or file_version(self._records_path) == self._version:
+                return
+            self._clear()
+            with file_lock(self.path, shared=True):
+                self._version = file_version(self._records_path)
+                if self._version is not None:
+                    self._load()
+
+    def _load(self):
+        try:
+            with open(self._records_path, "r") as f:
+                records = json.load(f)
+            signatures = np.load(self._signatures_path)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable deduplication index {self.path}: {e}")
+            return
+        for chunk_id, digest, references, signature in zip(
+                records["ids"], records["digests"], records["references"], signatures):
+            row = len(self._ids)
+            self._ids.append(chunk_id)
+            self._digests.append(digest)
+            self._references.append(references)
+            self._signatures.append(signature)
+            self._rows[chunk_id] = row
+            self._by_digest.setdefault(digest, row)
+            for band, key in enumerate(self._band_keys(signature)):
+                self._buckets[band].setdefault(key, []).append(row)
+        logger.info(f"Loaded deduplication index with {len(self._rows)} chunk(s) from {self.path}")
+
+    def _band_keys(self, signature):
+        return [signature[band * self.rows:(band + 1) * self.rows].tobytes() for band in range(self.bands)]
+
+    def _digest(self, text):
+        return hashlib.sha1(_normalize(text).encode("utf-8")).hexdigest()
+
+
+_open_indexes = {}
+_open_indexes_lock = threading.Lock()
+
+
+def get_deduplicator(path, threshold=0.85):
+    """Return the process-wide ChunkDeduplicator persisted at ``path``, loading it once."""
+    with _open_indexes_lock:
+        index = _open_indexes.get(path)
+        if index is None:
+            index = ChunkDeduplicator(path, threshold=threshold)
+            _open_indexes[path] = index
+        return index
+
+
+def release_deduplicator(path):
+    """Persist and close the index opened for ``path``; it is reloaded on next use."""
+    with _open_indexes_lock:
+        index = _open_indexes.pop(path, None)
+    if index is not None:
+        index.persist()
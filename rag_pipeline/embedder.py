@@ -1,12 +1,29 @@
 from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
+from rag_pipeline.config import (
+    EMBEDDING_MODEL,
+    EMBEDDING_CACHE_ENABLED,
+    EMBEDDING_CACHE_PATH,
+    EMBEDDING_CACHE_MAX_ENTRIES,
+    EMBEDDING_DIMENSIONS,
+)
+from rag_pipeline.embedding_cache import CachedEmbeddings
 import os
      
-def initialize_embeddings():
+def initialize_embeddings(use_cache=EMBEDDING_CACHE_ENABLED):
          try:
              embeddings = GoogleGenerativeAIEmbeddings(
-                 model="models/text-embedding-004",
+                 model=EMBEDDING_MODEL,
+                 output_dimensionality=EMBEDDING_DIMENSIONS,
                  google_api_key=os.getenv("GOOGLE_API_KEY")
              )
+             if use_cache:
+                 embeddings = CachedEmbeddings(
+                     embeddings,
+                     # Vectors of a different size are cached separately
+                     model_name=f"{EMBEDDING_MODEL}@{EMBEDDING_DIMENSIONS}" if EMBEDDING_DIMENSIONS else EMBEDDING_MODEL,
+                     path=EMBEDDING_CACHE_PATH,
+                     max_entries=EMBEDDING_CACHE_MAX_ENTRIES
+                 )
              return embeddings
          except Exception as e:
              print(f"Error initializing Gemini embeddings: {e}")
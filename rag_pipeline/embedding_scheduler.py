@@ -0,0 +1,141 @@
+import time
+import random
+import asyncio
+import logging
+from rag_pipeline.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_RATE_LIMIT_MARKERS = ("429", "resource_exhausted", "resource exhausted", "rate limit", "quota")
+
+
+def is_rate_limit_error(exc):
+    """True for 429 / quota errors from the Gemini API or the local fakes."""
+    for attr in ("status_code", "code"):
+        value = getattr(exc, attr, None)
+        value = value() if callable(value) else value
+        if value == 429:
+            return True
+    message = str(exc).lower()
+    return any(marker in message for marker in _RATE_LIMIT_MARKERS)
+
+
+class EmbeddingScheduler:
+    """Embeds batches concurrently and writes each one as soon as it is ready.
+
+    At most ``max_concurrency`` embedding requests are in flight. A 429 halves
+    the allowed concurrency and makes every worker wait out an exponential
+    backoff; each success lets concurrency grow back by one (AIMD), so the
+    scheduler settles just under the provider's quota instead of failing.
+    """
+
+    def __init__(self, embeddings, max_concurrency=4, max_retries=6, initial_backoff=1.0, max_backoff=60.0):
+        self.embeddings = embeddings
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.stats = {"batches": 0, "texts": 0, "rate_limited": 0, "retries": 0}
+
+    def run(self, batches, writer, on_written=None):
+        """Synchronous entry point; see ``arun``."""
+        return asyncio.run(self.arun(batches, writer, on_written))
+
+    async def arun(self, batches, writer, on_written=None):
+        """Embed every ``(documents, ids)`` batch and pass it to ``writer``.
+
+        ``writer(documents, vectors, ids)`` is called from a worker thread while
+        other batches are still being embedded; ``on_written(documents, ids)``
+        runs after each write. ``batches`` may be a blocking generator: it is
+        advanced off the event loop.
+        """
+        self._limit = self.max_concurrency
+        self._in_flight = 0
+        self._backoff = self.initial_backoff
+        self._resume_at = 0.0
+        self._limited_at = 0.0
+        self._slots = asyncio.Condition()
+
+        iterator = iter(batches)
+        tasks = set()
+        try:
+            while True:
+                batch = await asyncio.to_thread(next, iterator, None)
+                if batch is None:
+                    break
+                await self._acquire()
+                tasks.add(asyncio.create_task(self._process(batch, writer, on_written)))
+                done = {task for task in tasks if task.done()}
+                for task in done:
+                    task.result()
+                tasks -= done
+            if tasks:
+                await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        return dict(self.stats)
+
+    async def _acquire(self):
+        async with self._slots:
+            await self._slots.wait_for(lambda: self._in_flight < self._limit)
+            self._in_flight += 1
+
+    async def _release(self):
+        async with self._slots:
+            self._in_flight -= 1
+            self._slots.notify_all()
+
+    async def _process(self, batch, writer, on_written):
+        documents, ids = batch
+        try:
+            # Empty batches are still reported so callers see progress for skipped chunks
+            if documents:
+                vectors = await self._embed([doc.page_content for doc in documents])
+                await asyncio.to_thread(metrics.timed("write_batch")(writer), documents, vectors, ids)
+        finally:
+            await self._release()
+        self.stats["batches"] += 1
+        self.stats["texts"] += len(documents)
+        if on_written:
+            on_written(documents, ids)
+
+    async def _embed(self, texts):
+        attempt = 0
+        while True:
+            delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            started = time.monotonic()
+            try:
+                vectors = await asyncio.to_thread(metrics.timed("embed_batch")(self.embeddings.embed_documents), texts)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                self._on_rate_limited(started)
+                logger.warning(f"Embedding rate limited, retry {attempt}/{self.max_retries} "
+                               f"(concurrency {self._limit}): {e}")
+                continue
+            self._on_success()
+            return vectors
+
+    def _on_rate_limited(self, started):
+        self.stats["rate_limited"] += 1
+        self.stats["retries"] += 1
+        # Requests already in flight when the last 429 arrived belong to the same
+        # burst: they wait out the current backoff instead of escalating it again
+        if started < self._limited_at:
+            return
+        self._limited_at = time.monotonic()
+        self._limit = max(1, self._limit // 2)
+        wait = self._backoff * (1 + random.random() * 0.25)
+        self._resume_at = max(self._resume_at, self._limited_at + wait)
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def _on_success(self):
+        self._backoff = self.initial_backoff
+        if self._limit < self.max_concurrency:
+            self._limit += 1
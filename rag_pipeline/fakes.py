@@ -0,0 +1,127 @@
+"""Deterministic local stand-ins for the Gemini models, for offline runs."""
+import re
+import time
+import asyncio
+import hashlib
+import threading
+from collections import deque
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+
+class FakeRateLimitError(Exception):
+    """Mimics the 429 RESOURCE_EXHAUSTED error returned by the Gemini API."""
+
+    status_code = 429
+
+
+class FakeEmbeddings(Embeddings):
+    """Hash-based embeddings with simulated latency and an optional request quota.
+
+    Identical texts always get identical unit vectors. ``latency`` seconds are
+    slept per request plus ``per_text_latency`` per text; more than
+    ``requests_per_second`` calls within one second raise FakeRateLimitError.
+    """
+
+    def __init__(self, dimensions=768, latency=0.0, per_text_latency=0.0, requests_per_second=None):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.requests_per_second = requests_per_second
+        self.calls = 0
+        self.texts_embedded = 0
+        self.rate_limited = 0
+        self._lock = threading.Lock()
+        self._recent = deque()
+
+    def embed_documents(self, texts):
+        self._request(len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        self._request(1)
+        return self._vector(text)
+
+    def embed_queries(self, texts):
+        return self.embed_documents(texts)
+
+    def _request(self, count):
+        with self._lock:
+            now = time.monotonic()
+            if self.requests_per_second is not None:
+                while self._recent and now - self._recent[0] >= 1.0:
+                    self._recent.popleft()
+                if len(self._recent) >= self.requests_per_second:
+                    self.rate_limited += 1
+                    raise FakeRateLimitError("429 RESOURCE_EXHAUSTED: fake quota exceeded")
+                self._recent.append(now)
+            self.calls += 1
+            self.texts_embedded += count
+        delay = self.latency + self.per_text_latency * count
+        if delay:
+            time.sleep(delay)
+
+    def _vector(self, text):
+        # Feature hashing of lower-cased words: texts sharing words get similar vectors
+        values = [0.0] * self.dimensions
+        for word in re.findall(r"\w+", text.lower()) or [""]:
+            digest = hashlib.md5(word.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dimensions
+            values[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = sum(v * v for v in values) ** 0.5 or 1.0
+        return [v / norm for v in values]
+
+
+class FakeLLM:
+    """Chat model stand-in with ``invoke``, ``ainvoke`` and ``stream``.
+
+    The answer is ``answer_words`` words picked deterministically from the
+    prompt. ``latency`` seconds pass before the first token and
+    ``token_latency`` seconds between tokens.
+    """
+
+    def __init__(self, latency=0.0, token_latency=0.0, answer_words=60):
+        self.latency = latency
+        self.token_latency = token_latency
+        self.answer_words = answer_words
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt):
+        return AIMessage(content="".join(self._tokens(self._text(prompt))))
+
+    async def ainvoke(self, prompt):
+        return await asyncio.to_thread(self.invoke, prompt)
+
+    def stream(self, prompt):
+        for token in self._tokens(self._text(prompt)):
+            yield AIMessageChunk(content=token)
+
+    def _text(self, prompt):
+        return prompt.to_string() if hasattr(prompt, "to_string") else str(prompt)
+
+    def _tokens(self, prompt):
+        with self._lock:
+            self.calls += 1
+        words = re.findall(r"\w+", prompt) or ["answer"]
+        seed = int.from_bytes(hashlib.md5(prompt.encode("utf-8")).digest()[:4], "little")
+        if self.latency:
+            time.sleep(self.latency)
+        for position in range(self.answer_words):
+            if position and self.token_latency:
+                time.sleep(self.token_latency)
+            yield words[(seed + position * 7919) % len(words)] + " "
+
+
+class FakeQueryRewriter:
+    """Stand-in for QueryRewritingAgent that appends a fixed phrase after ``latency`` seconds."""
+
+    def __init__(self, latency=0.0, suffix="key facts and details"):
+        self.latency = latency
+        self.suffix = suffix
+        self.cache = None
+
+    def rewrite_query(self, query, run_id=None, trace_id=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return f"{query.rstrip('?. ')} {self.suffix}"
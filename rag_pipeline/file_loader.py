@@ -1,74 +1,240 @@
+import io
 import os
 import re
-from langchain_community.document_loaders import PyPDFLoader, Docx2txtLoader, TextLoader
+import time
+from pathlib import Path
+from collections import deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+import docx2txt
+from pypdf import PdfReader
+from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from rag_pipeline.config import LOADER_WORKERS, CHUNKER, CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+from rag_pipeline.chunker import StructureAwareChunker
+from rag_pipeline.metrics import metrics
 
-def load_documents(file_paths):
+HEADING_PATTERN = re.compile(r"^[A-Z\s]{5,}$")  # Heuristic for headings
+SECTION_PATTERN = re.compile(r"Section\s+(\d+\.\d+|\d+)")
+
+def _find_heading(content):
+    # Extract surrounding headings (heuristic: look for all-caps or bold-like lines)
+    for line in content.split("\n"):
+        if HEADING_PATTERN.match(line.strip()):
+            return line.strip()
+    return None
+
+def _find_section(content):
+    # Extract section numbers (heuristic: look for "Section X" patterns)
+    section_match = SECTION_PATTERN.search(content)
+    return section_match.group(0) if section_match else None
+
+class BufferStream(io.RawIOBase):
+    """Read-only, seekable binary stream over a bytes-like object, without copying it."""
+
+    def __init__(self, data):
+        self._view = memoryview(data).cast("B")
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), len(self._view) - self._position)
+        buffer[:size] = self._view[self._position:self._position + size]
+        self._position += size
+        return size
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._view)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self):
+        return self._position
+
+def _open_buffer(data):
+    """Binary stream over an upload: file-like objects are rewound, buffers are wrapped."""
+    if hasattr(data, "read"):
+        data.seek(0)
+        return data
+    return io.BufferedReader(BufferStream(data))
+
+def _iter_pages(name, stream):
+    """Yield the pages of one document read from ``stream``, with heading/section metadata.
+
+    PDF pages are extracted one at a time as they are consumed, so only the
+    current page's text is held in memory.
+    """
+    if name.endswith(".pdf"):
+        reader = PdfReader(stream)
+        total_pages = len(reader.pages)
+        for index, page in enumerate(reader.pages):
+            content = page.extract_text()
+            yield Document(page_content=content, metadata={
+                "source": name,
+                "page": index,
+                "page_number": index + 1,
+                "total_pages": total_pages,
+                "heading": _find_heading(content)
+            })
+    elif name.endswith(".docx"):
+        content = docx2txt.process(stream)
+        yield Document(page_content=content, metadata={
+            "source": name,
+            "section": _find_section(content)
+        })
+    elif name.endswith(".txt"):
+        print(f"Loading text file: {name}")
+        content = stream.read().decode("utf-8")
+        # Extract section numbers or clauses (same as for .docx)
+        yield Document(page_content=content, metadata={
+            "source": name,
+            "section": _find_section(content)
+        })
+        print(f"Successfully loaded 1 documents from {name}")
+    else:
+        print(f"Error: Unsupported file type for {name}. Supported types: .pdf, .docx, .txt")
+
+def _iter_file_pages(file_path):
+    """Yield the pages of one file on disk as they are parsed."""
+    with open(file_path, "rb") as f:
+        yield from _iter_pages(os.path.basename(file_path), f)
+
+def _iter_timed_pages(name, pages, errors):
+    try:
+        for page in metrics.timed_iter("load_document", pages):
+            metrics.inc("rag_pages_loaded_total")
+            yield page
+    except Exception as e:
+        _report_failure(name, str(e), errors)
+
+def _load_file(file_path):
+    """Parse one file in a worker process; returns (documents, error message, seconds).
+
+    A file that fails part-way still returns the pages read before the error,
+    like the sequential path, which has already yielded them by then.
+    """
+    started = time.perf_counter()
     documents = []
-    for file_path in file_paths:
-        if not os.path.exists(file_path):
-            print(f"Error: File {file_path} does not exist.")
-            continue
+    try:
+        for page in _iter_file_pages(file_path):
+            documents.append(page)
+    except Exception as e:
+        return documents, str(e), time.perf_counter() - started
+    return documents, None, time.perf_counter() - started
+
+def _report_failure(file_path, message, errors):
+    print(f"Failed to load {file_path}: {message}")
+    metrics.inc("rag_stage_errors_total", stage="load_document")
+    if errors is not None:
+        errors.append((os.path.basename(file_path), message))
+
+def _exists(file_path):
+    if not os.path.exists(file_path):
+        print(f"Error: File {file_path} does not exist.")
+        return False
+    return True
+
+def iter_documents(file_paths, max_workers=LOADER_WORKERS, errors=None):
+    """Yield page-level Documents for all files, in the order the files were given.
+
+    With ``max_workers`` > 1 files are parsed in a process pool, keeping at most
+    two files per worker in flight so memory stays bounded. A file that fails to
+    parse is reported (and appended to ``errors`` as ``(name, message)``) without
+    stopping the others; either way, the pages read before the failure are
+    yielded first.
+    """
+    file_paths = [fp for fp in file_paths if _exists(fp)]
+    if max_workers <= 1 or len(file_paths) <= 1:
+        for file_path in file_paths:
+            yield from _iter_timed_pages(file_path, _iter_file_pages(file_path), errors)
+        return
+
+    with ProcessPoolExecutor(max_workers=min(max_workers, len(file_paths))) as executor:
+        pending = deque()
+        paths = iter(file_paths)
+        for file_path in islice(paths, max_workers * 2):
+            pending.append((file_path, executor.submit(_load_file, file_path)))
         try:
-            if file_path.endswith(".pdf"):
-                loader = PyPDFLoader(file_path)
-                raw_docs = loader.load()
-                for doc in raw_docs:
-                    # Extract page number
-                    page_num = doc.metadata.get("page", 0) + 1
-                    # Extract surrounding headings (heuristic: look for all-caps or bold-like lines)
-                    content = doc.page_content
-                    lines = content.split("\n")
-                    heading = None
-                    for line in lines:
-                        if re.match(r"^[A-Z\s]{5,}$", line.strip()):  # Heuristic for headings
-                            heading = line.strip()
-                            break
-                    doc.metadata.update({
-                        "page_number": page_num,
-                        "heading": heading,
-                        "source": os.path.basename(file_path)
-                    })
-                    documents.append(doc)
-            elif file_path.endswith(".docx"):
-                loader = Docx2txtLoader(file_path)
-                raw_docs = loader.load()
-                for doc in raw_docs:
-                    # Extract section numbers (heuristic: look for "Section X" patterns)
-                    content = doc.page_content
-                    section_match = re.search(r"Section\s+(\d+\.\d+|\d+)", content)
-                    section = section_match.group(0) if section_match else None
-                    doc.metadata.update({
-                        "section": section,
-                        "source": os.path.basename(file_path)
-                    })
-                    documents.append(doc)
-            elif file_path.endswith(".txt"):
-                print(f"Loading text file: {file_path}")
-                loader = TextLoader(file_path, encoding="utf-8")
-                raw_docs = loader.load()
-                for doc in raw_docs:
-                    content = doc.page_content
-                    # Extract section numbers or clauses (same as for .docx)
-                    section_match = re.search(r"Section\s+(\d+\.\d+|\d+)", content)
-                    section = section_match.group(0) if section_match else None
-                    doc.metadata.update({
-                        "section": section,
-                        "source": os.path.basename(file_path)
-                    })
-                    documents.append(doc)
-                print(f"Successfully loaded {len(raw_docs)} documents from {file_path}")
-            else:
-                print(f"Error: Unsupported file type for {file_path}. Supported types: .pdf, .docx, .txt")
-        except Exception as e:
-            print(f"Failed to load {file_path}: {str(e)}")
-            raise Exception(f"Error loading {file_path}: {str(e)}")
-    return documents
+            while pending:
+                file_path, future = pending.popleft()
+                for next_path in islice(paths, 1):
+                    pending.append((next_path, executor.submit(_load_file, next_path)))
+                try:
+                    documents, error, seconds = future.result()
+                    metrics.observe("rag_stage_duration_seconds", seconds, stage="load_document")
+                except Exception as e:
+                    documents, error = [], str(e)
+                metrics.inc("rag_pages_loaded_total", len(documents))
+                yield from documents
+                if error is not None:
+                    _report_failure(file_path, error, errors)
+        finally:
+            # A consumer that stops early (e.g. a cancelled job) doesn't wait for files not started yet
+            for _, future in pending:
+                future.cancel()
+
+def iter_upload_documents(uploads, errors=None):
+    """Yield page-level Documents for in-memory uploads, in order.
+
+    ``uploads`` holds ``(file name, data)`` pairs where data is a file-like
+    object (such as a Streamlit UploadedFile), bytes or a memoryview. Nothing
+    is written to disk or copied, and pages are parsed lazily in this process
+    as the caller consumes them, so parsing overlaps with embedding.
+    """
+    for name, data in uploads:
+        yield from _iter_timed_pages(name, _iter_pages(name, _open_buffer(data)), errors)
+
+def validate_filename(filename):
+    """Sanitize and validate filename to prevent path traversal."""
+    safe_filename = Path(filename).name
+    if not safe_filename.endswith((".pdf", ".docx", ".txt")):
+        return None
+    return safe_filename
+
+def load_documents(file_paths, max_workers=LOADER_WORKERS, errors=None):
+    return list(iter_documents(file_paths, max_workers=max_workers, errors=errors))
+
+def iter_chunks(documents, chunker=CHUNKER, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS):
+    """Split Documents one at a time so chunks are produced while pages are still loading.
+
+    ``chunker="structure"`` uses StructureAwareChunker; ``"recursive"`` keeps
+    the fixed 1000/200 character splitter.
+    """
+    finish = list
+    if chunker == "recursive":
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        split = lambda document: text_splitter.split_documents([document])
+    elif chunker == "structure":
+        structure_chunker = StructureAwareChunker(max_tokens=max_tokens, overlap_tokens=overlap_tokens)
+        split, finish = structure_chunker.split_document, structure_chunker.finish
+    else:
+        raise ValueError(f"Unsupported chunker: {chunker}. Supported: structure, recursive")
+    for document in documents:
+        with metrics.span("split_document"):
+            chunks = split(document)
+        metrics.inc("rag_chunks_total", len(chunks), stage="split")
+        for chunk in chunks:
+            # Preserve metadata in chunks
+            chunk.metadata = chunk.metadata or {}
+            yield chunk
+    # Headings at the very end of the last document
+    chunks = finish()
+    metrics.inc("rag_chunks_total", len(chunks), stage="split")
+    yield from chunks
 
 def split_documents(documents):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_documents(documents)
-    # Preserve metadata in chunks
-    for chunk in chunks:
-        chunk.metadata = chunk.metadata or {}
-    return chunks
\ No newline at end of file
+    return list(iter_chunks(documents))
+
+def batched(iterable, size):
+    """Yield lists of up to ``size`` items from ``iterable``."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
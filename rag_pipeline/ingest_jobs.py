@@ -0,0 +1,527 @@
+import os
+import re
+import copy
+import json
+import time
+import uuid
+import queue
+import heapq
+import shutil
+import hashlib
+import itertools
+import logging
+import threading
+try:
+    import fcntl
+except ImportError:  # Windows: jobs are not shared between processes
+    fcntl = None
+from rag_pipeline.config import (
+    INGEST_JOB_DIR,
+    INGEST_JOB_WORKERS,
+    INGEST_JOBS_RESUMABLE,
+    VECTOR_BACKEND,
+    MULTI_TENANCY_ENABLED,
+    VECTOR_QUANTIZATION,
+    PQ_SEGMENTS,
+    HYBRID_SEARCH_ENABLED,
+    DEDUP_ENABLED,
+    DEDUP_THRESHOLD,
+)
+from rag_pipeline.file_loader import iter_documents, iter_upload_documents, iter_chunks
+from rag_pipeline.rag_pipeline import store_embeddings, record_partial_ingest
+from rag_pipeline.keyword_index import get_keyword_index
+from rag_pipeline.dedup import get_deduplicator
+from rag_pipeline.weviate_helper import create_or_connect_class
+from rag_pipeline.tenants import tenant_scope, keyword_index_path, dedup_index_path, tenant_tracker
+from rag_pipeline.resources import get_embeddings, get_weaviate_client, get_ingest_manifest
+
+logger = logging.getLogger(__name__)
+
+# Jobs in these states are (re)started when the queue starts
+UNFINISHED_STATES = ("queued", "running")
+JOB_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+# How often a worker retries a busy tenant or looks for a free job slot held by another process
+LOCK_POLL_SECONDS = 0.5
+
+
+def try_lock(path):
+    """Open ``path`` and take an exclusive lock on it without waiting; the handle, or None if it is held.
+
+    Closing the handle releases the lock, also when the process exits.
+    """
+    handle = open(path, "a")
+    try:
+        fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+
+class JobCancelled(Exception):
+    """Raised in a job's chunk stream once it has been cancelled."""
+
+
+class JobInterrupted(Exception):
+    """Raised in a job's chunk stream when the queue shuts down; the job resumes on restart."""
+
+
+class IngestCheckpoint:
+    """Append-only file of the chunk IDs, and their source files, whose embedding batches have been written."""
+
+    def __init__(self, path):
+        self.path = path
+        self.sources = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                for line in f:
+                    chunk_id, _, source = line.rstrip("\n").partition("\t")
+                    if chunk_id:
+                        self.sources[chunk_id] = source or None
+
+    @property
+    def ids(self):
+        return self.sources.keys()
+
+    def add(self, ids, sources):
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.writelines(f"{chunk_id}\t{source}\n" for chunk_id, source in zip(ids, sources))
+            self.sources.update(zip(ids, sources))
+
+
+def cancel_marker(directory):
+    return os.path.join(directory, "cancel")
+
+
+def read_record(directory):
+    with open(os.path.join(directory, "job.json"), "r") as f:
+        return json.load(f)
+
+
+class IngestJob:
+    """An upload being ingested: its spooled files (or in-memory ``uploads``), progress and state.
+
+    The record is saved as ``job.json`` in the job's directory after every
+    change, so status survives a restart and can be read from any session.
+    """
+
+    def __init__(self, directory, record, uploads=None):
+        self.directory = directory
+        self.record = record
+        self.uploads = uploads
+        self.checkpoint = IngestCheckpoint(os.path.join(directory, "checkpoint.txt"))
+        self.cancel_requested = threading.Event()
+        self._lock = threading.Lock()
+        self._claim = None
+
+    @property
+    def id(self):
+        return self.record["id"]
+
+    def file_path(self, name):
+        return os.path.join(self.directory, "files", name)
+
+    def snapshot(self):
+        with self._lock:
+            return copy.deepcopy(self.record)
+
+    def update(self, **fields):
+        with self._lock:
+            self.record.update(fields)
+            self._save()
+
+    def update_file(self, name, **fields):
+        with self._lock:
+            for entry in self.record["files"]:
+                if entry["name"] == name:
+                    entry.update(fields)
+            self._save()
+
+    def count(self, name, key):
+        # Not saved on every page or chunk; the next batch or status change saves it
+        with self._lock:
+            for entry in self.record["files"]:
+                if entry["name"] == name:
+                    entry[key] += 1
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def claim(self):
+        """Lock the job for this process; False if another process (server worker) holds it."""
+        if fcntl is None:
+            return True
+        self._claim = try_lock(os.path.join(self.directory, "lock"))
+        return self._claim is not None
+
+    def release(self):
+        if self._claim is not None:
+            self._claim.close()
+            self._claim = None
+
+    def cancel_marked(self):
+        """True once any process has asked for the job to be cancelled."""
+        if not self.cancel_requested.is_set() and os.path.exists(cancel_marker(self.directory)):
+            self.cancel_requested.set()
+        return self.cancel_requested.is_set()
+
+    def _save(self):
+        path = os.path.join(self.directory, "job.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(self.record, f)
+        os.replace(f"{path}.tmp", path)
+
+
+class IngestJobQueue:
+    """Runs document ingestion in the background on a bounded pool of worker threads.
+
+    ``submit`` spools the uploaded bytes under ``directory/<job id>/`` and
+    returns a job ID straight away; ``status``, ``jobs`` and ``cancel`` can be
+    called from any session. Each job has up to EMBED_MAX_CONCURRENCY
+    embedding requests in flight. Written embedding batches are checkpointed,
+    so a job interrupted by a restart resumes on startup without embedding
+    those batches again. Jobs submitted with ``resumable=False`` keep their
+    uploads in memory instead and parse them from there; if the process
+    stops first, they are marked failed on the next start.
+
+    Several processes (server workers, the Streamlit app) may share
+    ``directory``. Each job is locked by the process running it, and status
+    and cancellation work from any of them. Limits hold across all of them:
+    a job only runs while it holds one of ``max_workers`` slot files under
+    ``directory/slots``, so at most ``max_workers`` jobs run at once, and it
+    holds its tenant's lock file under ``directory/scopes``, so jobs for the
+    same tenant run one after another, oldest first. A job whose tenant is
+    busy is set aside, without keeping a worker, until that tenant's running
+    job finishes here (or, if it runs in another process, retried every
+    LOCK_POLL_SECONDS), so workers go on to other tenants' jobs meanwhile.
+    """
+
+    def __init__(self, directory=INGEST_JOB_DIR, max_workers=INGEST_JOB_WORKERS):
+        self.directory = directory
+        self.max_workers = max(1, max_workers)
+        self._jobs = {}
+        # The job running, or next to run, for each busy tenant, and the tenant's other jobs behind it
+        self._scope_owners = {}
+        self._waiting = {}
+        self._lock = threading.Lock()
+        # Oldest job first; a job put back because its tenant was busy keeps its place
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._stopped = threading.Event()
+        for subdirectory in ("slots", "scopes"):
+            os.makedirs(os.path.join(directory, subdirectory), exist_ok=True)
+        self._resume()
+        self._workers = [
+            threading.Thread(target=self._run, name=f"ingest-{index}", daemon=True)
+            for index in range(self.max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, uploads, collection_name, tenant=None, fingerprints=None, resumable=INGEST_JOBS_RESUMABLE):
+        """Queue ``(file name, data)`` uploads for ingestion; returns the job ID.
+
+        ``data`` may be bytes, a memoryview or a file-like object such as a
+        Streamlit UploadedFile. Unless ``resumable``, it is parsed from memory
+        and must not change until the job finishes.
+        """
+        uploads = list(uploads)
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.directory, job_id)
+        os.makedirs(os.path.join(directory, "files"))
+        fingerprints = fingerprints or {}
+        files = []
+        for name, data in uploads:
+            if resumable:
+                with open(os.path.join(directory, "files", name), "wb") as f:
+                    f.write(data.getbuffer() if hasattr(data, "getbuffer") else data)
+            files.append({"name": name, "fingerprint": fingerprints.get(name), "status": "pending",
+                          "pages": 0, "chunks": 0, "error": None})
+        job = IngestJob(directory, {
+            "id": job_id,
+            "collection": collection_name,
+            "tenant": tenant,
+            "status": "queued",
+            "files": files,
+            "resumable": resumable,
+            "progress": {},
+            "resumed_chunks": 0,
+            "error": None,
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }, uploads=None if resumable else uploads)
+        job.save()
+        job.claim()
+        self._enqueue(job)
+        logger.info(f"Queued ingestion job {job_id} with {len(files)} file(s)")
+        return job_id
+
+    def status(self, job_id):
+        """Snapshot of a job's record, or None for an unknown ID."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot()
+        if not JOB_ID_PATTERN.fullmatch(job_id):
+            return None
+        try:
+            # Submitted to another process sharing the directory
+            return read_record(os.path.join(self.directory, job_id))
+        except (OSError, ValueError):
+            return None
+
+    def jobs(self, collection_name=None, tenant=None):
+        """Snapshots of the jobs for a collection and tenant, oldest first."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        snapshots = [job.snapshot() for job in jobs]
+        return sorted(
+            (record for record in snapshots
+             if collection_name is None or (record["collection"] == collection_name and record["tenant"] == tenant)),
+            key=lambda record: record["submitted_at"]
+        )
+
+    def cancel(self, job_id):
+        """Stop a queued or running job; returns False if it had already finished."""
+        record = self.status(job_id)
+        if record is None or record["status"] not in UNFINISHED_STATES:
+            return False
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel_requested.set()
+        else:
+            # The process running the job checks for this file between chunks
+            open(cancel_marker(os.path.join(self.directory, job_id)), "w").close()
+        logger.info(f"Cancellation requested for ingestion job {job_id}")
+        return True
+
+    def shutdown(self, timeout=5.0):
+        """Stop the workers; running jobs stop at their next chunk and resume on restart."""
+        self._stopped.set()
+        for _ in self._workers:
+            self._queue.put((float("-inf"), next(self._order), None))
+        for worker in self._workers:
+            worker.join(timeout)
+
+    def _enqueue(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+        self._queue.put((job.record["submitted_at"], next(self._order), job))
+
+    def _resume(self):
+        for job_id in os.listdir(self.directory):
+            if not JOB_ID_PATTERN.fullmatch(job_id):
+                continue
+            directory = os.path.join(self.directory, job_id)
+            try:
+                record = read_record(directory)
+            except (OSError, ValueError):
+                shutil.rmtree(directory, ignore_errors=True)
+                continue
+            if record["status"] not in UNFINISHED_STATES:
+                # Finished jobs are only reported until the next restart
+                shutil.rmtree(directory, ignore_errors=True)
+                continue
+            job = IngestJob(directory, record)
+            if not job.claim():
+                # Still running in another live process
+                continue
+            if not record.get("resumable", True):
+                self._abandon(job)
+                continue
+            job.update(status="queued")
+            self._enqueue(job)
+            logger.info(f"Resuming ingestion job {job_id} ({len(job.checkpoint.ids)} chunk(s) already written)")
+
+    def _abandon(self, job):
+        """Fail an interrupted job whose uploads were only held in memory, keeping what it wrote."""
+        record = job.snapshot()
+        scope = tenant_scope(record["collection"], record["tenant"])
+        if job.checkpoint.sources:
+            record_partial_ingest(get_ingest_manifest(), scope, job.checkpoint.sources)
+        with self._lock:
+            self._jobs[job.id] = job
+        self._finish(job, "failed", error="Interrupted by a restart; upload the files again.")
+        logger.info(f"Ingestion job {job.id} was interrupted and its uploads were not kept; marked failed")
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            job = item[2]
+            if job is None or self._stopped.is_set():
+                return
+            scope = tenant_scope(job.record["collection"], job.record["tenant"])
+            if not self._reserve_scope(scope, item):
+                # Put back in the queue by _release_scope once the tenant's running job finishes
+                continue
+            if job.cancel_marked():
+                self._finish(job, "cancelled")
+                self._release_scope(scope)
+                continue
+            scope_lock = self._lock_scope(scope)
+            if scope_lock is None:
+                # A job for this tenant is running in another process; the tenant's
+                # other jobs stay behind this one while it waits out of the queue
+                retry = threading.Timer(LOCK_POLL_SECONDS, self._queue.put, args=(item,))
+                retry.daemon = True
+                retry.start()
+                continue
+            try:
+                slot = self._acquire_slot()
+                if slot is None:
+                    # Shutting down; the job resumes on restart
+                    job.release()
+                    return
+                try:
+                    self._run_job(job)
+                finally:
+                    slot.close()
+            finally:
+                if scope_lock is not True:
+                    scope_lock.close()
+                self._release_scope(scope)
+
+    def _reserve_scope(self, scope, item):
+        """Make the job the tenant's next to run; False (and set it aside) if another one is."""
+        with self._lock:
+            owner = self._scope_owners.get(scope)
+            if owner is None or owner is item[2]:
+                self._scope_owners[scope] = item[2]
+                return True
+            heapq.heappush(self._waiting.setdefault(scope, []), item)
+            return False
+
+    def _release_scope(self, scope):
+        """Hand the tenant to its oldest waiting job, which goes back in the queue in its place."""
+        with self._lock:
+            waiting = self._waiting.get(scope)
+            if not waiting:
+                self._scope_owners.pop(scope, None)
+                self._waiting.pop(scope, None)
+                return
+            item = heapq.heappop(waiting)
+            if not waiting:
+                del self._waiting[scope]
+            self._scope_owners[scope] = item[2]
+        self._queue.put(item)
+
+    def _lock_scope(self, scope):
+        """A held lock on the tenant's jobs across processes (a file handle, or True without fcntl), or None if busy."""
+        if fcntl is None:
+            return True
+        name = hashlib.sha1(scope.encode("utf-8")).hexdigest()
+        return try_lock(os.path.join(self.directory, "scopes", f"{name}.lock"))
+
+    def _acquire_slot(self):
+        """Wait for one of the ``max_workers`` job slots shared by all processes; None once stopped."""
+        if fcntl is None:
+            # Jobs are not shared between processes; the worker threads are the limit
+            return open(os.devnull, "r")
+        while not self._stopped.is_set():
+            for index in range(self.max_workers):
+                handle = try_lock(os.path.join(self.directory, "slots", f"{index}.lock"))
+                if handle is not None:
+                    return handle
+            self._stopped.wait(LOCK_POLL_SECONDS)
+        return None
+
+    def _run_job(self, job):
+        if job.cancel_marked():
+            self._finish(job, "cancelled")
+            return
+        job.update(status="running", started_at=time.time(), resumed_chunks=len(job.checkpoint.ids))
+        try:
+            self._ingest(job)
+        except JobCancelled:
+            logger.info(f"Ingestion job {job.id} cancelled")
+            self._finish(job, "cancelled")
+        except JobInterrupted:
+            logger.info(f"Ingestion job {job.id} interrupted; it resumes on restart")
+            job.release()
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} failed: {e}")
+            self._finish(job, "failed", error=str(e))
+        else:
+            self._finish(job, "completed")
+
+    def _finish(self, job, status, error=None):
+        for entry in job.snapshot()["files"]:
+            if entry["status"] != "failed":
+                job.update_file(entry["name"], status="done" if status == "completed" else status)
+        job.update(status=status, error=error, finished_at=time.time())
+        # The record stays in memory for status queries; uploads and checkpoints go
+        job.uploads = None
+        shutil.rmtree(os.path.join(job.directory, "files"), ignore_errors=True)
+        if os.path.exists(job.checkpoint.path):
+            os.remove(job.checkpoint.path)
+        job.release()
+
+    def _ingest(self, job):
+        record = job.snapshot()
+        collection_name, tenant = record["collection"], record["tenant"]
+        scope = tenant_scope(collection_name, tenant)
+        embeddings = get_embeddings()
+        client = None
+        if VECTOR_BACKEND != "local":
+            client = get_weaviate_client()
+            create_or_connect_class(client, class_name=collection_name, multi_tenancy=MULTI_TENANCY_ENABLED,
+                                    quantization=VECTOR_QUANTIZATION, pq_segments=PQ_SEGMENTS)
+        manifest = get_ingest_manifest()
+        errors = []
+
+        def on_batch(progress):
+            job.update(progress=progress)
+            # Keep the tenant's indexes loaded while its job runs
+            tenant_tracker.touch(collection_name, tenant)
+
+        store_embeddings(
+            self._chunks(job, errors), collection_name, client, embeddings,
+            manifest=manifest,
+            fingerprints={entry["name"]: entry["fingerprint"] for entry in record["files"]},
+            on_batch=on_batch,
+            keyword_index=get_keyword_index(keyword_index_path(scope)) if HYBRID_SEARCH_ENABLED else None,
+            deduplicator=get_deduplicator(dedup_index_path(scope), DEDUP_THRESHOLD) if DEDUP_ENABLED else None,
+            tenant=tenant,
+            checkpoint=job.checkpoint
+        )
+        for file_name, error in errors:
+            # A partially parsed file must not be treated as up to date next time
+            manifest.invalidate(scope, file_name)
+            job.update_file(file_name, status="failed", error=error)
+
+    def _chunks(self, job, errors):
+        """Chunks of every file in turn, tracking per-file progress and stopping on request."""
+        for chunk in iter_chunks(self._pages(job, errors)):
+            self._check_stop(job)
+            job.count(chunk.metadata.get("source"), "chunks")
+            yield chunk
+        failed = {name for name, _ in errors}
+        for entry in job.snapshot()["files"]:
+            job.update_file(entry["name"], status="failed" if entry["name"] in failed else "parsed")
+
+    def _pages(self, job, errors):
+        if job.uploads is not None:
+            pages = iter_upload_documents(job.uploads, errors=errors)
+        else:
+            # Spooled files are parsed in the loader process pool, a few files ahead of embedding
+            pages = iter_documents([job.file_path(entry["name"]) for entry in job.snapshot()["files"]], errors=errors)
+        current = None
+        for page in pages:
+            self._check_stop(job)
+            name = page.metadata.get("source")
+            if name != current:
+                if current is not None:
+                    job.update_file(current, status="parsed")
+                job.update_file(name, status="processing", pages=0, chunks=0)
+                current = name
+            job.count(name, "pages")
+            yield page
+
+    def _check_stop(self, job):
+        if job.cancel_marked():
+            raise JobCancelled(job.id)
+        if self._stopped.is_set():
+            raise JobInterrupted(job.id)
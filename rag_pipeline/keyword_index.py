@@ -0,0 +1,283 @@
+import os
+import re
+import json
+import math
+import logging
+import threading
+from collections import Counter
+from langchain_core.documents import Document
+from rag_pipeline.shared_files import file_lock, file_version
+
+logger = logging.getLogger(__name__)
+
+# Keeps clause numbers ("4.2") and product codes ("XJ-200") as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+# Section and heading metadata count this many times as much as body text
+METADATA_WEIGHT = 2
+
+
+def tokenize(text):
+    """Lower-cased terms; compound tokens also contribute their parts."""
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = re.split(r"[.\-/]", token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def _document_key(doc):
+    return doc.metadata.get("source"), doc.page_content
+
+
+class BM25Index:
+    """Incremental in-memory BM25 (Okapi) inverted index over chunk text.
+
+    Chunks are indexed together with their ``section`` and ``heading``
+    metadata, so a query for "Section 4.2" also matches chunks whose detected
+    section is 4.2. The index is persisted as JSON and rebuilt on load.
+
+    Only the tenant's ingestion job changes an index, and it holds the
+    tenant's lock across processes (see ingest_jobs), so ``persist`` never has
+    to merge. Other processes reload the file on their next search once it was
+    replaced; an index with unsaved changes is never reloaded.
+    """
+
+    def __init__(self, path=None, k1=1.5, b=0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._lengths = {}
+        self._postings = {}
+        self._total_length = 0
+        self._version = None
+        self._dirty = False
+        if path:
+            self.refresh()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def add(self, ids, documents):
+        with self._lock:
+            for doc_id, doc in zip(ids, documents):
+                if doc_id in self._docs:
+                    self._remove(doc_id)
+                self._docs[doc_id] = {"text": doc.page_content, "metadata": dict(doc.metadata)}
+                self._index(doc_id)
+            self._dirty = True
+
+    def update_metadata(self, updates):
+        """Merge ``{id: metadata}`` into indexed chunks' metadata."""
+        with self._lock:
+            for doc_id, metadata in updates.items():
+                if doc_id in self._docs:
+                    self._remove(doc_id)
+                    self._docs[doc_id]["metadata"].update(metadata)
+                    self._index(doc_id)
+                    self._dirty = True
+
+    def remove(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                if doc_id in self._docs:
+                    self._remove(doc_id)
+                    del self._docs[doc_id]
+                    self._dirty = True
+
+    def search(self, query, k=10):
+        """Return up to ``k`` (Document, score) pairs, best first."""
+        terms = set(tokenize(query))
+        self.refresh()
+        with self._lock:
+            count = len(self._docs)
+            if not count or not terms:
+                return []
+            average_length = self._total_length / count
+            scores = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+            best = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [(self._document(doc_id), score) for doc_id, score in best]
+
+    def persist(self):
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            with file_lock(self.path):
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, "w") as f:
+                    json.dump(self._docs, f)
+                os.replace(tmp_path, self.path)
+                self._version = file_version(self.path)
+            self._dirty = False
+
+    def refresh(self):
+        """Reload the index if another process saved it since it was loaded."""
+        if not self.path:
+            return
+        with self._lock:
+            if self._dirty or file_version(self.path) == self._version:
+                return
+            self._docs, self._lengths, self._postings, self._total_length = {}, {}, {}, 0
+            with file_lock(self.path, shared=True):
+                self._version = file_version(self.path)
+                if self._version is not None:
+                    self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                self._docs = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ignoring unreadable keyword index {self.path}: {e}")
+            self._docs = {}
+        for doc_id in self._docs:
+            self._index(doc_id)
+        logger.info(f"Loaded keyword index with {len(self._docs)} chunk(s) from {self.path}")
+
+    def _terms(self, doc_id):
+        entry = self._docs[doc_id]
+        terms = Counter(tokenize(entry["text"]))
+        for field in ("section", "heading"):
+            value = entry["metadata"].get(field)
+            if value:
+                for term in tokenize(str(value)):
+                    terms[term] += METADATA_WEIGHT
+        return terms
+
+    def _index(self, doc_id):
+        terms = self._terms(doc_id)
+        length = sum(terms.values())
+        self._lengths[doc_id] = length
+        self._total_length += length
+        for term, frequency in terms.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+
+    def _remove(self, doc_id):
+        for term in self._terms(doc_id):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id, 0)
+
+    def _document(self, doc_id):
+        entry = self._docs[doc_id]
+        return Document(id=doc_id, page_content=entry["text"], metadata=dict(entry["metadata"]))
+
+
+class HybridRetriever:
+    """Fuses vector and BM25 results with reciprocal-rank fusion.
+
+    Exposes the same ``similarity_search`` surface as the wrapped vector store
+    and forwards every other attribute to it, so it can stand in for the vector
+    store anywhere ``query_rag`` expects one.
+    """
+
+    def __init__(self, vector_store, keyword_index, fetch_k=10, rrf_k=60):
+        self.vector_store = vector_store
+        self.keyword_index = keyword_index
+        self.fetch_k = fetch_k
+        self.rrf_k = rrf_k
+
+    def __getattr__(self, name):
+        return getattr(self.vector_store, name)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        fetch_k = max(k, self.fetch_k)
+        vector_results = self.vector_store.similarity_search(query, k=fetch_k, **kwargs)
+        keyword_results = [doc for doc, _ in self.keyword_index.search(query, k=fetch_k)]
+        return reciprocal_rank_fusion([vector_results, keyword_results], k=k, rrf_k=self.rrf_k)
+
+    def similarity_search_with_vectors(self, query, k=4, query_vector=None):
+        """Fused (Document, vector) pairs; keyword-only hits are embedded (usually from the cache)."""
+        vector_pairs = search_with_vectors(self.vector_store, query, k=max(k, self.fetch_k), query_vector=query_vector)
+        return self.fuse_with_keywords(query, k, vector_pairs)
+
+    def fuse_with_keywords(self, query, k, vector_pairs):
+        """Fuse (Document, vector) pairs from the vector store (``max(k, fetch_k)`` of them) with BM25 hits.
+
+        Keyword-only hits get the vectors stored for their chunk IDs.
+        """
+        keyword_results = [doc for doc, _ in self.keyword_index.search(query, k=max(k, self.fetch_k))]
+        fused = reciprocal_rank_fusion([[doc for doc, _ in vector_pairs], keyword_results], k=k, rrf_k=self.rrf_k)
+        return attach_vectors(fused, vector_pairs, self.vector_store)
+
+
+def reciprocal_rank_fusion(result_lists, k=4, rrf_k=60):
+    """Merge ranked Document lists; chunks are matched by source and text."""
+    scores = {}
+    documents = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = _document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+            documents.setdefault(key, doc)
+    best = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [documents[key] for key in best]
+
+
+def search_with_vectors(vector_store, query, k=4, query_vector=None):
+    """(Document, vector) pairs from any store, embedding the hits if it can't return vectors."""
+    if hasattr(vector_store, "similarity_search_with_vectors"):
+        return vector_store.similarity_search_with_vectors(query, k=k, query_vector=query_vector)
+    if query_vector is not None:
+        results = vector_store.similarity_search_by_vector(query_vector, k=k)
+    else:
+        results = vector_store.similarity_search(query, k=k)
+    return attach_vectors(results, [], vector_store)
+
+
+def attach_vectors(documents, pairs, vector_store):
+    """Pair Documents with their vectors from ``pairs``, else with those ``vector_store`` holds for their IDs.
+
+    Only chunks the store can't return a vector for are embedded again.
+    """
+    vectors = {_document_key(doc): vector for doc, vector in pairs}
+    missing = [doc for doc in documents if _document_key(doc) not in vectors]
+    if missing and hasattr(vector_store, "vectors_by_ids"):
+        stored = vector_store.vectors_by_ids([doc.id for doc in missing if doc.id])
+        for doc in missing:
+            if doc.id in stored:
+                vectors[_document_key(doc)] = stored[doc.id]
+        missing = [doc for doc in missing if _document_key(doc) not in vectors]
+    if missing:
+        embedded = vector_store.embeddings.embed_documents([doc.page_content for doc in missing])
+        for doc, vector in zip(missing, embedded):
+            vectors[_document_key(doc)] = vector
+    return [(doc, vectors[_document_key(doc)]) for doc in documents]
+
+
+_open_indexes = {}
+_open_indexes_lock = threading.Lock()
+
+
+def get_keyword_index(path):
+    """Return the process-wide BM25Index persisted at ``path``, loading it once."""
+    with _open_indexes_lock:
+        index = _open_indexes.get(path)
+        if index is None:
+            index = BM25Index(path)
+            _open_indexes[path] = index
+        return index
+
+
+def release_keyword_index(path):
+    """Persist and close the index opened for ``path``; it is reloaded on next use."""
+    with _open_indexes_lock:
+        index = _open_indexes.pop(path, None)
+    if index is not None:
+        index.persist()
@@ -0,0 +1,556 @@
+import os
+import json
+import logging
+import threading
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from rag_pipeline.quantization import QUANTIZATION_MODES, make_quantizer, min_training_vectors
+from rag_pipeline.shared_files import file_lock, file_version
+
+logger = logging.getLogger(__name__)
+
+# IVF falls back to an exact scan below this many vectors
+_IVF_MIN_VECTORS = 1024
+_KMEANS_ITERATIONS = 10
+_TRAINING_SAMPLE = 20_000
+# Rows read, encoded or written at a time when going over the whole store
+_BLOCK_ROWS = 65536
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _top_k(scores, k):
+    """Indices of the k largest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _kmeans(vectors, n_lists, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(vectors.shape[0], n_lists, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for index in range(n_lists):
+            members = vectors[assignment == index]
+            if len(members):
+                centroids[index] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+class LocalVectorStore(VectorStore):
+    """In-process cosine-similarity index over a NumPy matrix.
+
+    ``index_type="exact"`` scores every stored vector with one matrix-vector
+    product; ``index_type="ivf"`` clusters vectors into ``n_lists`` inverted
+    lists with k-means and only scans the ``n_probe`` lists closest to the
+    query. With a ``path`` the vectors are persisted as a .npy file that is
+    memory-mapped read-only on load, next to a JSON file holding ids, texts and
+    metadata. Vectors added or replaced after that are kept in memory, and
+    deleted rows are only skipped, until ``persist`` merges everything into a
+    new file.
+
+    With a ``quantization`` other than "none", searches scan compressed codes
+    kept in memory (see quantization.py) for ``rescore_factor`` x k candidates
+    and rank those by their full-precision vectors, which after a load are only
+    read from the memory-mapped file for the candidates. Stores too small to
+    train the quantizer on (see ``min_training_vectors``) are scanned exactly.
+
+    Like BM25Index, a store is only changed by its tenant's ingestion job, and
+    searches in other processes reload it (``refresh``) once it was saved.
+    """
+
+    def __init__(self, embedding, path=None, index_type="exact", n_lists=None, n_probe=8,
+                 quantization="none", rescore_factor=4, pq_segments=None):
+        if index_type not in ("exact", "ivf"):
+            raise ValueError(f"Unsupported index type: {index_type}. Supported: exact, ivf")
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"Unsupported quantization: {quantization}. Supported: {', '.join(QUANTIZATION_MODES)}")
+        self._embedding = embedding
+        self.path = path
+        self.index_type = index_type
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self.pq_segments = pq_segments
+        self._lock = threading.RLock()
+        self._clear()
+        self._version = None
+        self._dirty = False
+        if path:
+            self.refresh()
+
+    def _clear(self):
+        # Rows [0, base size) are the memory-mapped file, read-only; later rows live in the tail buffer
+        self._base = None
+        self._tail = None
+        self._tail_size = 0
+        # New vectors of replaced base rows, and rows deleted since the last persist
+        self._overrides = {}
+        self._deleted = set()
+        self._ids = []
+        self._texts = []
+        self._metadatas = []
+        self._rows = {}
+        self._centroids = None
+        self._lists = None
+        self._trained_size = 0
+        self._quantizer = None
+        self._codes = None
+        self._quantized_size = 0
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def __len__(self):
+        return len(self._rows)
+
+    @property
+    def index_nbytes(self):
+        """Bytes of the vectors, or compressed codes, that searches scan; grows with the store."""
+        with self._lock:
+            if not self._rows:
+                return 0
+            if not self._uses_codes():
+                return len(self._rows) * self._dimensions * np.dtype(np.float32).itemsize
+            return self._quantized_codes().nbytes
+
+    @property
+    def codebook_nbytes(self):
+        """Bytes of the quantizer's own tables (PQ codebooks, SQ ranges); fixed, whatever the store's size."""
+        with self._lock:
+            if not self._rows or not self._uses_codes():
+                return 0
+            self._quantized_codes()
+            return self._quantizer.nbytes
+
+    def _uses_codes(self):
+        return self.quantization != "none" and len(self._rows) >= min_training_vectors(self.quantization)
+
+    @property
+    def _base_size(self):
+        return 0 if self._base is None else self._base.shape[0]
+
+    @property
+    def _dimensions(self):
+        matrix = self._base if self._base is not None else self._tail
+        return None if matrix is None else matrix.shape[1]
+
+    @property
+    def _vectors_path(self):
+        return os.path.join(self.path, "vectors.npy")
+
+    @property
+    def _records_path(self):
+        return os.path.join(self.path, "records.json")
+
+    def _load(self):
+        with open(self._records_path, "r") as f:
+            records = json.load(f)
+        self._ids = records["ids"]
+        self._texts = records["texts"]
+        self._metadatas = records["metadatas"]
+        self._rows = {doc_id: row for row, doc_id in enumerate(self._ids)}
+        if self._ids:
+            self._base = np.load(self._vectors_path, mmap_mode="r")
+            self._check_quantization(self._dimensions)
+        logger.info(f"Loaded {len(self._ids)} vector(s) from {self.path}")
+
+    def persist(self):
+        """Write vectors and records to ``path`` (atomically replacing old files).
+
+        The memory-mapped rows, their replacements and the in-memory tail are
+        merged block by block into a new file, which is then mapped in place
+        of the old one; deleted rows are dropped.
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            alive = np.array([row for row, doc_id in enumerate(self._ids) if doc_id is not None], dtype=np.int64)
+            with file_lock(self.path):
+                os.makedirs(self.path, exist_ok=True)
+                tmp_vectors = os.path.join(self.path, "vectors.tmp.npy")
+                if len(alive):
+                    merged = np.lib.format.open_memmap(tmp_vectors, mode="w+", dtype=np.float32,
+                                                       shape=(len(alive), self._dimensions))
+                    for start in range(0, len(alive), _BLOCK_ROWS):
+                        merged[start:start + _BLOCK_ROWS] = self._row_vectors(alive[start:start + _BLOCK_ROWS])
+                    merged.flush()
+                    del merged
+                else:
+                    np.save(tmp_vectors, np.empty((0, 0), dtype=np.float32))
+                os.replace(tmp_vectors, self._vectors_path)
+                ids = [self._ids[row] for row in alive]
+                texts = [self._texts[row] for row in alive]
+                metadatas = [self._metadatas[row] for row in alive]
+                tmp_records = f"{self._records_path}.tmp"
+                with open(tmp_records, "w") as f:
+                    json.dump({"ids": ids, "texts": texts, "metadatas": metadatas}, f)
+                # Written last: its version stands for both files
+                os.replace(tmp_records, self._records_path)
+                self._version = file_version(self._records_path)
+            self._compact(alive, ids, texts, metadatas)
+            self._dirty = False
+
+    def _compact(self, alive, ids, texts, metadatas):
+        """Renumber rows to match the file just written and map it as the new base."""
+        if self._deleted:
+            new_rows = np.full(len(self._ids), -1, dtype=np.int64)
+            new_rows[alive] = np.arange(len(alive))
+            if self._codes is not None:
+                self._codes = self._codes[alive]
+            if self._lists is not None:
+                self._lists = [new_rows[rows][new_rows[rows] >= 0] for rows in self._lists]
+        self._ids, self._texts, self._metadatas = ids, texts, metadatas
+        self._rows = {doc_id: row for row, doc_id in enumerate(ids)}
+        self._base = np.load(self._vectors_path, mmap_mode="r") if ids else None
+        self._tail, self._tail_size = None, 0
+        self._overrides, self._deleted = {}, set()
+
+    def refresh(self):
+        """Reload the store if another process saved it since it was loaded."""
+        if not self.path:
+            return
+        with self._lock:
+            if self._dirty or file_version(self._records_path) == self._version:
+                return
+            self._clear()
+            with file_lock(self.path, shared=True):
+                self._version = file_version(self._records_path)
+                if self._version is not None:
+                    self._load()
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [Document(page_content=text, metadata=metadata) for text, metadata in zip(texts, metadatas)]
+        vectors = self._embedding.embed_documents(texts)
+        if ids is None:
+            from rag_pipeline.manifest import assign_chunk_ids
+            ids = assign_chunk_ids(documents)
+        return self.add_vectors(documents, vectors, ids)
+
+    def add_vectors(self, documents, vectors, ids):
+        """Upsert documents with precomputed vectors; existing ids are replaced.
+
+        New rows go to the in-memory tail and replaced rows of the memory-mapped
+        file are kept aside, so the file is never copied into memory.
+        """
+        vectors = _normalize(vectors)
+        with self._lock:
+            if self._dimensions is None:
+                self._check_quantization(vectors.shape[1])
+            appended = []
+            replaced = {}
+            for doc, vector, doc_id in zip(documents, vectors, ids):
+                row = self._rows.get(doc_id)
+                if row is None:
+                    self._rows[doc_id] = len(self._ids)
+                    self._ids.append(doc_id)
+                    self._texts.append(doc.page_content)
+                    self._metadatas.append(dict(doc.metadata))
+                    appended.append(vector)
+                else:
+                    self._texts[row] = doc.page_content
+                    self._metadatas[row] = dict(doc.metadata)
+                    replaced[row] = vector
+            first_new_row = len(self._ids) - len(appended)
+            if appended:
+                self._append(np.vstack(appended))
+            for row, vector in replaced.items():
+                if row < self._base_size:
+                    self._overrides[row] = vector
+                else:
+                    self._tail[row - self._base_size] = vector
+            self._assign_to_lists(first_new_row, replaced)
+            self._encode_appended(first_new_row, replaced)
+            self._dirty = True
+        return list(ids)
+
+    def _check_quantization(self, dimensions):
+        """Fail on settings the quantizer can't use now, while ingesting or loading, rather than in a later search."""
+        if self.quantization != "none":
+            make_quantizer(self.quantization, dimensions, self.pq_segments)
+
+    def _append(self, vectors):
+        """Add rows to the tail buffer, growing it geometrically."""
+        size = self._tail_size + vectors.shape[0]
+        if self._tail is None or self._tail.shape[0] < size:
+            capacity = max(size, 2 * self._tail_size, 256)
+            tail = np.empty((capacity, vectors.shape[1]), dtype=np.float32)
+            tail[:self._tail_size] = self._tail[:self._tail_size] if self._tail is not None else 0
+            self._tail = tail
+        self._tail[self._tail_size:size] = vectors
+        self._tail_size = size
+
+    def delete(self, ids=None, **kwargs):
+        """Mark rows deleted; they are skipped by searches and dropped on ``persist``."""
+        if not ids:
+            return False
+        with self._lock:
+            drop = {self._rows.pop(doc_id) for doc_id in ids if doc_id in self._rows}
+            if not drop:
+                return False
+            for row in drop:
+                self._ids[row] = None
+                self._texts[row] = None
+                self._metadatas[row] = None
+                self._overrides.pop(row, None)
+            self._deleted.update(drop)
+            self._dirty = True
+        return True
+
+    def update_metadata(self, updates):
+        """Merge ``{id: metadata}`` into stored documents' metadata."""
+        with self._lock:
+            for doc_id, metadata in updates.items():
+                row = self._rows.get(doc_id)
+                if row is not None:
+                    self._metadatas[row] = dict(self._metadatas[row], **metadata)
+                    self._dirty = True
+
+    def get_by_ids(self, ids):
+        self.refresh()
+        with self._lock:
+            return [self._document(self._rows[doc_id]) for doc_id in ids if doc_id in self._rows]
+
+    def vectors_by_ids(self, ids):
+        """Stored unit vectors of the chunks with these IDs, as ``{id: vector}``; unknown IDs are left out."""
+        self.refresh()
+        with self._lock:
+            found = [doc_id for doc_id in ids if doc_id in self._rows]
+            return dict(zip(found, self._row_vectors([self._rows[doc_id] for doc_id in found])))
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_score(self._embedding.embed_query(query), k)
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_by_vector_with_score(self, embedding, k=4):
+        self.refresh()
+        with self._lock:
+            rows, scores = self._search(_normalize(embedding), k)
+            return [(self._document(row), float(score)) for row, score in zip(rows, scores)]
+
+    def similarity_search_with_vectors(self, query, k=4, query_vector=None):
+        """Return up to ``k`` (Document, unit vector) pairs, best first."""
+        if query_vector is None:
+            query_vector = self._embedding.embed_query(query)
+        self.refresh()
+        with self._lock:
+            rows, _ = self._search(_normalize(query_vector), k)
+            return [(self._document(row), vector) for row, vector in zip(rows, self._row_vectors(rows))]
+
+    @property
+    def batch_group(self):
+        """Searches of the same store can be run as one batch."""
+        return id(self)
+
+    @classmethod
+    def batch_similarity_search_with_vectors(cls, searches):
+        """``similarity_search_with_vectors`` results for ``[(store, query vector, k)]`` on one store.
+
+        An exact scan scores every query with one matrix-matrix product.
+        """
+        store = searches[0][0]
+        queries = _normalize([query_vector for _, query_vector, _ in searches])
+        k = max(k for _, _, k in searches)
+        store.refresh()
+        with store._lock:
+            if not store._rows:
+                return [[] for _ in searches]
+            if store._uses_codes() or (store.index_type == "ivf" and len(store._ids) >= _IVF_MIN_VECTORS):
+                top_rows = [store._search(query, k)[0] for query in queries]
+            else:
+                top_rows = [_top_k(scores, min(k, len(store._rows))) for scores in store._scores(queries)]
+            return [
+                [(store._document(row), vector) for row, vector in zip(rows[:search_k], store._row_vectors(rows[:search_k]))]
+                for rows, (_, _, search_k) in zip(top_rows, searches)
+            ]
+
+    def _select_relevance_score_fn(self):
+        # Scores are cosine similarities in [-1, 1]
+        return lambda score: (score + 1.0) / 2.0
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, **kwargs):
+        store = cls(embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    def _document(self, row):
+        return Document(id=self._ids[row], page_content=self._texts[row], metadata=dict(self._metadatas[row]))
+
+    def _row_vectors(self, rows):
+        """Full-precision vectors of ``rows``, from the memory-mapped file, its replacements or the tail."""
+        rows = np.asarray(rows, dtype=np.int64)
+        vectors = np.empty((len(rows), self._dimensions or 0), dtype=np.float32)
+        in_base = rows < self._base_size
+        if in_base.any():
+            vectors[in_base] = self._base[rows[in_base]]
+        if not in_base.all():
+            vectors[~in_base] = self._tail[rows[~in_base] - self._base_size]
+        if self._overrides:
+            for index in np.flatnonzero(in_base):
+                vector = self._overrides.get(int(rows[index]))
+                if vector is not None:
+                    vectors[index] = vector
+        return vectors
+
+    def _blocks(self):
+        """(first row, vectors) for all rows, ``_BLOCK_ROWS`` at a time."""
+        for start in range(0, len(self._ids), _BLOCK_ROWS):
+            yield start, self._row_vectors(np.arange(start, min(start + _BLOCK_ROWS, len(self._ids))))
+
+    def _scores(self, queries):
+        """Scores of every row for each of ``queries`` (one row per query); deleted rows score -inf."""
+        parts = []
+        if self._base is not None:
+            parts.append(queries @ self._base.T)
+        if self._tail_size:
+            parts.append(queries @ self._tail[:self._tail_size].T)
+        scores = np.concatenate(parts, axis=1)
+        for row, vector in self._overrides.items():
+            scores[:, row] = queries @ vector
+        if self._deleted:
+            scores[:, list(self._deleted)] = -np.inf
+        return scores
+
+    def _live(self, rows):
+        if not self._deleted:
+            return rows
+        return rows[~np.isin(rows, list(self._deleted))]
+
+    def _search(self, query, k):
+        k = min(k, len(self._rows))
+        if not k:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        candidates = self._ivf_candidates(query) if self.index_type == "ivf" else None
+        if self._uses_codes():
+            return self._quantized_search(query, k, candidates)
+        if candidates is None:
+            scores = self._scores(query[None, :])[0]
+            top = _top_k(scores, k)
+            return top, scores[top]
+        scores = self._row_vectors(candidates) @ query
+        top = _top_k(scores, k)
+        return candidates[top], scores[top]
+
+    def _quantized_search(self, query, k, candidates):
+        codes = self._quantized_codes()
+        if candidates is None:
+            approximate = self._quantizer.scores(query, codes).astype(np.float32)
+            if self._deleted:
+                approximate[list(self._deleted)] = -np.inf
+            shortlist = _top_k(approximate, min(k * self.rescore_factor, len(self._rows)))
+        else:
+            approximate = self._quantizer.scores(query, codes[candidates])
+            shortlist = candidates[_top_k(approximate, k * self.rescore_factor)]
+        # Scores returned are always exact; with a rescore factor of 1 only the shortlist is approximate.
+        # Sorted rows read the memory-mapped vectors front to back.
+        rows = np.sort(shortlist)
+        scores = self._row_vectors(rows) @ query
+        top = _top_k(scores, k)
+        return rows[top], scores[top]
+
+    def _training_sample(self):
+        rows = self._live(np.arange(len(self._ids)))
+        if len(rows) > _TRAINING_SAMPLE:
+            rows = np.sort(np.random.default_rng(0).choice(rows, _TRAINING_SAMPLE, replace=False))
+        return self._row_vectors(rows)
+
+    def _quantized_codes(self):
+        size = len(self._rows)
+        # Retrain once the index has doubled since the quantizer was fitted, like IVF
+        if self._codes is None or size > 2 * self._quantized_size:
+            self._quantizer = make_quantizer(self.quantization, self._dimensions, self.pq_segments)
+            self._quantizer.fit(self._training_sample())
+            self._codes = np.concatenate([self._quantizer.encode(vectors) for _, vectors in self._blocks()])
+            self._quantized_size = size
+            logger.info(f"Trained {self.quantization} quantizer over {size} vector(s)")
+        return self._codes
+
+    def _encode_appended(self, first_new_row, replaced):
+        if self._codes is None:
+            return
+        if replaced:
+            rows = list(replaced)
+            self._codes[rows] = self._quantizer.encode(self._row_vectors(rows))
+        if first_new_row < len(self._ids):
+            new_rows = np.arange(first_new_row, len(self._ids))
+            self._codes = np.concatenate([self._codes, self._quantizer.encode(self._row_vectors(new_rows))])
+
+    def _ivf_candidates(self, query):
+        size = len(self._rows)
+        if size < _IVF_MIN_VECTORS:
+            return None
+        # Retrain once the index has doubled since the last k-means run
+        if self._centroids is None or size > 2 * self._trained_size:
+            self._train()
+        probe = _top_k(self._centroids @ query, self.n_probe)
+        return self._live(np.concatenate([self._lists[index] for index in probe]))
+
+    def _train(self):
+        size = len(self._rows)
+        n_lists = self.n_lists or max(1, int(np.sqrt(size)))
+        self._centroids = _kmeans(self._training_sample(), n_lists)
+        assignment = np.concatenate([np.argmax(vectors @ self._centroids.T, axis=1) for _, vectors in self._blocks()])
+        self._lists = [self._live(np.flatnonzero(assignment == index)) for index in range(n_lists)]
+        self._trained_size = size
+        logger.info(f"Trained IVF index with {n_lists} list(s) over {size} vector(s)")
+
+    def _assign_to_lists(self, first_new_row, replaced):
+        if self._centroids is None:
+            return
+        if replaced:
+            # Replaced vectors may belong to a different list now
+            self._centroids = None
+            return
+        new_rows = np.arange(first_new_row, len(self._ids))
+        if not len(new_rows):
+            return
+        assignment = np.argmax(self._row_vectors(new_rows) @ self._centroids.T, axis=1)
+        for index in np.unique(assignment):
+            self._lists[index] = np.concatenate([self._lists[index], new_rows[assignment == index]])
+
+
+_open_stores = {}
+_open_stores_lock = threading.Lock()
+
+
+def get_local_vector_store(path, embedding, index_type="exact", n_lists=None, n_probe=8,
+                           quantization="none", rescore_factor=4, pq_segments=None):
+    """Return the process-wide LocalVectorStore for ``path``, opening it once."""
+    with _open_stores_lock:
+        store = _open_stores.get(path)
+        if store is None:
+            store = LocalVectorStore(embedding, path=path, index_type=index_type, n_lists=n_lists, n_probe=n_probe,
+                                     quantization=quantization, rescore_factor=rescore_factor,
+                                     pq_segments=pq_segments)
+            _open_stores[path] = store
+        return store
+
+
+def release_local_vector_store(path):
+    """Persist and close the store opened for ``path``; it is reloaded (memory-mapped) on next use."""
+    with _open_stores_lock:
+        store = _open_stores.pop(path, None)
+    if store is not None:
+        store.persist()
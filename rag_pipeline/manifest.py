@@ -0,0 +1,134 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import threading
+from contextlib import contextmanager
+from rag_pipeline.shared_files import file_lock, file_version
+
+logger = logging.getLogger(__name__)
+
+# Fixed namespace so the same chunk always maps to the same Weaviate object ID
+CHUNK_NAMESPACE = uuid.UUID("6f1c2d4e-8a57-4c1b-9d3e-2b7f0a9c5e11")
+
+
+def file_fingerprint(data):
+    """SHA-256 of a file's bytes; accepts raw bytes or a path on disk."""
+    digest = hashlib.sha256()
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        digest.update(data)
+    else:
+        with open(data, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_id(source, content, occurrence=0):
+    """Deterministic UUID for a chunk, derived from its source file and text."""
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{source}\x00{occurrence}\x00{content}"))
+
+
+def assign_chunk_ids(chunks, seen=None):
+    """Return one ID per chunk; repeated text within a file gets distinct IDs.
+
+    Pass the same ``seen`` dict across calls to number repeats consistently
+    when chunks arrive in several batches.
+    """
+    seen = {} if seen is None else seen
+    ids = []
+    for chunk in chunks:
+        source = chunk.metadata.get("source", "")
+        # Keyed by a digest so long streams don't keep every chunk's text alive
+        key = (source, hashlib.sha1(chunk.page_content.encode("utf-8")).digest())
+        occurrence = seen.get(key, 0)
+        seen[key] = occurrence + 1
+        ids.append(chunk_id(source, chunk.page_content, occurrence))
+    return ids
+
+
+class IngestManifest:
+    """JSON record of which files, and which of their chunk IDs, each collection holds.
+
+    Several processes (server workers) may share ``path``. Every change
+    re-reads the file under a lock and rewrites it with only that entry
+    changed, so concurrent jobs never drop each other's entries, and reads
+    reload the file whenever another process has replaced it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {}
+        self._version = None
+        with self._lock:
+            self._refresh()
+
+    def is_unchanged(self, collection, source, fingerprint):
+        with self._lock:
+            self._refresh()
+            entry = self._data.get(collection, {}).get(source)
+        return entry is not None and entry["fingerprint"] == fingerprint
+
+    def chunk_ids(self, collection, source):
+        with self._lock:
+            self._refresh()
+            entry = self._data.get(collection, {}).get(source)
+        return set(entry["chunk_ids"]) if entry else set()
+
+    def sources(self, collection):
+        with self._lock:
+            self._refresh()
+            return list(self._data.get(collection, {}))
+
+    def record(self, collection, source, fingerprint, chunk_ids):
+        with self._update():
+            self._data.setdefault(collection, {})[source] = {
+                "fingerprint": fingerprint,
+                "chunk_ids": sorted(chunk_ids),
+            }
+
+    def invalidate(self, collection, source):
+        """Keep a file's chunk IDs but force it to be re-processed next time."""
+        with self._update():
+            entry = self._data.get(collection, {}).get(source)
+            if entry is not None:
+                entry["fingerprint"] = None
+
+    def forget(self, collection, source=None):
+        with self._update():
+            if source is None:
+                self._data.pop(collection, None)
+            else:
+                self._data.get(collection, {}).pop(source, None)
+
+    @contextmanager
+    def _update(self):
+        with self._lock, file_lock(self.path):
+            self._refresh()
+            yield
+            self._save()
+
+    def _refresh(self):
+        version = file_version(self.path)
+        if version == self._version:
+            return
+        self._data = {}
+        if version is not None:
+            try:
+                with open(self.path, "r") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Ignoring unreadable ingest manifest {self.path}: {e}")
+        self._version = version
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._data, f)
+        os.replace(tmp_path, self.path)
+        self._version = file_version(self.path)
@@ -0,0 +1,195 @@
+import time
+import bisect
+import logging
+import threading
+import functools
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+DESCRIPTIONS = {
+    "rag_stage_duration_seconds": "Latency of pipeline stages",
+    "rag_stage_errors_total": "Errors raised by pipeline stages",
+    "rag_pages_loaded_total": "Pages (or whole text files) parsed from uploaded documents",
+    "rag_chunks_total": "Chunks split from documents, chunks embedded and stored, and duplicate chunks not embedded",
+    "rag_tokens_total": "Estimated or reported LLM prompt and completion tokens, and prompt tokens removed by context compression",
+    "rag_answers_total": "Answers generated or served from the answer cache",
+    "rag_time_to_first_token_seconds": "Time from question to first streamed answer token",
+    "rag_query_batches_total": "Micro-batches of query embeddings and vector searches",
+    "rag_query_batch_requests_total": "Query embeddings and vector searches sent in micro-batches",
+}
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Thread-safe in-process counters and latency histograms.
+
+    Metrics are identified by name plus keyword labels, e.g.
+    ``metrics.inc("rag_chunks_total", 64, stage="embedded")``. ``span``
+    times a block as ``rag_stage_duration_seconds{stage=...}`` and counts
+    exceptions in ``rag_stage_errors_total``. ``render`` returns the
+    Prometheus text exposition format.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.buckets)
+            histogram.observe(value)
+
+    @contextmanager
+    def span(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.inc("rag_stage_errors_total", stage=stage)
+            raise
+        finally:
+            self.observe("rag_stage_duration_seconds", time.perf_counter() - started, stage=stage)
+
+    def timed(self, stage):
+        """Decorator form of ``span``."""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(stage):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def timed_iter(self, stage, iterable):
+        """Yield from ``iterable``, timing only the time spent producing items.
+
+        The total is recorded as one observation once the iterable is exhausted,
+        so a lazy loader is not charged for the time its consumer spends.
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        while True:
+            started = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                elapsed += time.perf_counter() - started
+                break
+            except BaseException:
+                self.inc("rag_stage_errors_total", stage=stage)
+                self.observe("rag_stage_duration_seconds", elapsed + time.perf_counter() - started, stage=stage)
+                raise
+            elapsed += time.perf_counter() - started
+            yield item
+        self.observe("rag_stage_duration_seconds", elapsed, stage=stage)
+
+    def snapshot(self):
+        """Counters and histogram summaries as plain dicts, for display."""
+        with self._lock:
+            counters = {_series(name, labels): value for (name, labels), value in self._counters.items()}
+            histograms = {
+                _series(name, labels): {"count": h.count, "sum": h.sum, "mean": h.sum / h.count if h.count else 0.0}
+                for (name, labels), h in self._histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def render(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items(), key=lambda item: item[0])
+            described = set()
+            for (name, labels), value in counters:
+                _describe(lines, described, name, "counter")
+                lines.append(f"{_series(name, labels)} {value}")
+            for (name, labels), histogram in histograms:
+                _describe(lines, described, name, "histogram")
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{_series(name + '_bucket', labels + (('le', le),))} {cumulative}")
+                lines.append(f"{_series(name + '_sum', labels)} {histogram.sum}")
+                lines.append(f"{_series(name + '_count', labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _series(name, labels):
+    if not labels:
+        return name
+    rendered = ",".join(f'{key}="{str(value)}"' for key, value in labels)
+    return f"{name}{{{rendered}}}"
+
+
+def _describe(lines, described, name, kind):
+    if name in described:
+        return
+    described.add(name)
+    if name in DESCRIPTIONS:
+        lines.append(f"# HELP {name} {DESCRIPTIONS[name]}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+metrics = Metrics()
+
+_server = None
+_server_lock = threading.Lock()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = metrics.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Serve ``/metrics`` from a daemon thread; later calls reuse the running server."""
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return _server
+        try:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.error(f"Could not start metrics endpoint on port {port}: {e}")
+            return None
+        threading.Thread(target=_server.serve_forever, name="metrics-server", daemon=True).start()
+        logger.info(f"Serving Prometheus metrics on http://{host}:{port}/metrics")
+        return _server
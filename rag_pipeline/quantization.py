@@ -0,0 +1,155 @@
+import numpy as np
+
+# "none" keeps float32 vectors; the others compress the index the search scans
+QUANTIZATION_MODES = ("none", "sq", "bq", "pq")
+# Codes are scored this many rows at a time, bounding the temporary float32 copy
+_BLOCK_ROWS = 65536
+_TRAINING_SAMPLE = 20_000
+_KMEANS_ITERATIONS = 10
+_POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+# Centroids per PQ segment (one-byte codes); PQ is only trained on at least this many vectors
+PQ_CENTROIDS = 256
+
+
+def _blocks(codes):
+    for start in range(0, len(codes), _BLOCK_ROWS):
+        yield codes[start:start + _BLOCK_ROWS]
+
+
+def _sample(vectors, seed=0):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.shape[0] > _TRAINING_SAMPLE:
+        rng = np.random.default_rng(seed)
+        vectors = vectors[rng.choice(vectors.shape[0], _TRAINING_SAMPLE, replace=False)]
+    return vectors
+
+
+class ScalarQuantizer:
+    """8-bit scalar quantization: each dimension's range is split into 256 levels (4x smaller).
+
+    Scores are the dot product of the float query with the decoded vectors.
+    """
+
+    def fit(self, vectors):
+        sample = _sample(vectors)
+        self.low = sample.min(axis=0)
+        self.scale = (sample.max(axis=0) - self.low) / 255.0
+        self.scale[self.scale == 0] = 1.0
+        return self
+
+    def encode(self, vectors):
+        levels = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.scale)
+        return np.clip(levels, 0, 255).astype(np.uint8)
+
+    def scores(self, query, codes):
+        weights = (query * self.scale).astype(np.float32)
+        offset = float(query @ self.low)
+        return np.concatenate([block.astype(np.float32) @ weights for block in _blocks(codes)]) + offset
+
+    @property
+    def nbytes(self):
+        return self.low.nbytes + self.scale.nbytes
+
+
+class BinaryQuantizer:
+    """1-bit quantization: the sign of each dimension (32x smaller), scored by Hamming distance."""
+
+    def fit(self, vectors):
+        return self
+
+    def encode(self, vectors):
+        return np.packbits(np.asarray(vectors) > 0, axis=1)
+
+    def scores(self, query, codes):
+        bits = np.packbits(query > 0)
+        return -np.concatenate([_POPCOUNT[block ^ bits].sum(axis=1, dtype=np.int32) for block in _blocks(codes)])
+
+    @property
+    def nbytes(self):
+        return 0
+
+
+class ProductQuantizer:
+    """Product quantization: each of ``segments`` sub-vectors is replaced by the nearest of
+    ``centroids`` k-means centroids, stored as a one-byte code.
+
+    Scores use a per-query lookup table of sub-vector dot products (asymmetric distance).
+    """
+
+    def __init__(self, segments, centroids=PQ_CENTROIDS):
+        self.segments = segments
+        self.centroids = centroids
+
+    def fit(self, vectors, seed=0):
+        sample = _sample(vectors, seed)
+        if sample.shape[1] % self.segments:
+            raise ValueError(f"PQ segments ({self.segments}) must divide the vector dimensions ({sample.shape[1]})")
+        if sample.shape[0] < self.centroids:
+            # With fewer vectors than centroids each vector would become its own centroid
+            raise ValueError(f"PQ needs at least {self.centroids} training vectors, got {sample.shape[0]}")
+        rng = np.random.default_rng(seed)
+        self.codebooks = []
+        for part in np.split(sample, self.segments, axis=1):
+            codebook = part[rng.choice(part.shape[0], self.centroids, replace=False)].copy()
+            for _ in range(_KMEANS_ITERATIONS):
+                assignment = self._nearest(part, codebook)
+                counts = np.bincount(assignment, minlength=self.centroids)
+                sums = np.stack([np.bincount(assignment, weights=column, minlength=self.centroids)
+                                 for column in part.T], axis=1)
+                filled = counts > 0
+                codebook[filled] = sums[filled] / counts[filled, None]
+            self.codebooks.append(codebook)
+        self.codebooks = np.stack(self.codebooks)
+        return self
+
+    @staticmethod
+    def _nearest(part, codebook):
+        distances = (part ** 2).sum(axis=1, keepdims=True) - 2 * part @ codebook.T + (codebook ** 2).sum(axis=1)
+        return np.argmin(distances, axis=1)
+
+    def encode(self, vectors):
+        parts = np.split(np.asarray(vectors, dtype=np.float32), self.segments, axis=1)
+        return np.stack([self._nearest(part, codebook) for part, codebook in zip(parts, self.codebooks)],
+                        axis=1).astype(np.uint8)
+
+    def scores(self, query, codes):
+        table = np.einsum("scd,sd->sc", self.codebooks, query.reshape(self.segments, -1))
+        segments = np.arange(self.segments)
+        return np.concatenate([table[segments, block].sum(axis=1) for block in _blocks(codes)])
+
+    @property
+    def nbytes(self):
+        return self.codebooks.nbytes
+
+
+def min_training_vectors(mode):
+    """Fewest vectors a quantizer can be trained on; smaller indexes are searched uncompressed."""
+    return PQ_CENTROIDS if mode == "pq" else 1
+
+
+def make_quantizer(mode, dimensions, pq_segments=None):
+    """Untrained quantizer for a mode other than "none"; PQ defaults to one segment per 8 dimensions.
+
+    Raises ValueError for PQ segments that don't divide ``dimensions``.
+    """
+    if mode == "sq":
+        return ScalarQuantizer()
+    if mode == "bq":
+        return BinaryQuantizer()
+    if mode == "pq":
+        segments = pq_segments or (dimensions // 8 if dimensions % 8 == 0 else dimensions)
+        if segments <= 0 or dimensions % segments:
+            raise ValueError(f"PQ segments ({segments}) must divide the vector dimensions ({dimensions})")
+        return ProductQuantizer(segments)
+    raise ValueError(f"Unsupported vector quantization: {mode}. Supported: {', '.join(QUANTIZATION_MODES)}")
+
+
+def rescore(query_vector, pairs, k):
+    """Re-rank (Document, vector) pairs by full-precision cosine similarity and keep the best ``k``."""
+    if not pairs:
+        return pairs
+    vectors = np.asarray([vector for _, vector in pairs], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1)
+    norms[norms == 0] = 1.0
+    scores = (vectors @ np.asarray(query_vector, dtype=np.float32)) / norms
+    return [pairs[index] for index in np.argsort(-scores, kind="stable")[:k]]
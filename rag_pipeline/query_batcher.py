@@ -0,0 +1,166 @@
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from rag_pipeline.embedding_cache import embed_queries
+from rag_pipeline.keyword_index import search_with_vectors
+from rag_pipeline.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    __slots__ = ("embeddings", "text", "vector_store", "k", "query_vector", "future")
+
+    def __init__(self, embeddings, text, vector_store=None, k=0, query_vector=None):
+        self.embeddings = embeddings
+        self.text = text
+        self.vector_store = vector_store
+        self.k = k
+        self.query_vector = query_vector
+        self.future = Future()
+
+
+class QueryBatcher:
+    """Coalesces concurrent query embeddings and vector searches into batched calls.
+
+    ``embed_query`` and ``search`` block their caller until its batch is done.
+    A collector thread waits up to ``window`` seconds after the first request
+    (or until ``max_batch_size`` are waiting), then the batch embeds every
+    text not embedded yet with one ``embed_queries`` call per embedder and
+    runs its searches as one request per store group (see
+    ``batch_similarity_search_with_vectors``). Up to ``workers`` batches run at
+    once, so a slow batch doesn't hold up collecting the next one. A
+    ``max_batch_size`` of 1 disables batching: calls run in the caller's thread.
+    """
+
+    def __init__(self, window=0.005, max_batch_size=32, workers=4):
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query-batch")
+        self._collector = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def embed_query(self, embeddings, text):
+        """Query embedding of ``text``, embedded together with concurrent callers' queries."""
+        if self.max_batch_size <= 1:
+            return embeddings.embed_query(text)
+        return self._submit(_Request(embeddings, text))
+
+    def search(self, vector_store, query, k, query_vector=None):
+        """Returns (query vector, [(Document, vector)]) like ``search_with_vectors`` on ``vector_store``."""
+        if self.max_batch_size <= 1:
+            if query_vector is None:
+                query_vector = vector_store.embeddings.embed_query(query)
+            return query_vector, search_with_vectors(vector_store, query, k=k, query_vector=query_vector)
+        return self._submit(_Request(vector_store.embeddings, query, vector_store, k, query_vector))
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            collector = self._collector
+            if collector is not None:
+                self._queue.put(None)
+        if collector is not None:
+            collector.join(timeout=1.0)
+        self._executor.shutdown(wait=False)
+
+    def _submit(self, request):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Query batcher is closed")
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect, name="query-batcher", daemon=True)
+                self._collector.start()
+        self._queue.put(request)
+        return request.future.result()
+
+    def _collect(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self._executor.submit(self._run, batch)
+                    return
+                batch.append(request)
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            metrics.inc("rag_query_batches_total")
+            metrics.inc("rag_query_batch_requests_total", len(batch))
+            self._embed(batch)
+            searches = [request for request in batch if request.vector_store is not None and not request.future.done()]
+            for request in batch:
+                if request.vector_store is None and not request.future.done():
+                    request.future.set_result(request.query_vector)
+            if searches:
+                self._search(searches)
+        except Exception as e:
+            logger.error(f"Query batch failed: {e}")
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+
+    def _embed(self, batch):
+        by_embedder = {}
+        for request in batch:
+            if request.query_vector is None:
+                by_embedder.setdefault(id(request.embeddings), []).append(request)
+        for requests in by_embedder.values():
+            # Repeated questions are only embedded once
+            texts = list(dict.fromkeys(request.text for request in requests))
+            try:
+                with metrics.span("embed_query_batch"):
+                    vectors = dict(zip(texts, embed_queries(requests[0].embeddings, texts)))
+            except Exception as e:
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+            for request in requests:
+                request.query_vector = vectors[request.text]
+
+    def _search(self, searches):
+        groups, single = {}, []
+        for request in searches:
+            group = getattr(request.vector_store, "batch_group", None)
+            if group is None:
+                single.append(request)
+            else:
+                groups.setdefault((type(request.vector_store), group), []).append(request)
+        for (store_type, _), requests in groups.items():
+            try:
+                with metrics.span("vector_search_batch"):
+                    results = store_type.batch_similarity_search_with_vectors(
+                        [(request.vector_store, request.query_vector, request.k) for request in requests]
+                    )
+            except Exception as e:
+                for request in requests:
+                    request.future.set_exception(e)
+                continue
+            for request, pairs in zip(requests, results):
+                request.future.set_result((request.query_vector, pairs))
+        for request in single:
+            # Stores without a batched search are searched one by one, in parallel
+            self._executor.submit(self._search_one, request)
+
+    def _search_one(self, request):
+        try:
+            pairs = search_with_vectors(request.vector_store, request.text, k=request.k,
+                                        query_vector=request.query_vector)
+        except Exception as e:
+            request.future.set_exception(e)
+            return
+        request.future.set_result((request.query_vector, pairs))
@@ -1,10 +1,57 @@
-import uuid
+import re
+import json
+import time
+import asyncio
 import logging
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import warnings
-from langsmith import traceable
-from langchain_weaviate.vectorstores import WeaviateVectorStore
+from langsmith import traceable, get_current_run_tree
 from langchain_core.prompts import PromptTemplate
-from query_rewriting_agent import QueryRewritingAgent
+from rag_pipeline.manifest import assign_chunk_ids
+from rag_pipeline.file_loader import batched
+from rag_pipeline.config import (
+    INGEST_BATCH_SIZE,
+    EMBED_MAX_CONCURRENCY,
+    VECTOR_BACKEND,
+    LOCAL_INDEX_TYPE,
+    LOCAL_IVF_LISTS,
+    LOCAL_IVF_PROBE,
+    VECTOR_QUANTIZATION,
+    VECTOR_RESCORE_FACTOR,
+    PQ_SEGMENTS,
+    REWRITE_SKIP_MIN_WORDS,
+    REWRITE_TIMEOUT_SECONDS,
+    QUERY_WORKER_THREADS,
+    REWRITE_CONCURRENCY,
+    TRACE_BACKLOG_LIMIT,
+    RETRIEVAL_FETCH_K,
+    MMR_LAMBDA,
+    CONTEXT_RELATIVE_RELEVANCE,
+    CONTEXT_TOKEN_BUDGET,
+    CONTEXT_MAX_CHUNKS,
+    CONTEXT_COMPRESSION_ENABLED,
+    CONTEXT_COMPRESSION_RATIO,
+    CONTEXT_COMPRESSION_TOKENS,
+    HYBRID_SEARCH_ENABLED,
+    HYBRID_FETCH_K,
+    RRF_K,
+)
+from rag_pipeline.embedding_scheduler import EmbeddingScheduler
+from rag_pipeline.weviate_helper import DocumentVectorStore
+from rag_pipeline.local_vector_store import get_local_vector_store
+from rag_pipeline.tenants import tenant_scope, local_store_path, keyword_index_path
+from rag_pipeline.answer_cache import notify_corpus_changed
+from rag_pipeline.tokens import estimate_tokens
+from rag_pipeline.keyword_index import (
+    HybridRetriever, get_keyword_index, reciprocal_rank_fusion, attach_vectors
+)
+from rag_pipeline.context import mmr_rerank, pack_context, format_context, compress_documents
+from rag_pipeline.dedup import chunk_reference
+from rag_pipeline.resources import get_langsmith_client, get_query_agent, get_query_batcher
+from rag_pipeline.tracing import new_trace_run_id, untraced
+from rag_pipeline.metrics import metrics
 
 # Suppress LangSmith deprecation warning
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="langsmith.run_helpers")
@@ -17,24 +64,244 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+def connect_vector_store(collection_name, client, embeddings, tenant=None):
+    """Open the configured vector store backend for a collection.
+
+    VECTOR_BACKEND=local returns the in-process NumPy index persisted under
+    LOCAL_VECTOR_STORE_DIR (``client`` is unused); otherwise the Weaviate
+    collection is opened through ``client``. With a ``tenant`` only that
+    tenant's documents are read and written (its own local index, or its
+    shard of a multi-tenant Weaviate class). With VECTOR_QUANTIZATION both
+    backends search compressed vectors and rescore the best candidates.
+    """
+    if VECTOR_BACKEND == "local":
+        return get_local_vector_store(
+            local_store_path(tenant_scope(collection_name, tenant)),
+            embeddings,
+            index_type=LOCAL_INDEX_TYPE,
+            n_lists=LOCAL_IVF_LISTS,
+            n_probe=LOCAL_IVF_PROBE,
+            quantization=VECTOR_QUANTIZATION,
+            rescore_factor=VECTOR_RESCORE_FACTOR,
+            pq_segments=PQ_SEGMENTS
+        )
+    return DocumentVectorStore(
+        client=client,
+        index_name=collection_name,
+        text_key="content",
+        embedding=embeddings,
+        tenant=tenant,
+        rescore_factor=VECTOR_RESCORE_FACTOR if VECTOR_QUANTIZATION != "none" else 1
+    )
+
+def open_vector_store(collection_name, client, embeddings, tenant=None):
+    """``connect_vector_store`` wrapped in hybrid BM25 + vector retrieval when enabled."""
+    vector_store = connect_vector_store(collection_name, client, embeddings, tenant=tenant)
+    if not HYBRID_SEARCH_ENABLED:
+        return vector_store
+    keyword_index = get_keyword_index(keyword_index_path(tenant_scope(collection_name, tenant)))
+    return HybridRetriever(vector_store, keyword_index, fetch_k=HYBRID_FETCH_K, rrf_k=RRF_K)
+
 @traceable
-def store_embeddings(chunks, collection_name, client, embeddings):
+@metrics.timed("store_embeddings")
+def store_embeddings(chunks, collection_name, client, embeddings, manifest=None, fingerprints=None,
+                     batch_size=INGEST_BATCH_SIZE, on_batch=None, max_concurrency=EMBED_MAX_CONCURRENCY,
+                     keyword_index=None, deduplicator=None, tenant=None, checkpoint=None):
+    """Upsert chunks under deterministic IDs, one batch at a time.
+
+    ``chunks`` may be any iterable, including the generator returned by
+    ``iter_chunks``; batches are embedded by an EmbeddingScheduler with up to
+    ``max_concurrency`` requests in flight, and each is written as soon as its
+    vectors arrive, so memory is bounded by the batch size rather than by the
+    corpus.
+
+    With a manifest, chunks already stored for a file are not re-embedded and
+    chunks that disappeared from a changed file are deleted; ``fingerprints``
+    maps each source file name to the file hash recorded in the manifest.
+    ``on_batch`` is called with a progress dict after every written batch
+    and once more at the end.
+    A ``keyword_index`` (BM25Index) is kept in step with the vector store.
+
+    With a ``deduplicator`` (ChunkDeduplicator), a chunk that duplicates one
+    already stored is not embedded; its file, page and section are added to
+    the stored chunk's ``references`` metadata (a JSON list) instead, and a
+    stored chunk is only deleted once no file references it.
+
+    With a ``tenant`` the chunks go to that tenant only, and the manifest
+    and answer cache are keyed by its ``tenant_scope``.
+
+    A ``checkpoint`` (IngestCheckpoint) is told the IDs of every written
+    batch; chunks whose IDs it already holds, from an interrupted earlier
+    run, are treated as stored and not embedded again.
+
+    If ingestion stops part-way (an error, or a job being cancelled), the
+    chunks already written are recorded in the manifest without a file
+    fingerprint, so the next upload of their files processes them again and
+    deletes whatever is stale.
+    """
+    scope = tenant_scope(collection_name, tenant)
+    vector_store = None
+    # Chunks registered with the deduplicator whose batch hasn't been written yet
+    unwritten = set()
+    # Source file of every chunk written by this run or the interrupted run it resumes
+    written = dict(checkpoint.sources) if checkpoint is not None else {}
     try:
-        logger.info(f"Storing embeddings in Weaviate collection: {collection_name}")
-        vector_store = WeaviateVectorStore(
-            client=client,
-            index_name=collection_name,
-            text_key="content",
-            embedding=embeddings
+        logger.info(f"Storing embeddings in Weaviate collection: {collection_name}"
+                    + (f" (tenant {tenant})" if tenant is not None else ""))
+        vector_store = connect_vector_store(collection_name, client, embeddings, tenant=tenant)
+        # Start from what the last job saved, even if it ran in another process
+        for index in (vector_store, keyword_index, deduplicator):
+            if hasattr(index, "refresh"):
+                index.refresh()
+
+        seen = {}
+        current_ids = {}
+        stored_ids = {}
+        progress = {"batches": 0, "chunks": 0, "embedded": 0, "deleted": 0, "duplicates": 0}
+        referenced = set()
+        resumed_ids = checkpoint.ids if checkpoint is not None else set()
+
+        def pending_batches():
+            # Only chunks the manifest doesn't already hold are sent for embedding
+            for batch in batched(chunks, batch_size):
+                new_chunks, new_ids = [], []
+                for chunk, chunk_id in zip(batch, assign_chunk_ids(batch, seen)):
+                    source = chunk.metadata.get("source", "")
+                    if source not in stored_ids:
+                        stored_ids[source] = manifest.chunk_ids(scope, source) if manifest else set()
+                        current_ids[source] = set()
+                        if deduplicator is not None:
+                            # This file's references are re-added as its chunks come in
+                            referenced.update(deduplicator.forget_source(source))
+                    if chunk_id in stored_ids[source] or chunk_id in resumed_ids:
+                        current_ids[source].add(chunk_id)
+                        if deduplicator is not None:
+                            if chunk_id in deduplicator:
+                                deduplicator.add_reference(chunk_id, chunk_reference(chunk))
+                            else:
+                                deduplicator.add(chunk_id, chunk.page_content, chunk_reference(chunk))
+                        continue
+                    if deduplicator is not None:
+                        signature = deduplicator.signature(chunk.page_content)
+                        duplicate_of = deduplicator.find(chunk.page_content, signature)
+                        if duplicate_of is not None:
+                            deduplicator.add_reference(duplicate_of, chunk_reference(chunk))
+                            referenced.add(duplicate_of)
+                            current_ids[source].add(duplicate_of)
+                            progress["duplicates"] += 1
+                            continue
+                        deduplicator.add(chunk_id, chunk.page_content, chunk_reference(chunk), signature)
+                        unwritten.add(chunk_id)
+                    current_ids[source].add(chunk_id)
+                    new_chunks.append(chunk)
+                    new_ids.append(chunk_id)
+                progress["chunks"] += len(batch)
+                yield new_chunks, new_ids
+
+        def on_written(documents, ids):
+            if keyword_index is not None:
+                keyword_index.add(ids, documents)
+            sources = [doc.metadata.get("source", "") for doc in documents]
+            if checkpoint is not None and ids:
+                checkpoint.add(ids, sources)
+            written.update(zip(ids, sources))
+            unwritten.difference_update(ids)
+            progress["batches"] += 1
+            progress["embedded"] += len(documents)
+            metrics.inc("rag_chunks_total", len(documents), stage="embedded")
+            logger.info(f"Stored batch {progress['batches']}: {len(documents)} new chunk(s) embedded")
+            if on_batch:
+                on_batch(dict(progress))
+
+        scheduler = EmbeddingScheduler(embeddings, max_concurrency=max_concurrency)
+        scheduler_stats = scheduler.run(pending_batches(), vector_store.add_vectors, on_written)
+
+        # A chunk is stale once no file uses it, here or in the manifest
+        in_use = set().union(*current_ids.values())
+        if manifest:
+            for source in manifest.sources(scope):
+                if source not in current_ids:
+                    in_use.update(manifest.chunk_ids(scope, source))
+        stale_ids = set()
+        for source, ids in current_ids.items():
+            stale_ids.update(stored_ids[source] - ids - in_use)
+        stale_ids = sorted(stale_ids)
+        if stale_ids:
+            vector_store.delete(ids=stale_ids)
+            if keyword_index is not None:
+                keyword_index.remove(stale_ids)
+        if deduplicator is not None:
+            deduplicator.remove(stale_ids)
+            updates = {
+                chunk_id: {"references": json.dumps(deduplicator.references(chunk_id))}
+                for chunk_id in referenced - set(stale_ids) if deduplicator.references(chunk_id)
+            }
+            if updates:
+                vector_store.update_metadata(updates)
+                if keyword_index is not None:
+                    keyword_index.update_metadata(updates)
+            deduplicator.persist()
+            metrics.inc("rag_chunks_total", progress["duplicates"], stage="deduplicated")
+            logger.info(f"Deduplication: {progress['duplicates']} duplicate chunk(s) not embedded; "
+                        f"stats: {deduplicator.stats()}")
+        progress["deleted"] = len(stale_ids)
+        if on_batch:
+            on_batch(dict(progress))
+        if hasattr(vector_store, "persist"):
+            vector_store.persist()
+        if keyword_index is not None:
+            keyword_index.persist()
+        if progress["embedded"] or stale_ids or referenced:
+            notify_corpus_changed(scope)
+        logger.info(
+            f"Embeddings stored successfully: {progress['embedded']} new, "
+            f"{progress['chunks'] - progress['embedded'] - progress['duplicates']} unchanged, "
+            f"{progress['duplicates']} duplicate(s), {len(stale_ids)} stale deleted, "
+            f"{scheduler_stats['rate_limited']} rate-limited request(s) retried"
         )
-        uuids = [str(uuid.uuid4()) for _ in chunks]
-        vector_store.add_documents(documents=chunks, ids=uuids)
-        logger.info("Embeddings stored successfully")
+
+        if manifest:
+            fingerprints = fingerprints or {}
+            for source, ids in current_ids.items():
+                manifest.record(scope, source, fingerprints.get(source), ids)
+        if hasattr(embeddings, "stats"):
+            logger.info(f"Embedding cache stats: {embeddings.stats()}")
         return vector_store
     except Exception as e:
         logger.error(f"Error storing embeddings in Weaviate: {e}")
+        if unwritten:
+            # Later runs must not collapse chunks into ones that were never stored
+            deduplicator.remove(unwritten)
+        if written and vector_store is not None:
+            _keep_partial_ingest(scope, written, vector_store, manifest, keyword_index, deduplicator)
         raise
 
+def record_partial_ingest(manifest, scope, written):
+    """Add ``{chunk ID: source}`` written by an unfinished run to the manifest, without file fingerprints."""
+    by_source = {}
+    for chunk_id, source in written.items():
+        if source is not None:
+            by_source.setdefault(source, set()).add(chunk_id)
+    for source, ids in by_source.items():
+        # No fingerprint: the file is processed again on its next upload
+        manifest.record(scope, source, None, manifest.chunk_ids(scope, source) | ids)
+
+def _keep_partial_ingest(scope, written, vector_store, manifest, keyword_index, deduplicator):
+    """Record chunks written before ingestion stopped, so later runs can find and replace them."""
+    try:
+        if manifest:
+            record_partial_ingest(manifest, scope, written)
+        if hasattr(vector_store, "persist"):
+            vector_store.persist()
+        if keyword_index is not None:
+            keyword_index.persist()
+        if deduplicator is not None:
+            deduplicator.persist()
+        notify_corpus_changed(scope)
+        logger.info(f"Recorded {len(written)} chunk(s) written before ingestion stopped")
+    except Exception as e:
+        logger.error(f"Could not record partially ingested chunks: {e}")
+
 @traceable
 def initialize_prompt():
     prompt_template = PromptTemplate(
@@ -46,42 +313,419 @@ def initialize_prompt():
     )
     return prompt_template
 
+def _sources(results):
+    """Source references (file, page, section) of the retrieved chunks.
+
+    A deduplicated chunk cites every place its text appeared.
+    """
+    sources = []
+    for doc in results:
+        references = doc.metadata.get("references")
+        for reference in json.loads(references) if references else [chunk_reference(doc)]:
+            if reference not in sources:
+                sources.append(reference)
+    return sources
+
+def _postprocess_answer(answer):
+    # Post-process the answer to reorder semantic elements
+    if "<header>, <footer>, and <section>" in answer:
+        answer = answer.replace(
+            "<header>, <footer>, and <section>",
+            "<footer>, <section>, <header>"
+        )
+    return answer
+
+def _check_answer_cache(question, vector_store, answer_cache, started):
+    """Return (cached result or None, query vector, corpus version)."""
+    if answer_cache is None:
+        return None, None, None
+    answer_cache.refresh()
+    corpus_version = answer_cache.corpus_version
+    query_vector = get_query_batcher().embed_query(vector_store.embeddings, question)
+    cached = answer_cache.lookup(query_vector)
+    if cached is None:
+        return None, query_vector, corpus_version
+    elapsed = time.perf_counter() - started
+    metrics.inc("rag_answers_total", cache="hit")
+    logger.info(f"Answer cache hit (similarity {cached['similarity']:.3f}) in {elapsed * 1000:.1f} ms; "
+                f"cache stats: {answer_cache.stats()}")
+    result = {
+        "answer": cached["answer"],
+        "metadata": {
+            "original_query": question,
+            "rewritten_query": cached["rewritten_query"],
+            "sources": cached["sources"],
+            "cache_hit": True,
+            "latency_saved_seconds": max(0.0, cached["seconds"] - elapsed)
+        }
+    }
+    return result, query_vector, corpus_version
+
+# Queries that already point at a clause, section or product code are specific enough to search as-is
+SPECIFIC_QUERY_PATTERN = re.compile(
+    r"\b(section|clause|article|appendix|annex|schedule|table|figure)\s*\d|§\s*\d|\b[A-Z]{2,}[-_]?\d+\b",
+    re.IGNORECASE
+)
+
+def should_rewrite(question):
+    """Skip the rewrite LLM call for long or already specific questions."""
+    if len(question.split()) >= REWRITE_SKIP_MIN_WORDS:
+        return False
+    return not SPECIFIC_QUERY_PATTERN.search(question)
+
+# Blocking query stages run here rather than in asyncio's default executor, which
+# asyncio.run() would wait on at exit even after we stop waiting for a slow rewrite
+_query_executor = ThreadPoolExecutor(max_workers=QUERY_WORKER_THREADS, thread_name_prefix="query")
+# Rewrites get their own threads, so slow ones don't take threads searches need
+_rewrite_executor = ThreadPoolExecutor(max_workers=REWRITE_CONCURRENCY, thread_name_prefix="rewrite")
+
+async def _timed(timings, name, stage, func, *args, executor=_query_executor, **kwargs):
+    started = time.perf_counter()
+    loop = asyncio.get_running_loop()
+    # Copy the context so LangSmith tracing follows the call into the worker thread.
+    # The stage is timed in the worker, so a rewrite we stop waiting for is still measured.
+    call = functools.partial(contextvars.copy_context().run, metrics.timed(stage)(func), *args, **kwargs)
+    result = await loop.run_in_executor(executor, call)
+    timings[name] = time.perf_counter() - started
+    return result
+
+def _search(vector_store, query, k, query_vector=None):
+    """Embed ``query`` (unless already embedded); returns (query vector, [(Document, vector)]).
+
+    The embedding and vector search are micro-batched with concurrent questions'.
+    """
+    batcher = get_query_batcher()
+    if isinstance(vector_store, HybridRetriever):
+        query_vector, vector_pairs = batcher.search(vector_store.vector_store, query,
+                                                    max(k, vector_store.fetch_k), query_vector)
+        return query_vector, vector_store.fuse_with_keywords(query, k, vector_pairs)
+    return batcher.search(vector_store, query, k, query_vector)
+
+def _select_context(query_vector, candidates, timings):
+    """Re-rank candidates with MMR and pack them into the context token budget."""
+    with metrics.span("rerank"):
+        started = time.perf_counter()
+        order = mmr_rerank(query_vector, [vector for _, vector in candidates], len(candidates),
+                           MMR_LAMBDA, CONTEXT_RELATIVE_RELEVANCE)
+        context, results = pack_context([candidates[index][0] for index in order],
+                                        CONTEXT_TOKEN_BUDGET, CONTEXT_MAX_CHUNKS)
+        timings["rerank_seconds"] = time.perf_counter() - started
+    timings["candidates"] = len(candidates)
+    timings["context_chunks"] = len(results)
+    timings["context_tokens"] = estimate_tokens(context)
+    return results, context
+
+def _compress_context(query_vector, results, context, embeddings, timings):
+    """Shrink the packed context to its most query-relevant sentences and record the savings."""
+    compressed = compress_documents(query_vector, results, embeddings,
+                                    CONTEXT_COMPRESSION_RATIO, CONTEXT_COMPRESSION_TOKENS or None)
+    compressed_context = format_context(compressed)
+    original_tokens = estimate_tokens(context)
+    saved = original_tokens - estimate_tokens(compressed_context)
+    timings["compression_ratio"] = estimate_tokens(compressed_context) / original_tokens if original_tokens else 1.0
+    timings["prompt_tokens_saved"] = saved
+    metrics.inc("rag_tokens_total", max(0, saved), kind="prompt_saved")
+    logger.info(f"Compressed context from {original_tokens} to {original_tokens - saved} estimated token(s)")
+    return compressed, compressed_context
+
+async def _aretrieve(question, vector_store, prompt_template, run_id, query_vector=None, fetch_k=RETRIEVAL_FETCH_K,
+                     trace_id=None):
+    """Search with the original question while the rewrite is still running.
+
+    Once the rewrite arrives, the rewritten query is searched too and both
+    candidate lists are merged with reciprocal-rank fusion (rewritten first). A
+    rewrite slower than REWRITE_TIMEOUT_SECONDS is not waited for. The
+    ``fetch_k`` candidates are re-ranked with MMR and as many as fit
+    CONTEXT_TOKEN_BUDGET go into the prompt, labeled by source and page. With
+    CONTEXT_COMPRESSION_ENABLED only their most query-relevant sentences are kept.
+    ``query_vector`` is the question's embedding, if already computed.
+    ``run_id`` and ``trace_id`` identify the LangSmith run rewrite feedback goes to.
+    Returns (rewritten query, results, prompt, per-stage timings in seconds).
+    """
+    started = time.perf_counter()
+    timings = {}
+    original_search = asyncio.create_task(
+        _timed(timings, "original_search_seconds", "similarity_search", _search,
+               vector_store, question, fetch_k, query_vector)
+    )
+    rewritten_query = question
+    if should_rewrite(question):
+        # Reuse the process-wide Query Rewriting Agent and its rewrite cache
+        query_agent = get_query_agent()
+        rewrite = asyncio.create_task(
+            _timed(timings, "rewrite_seconds", "rewrite_query", query_agent.rewrite_query, question, run_id=run_id,
+                   trace_id=trace_id, executor=_rewrite_executor)
+        )
+        try:
+            done, _ = await asyncio.wait({rewrite}, timeout=REWRITE_TIMEOUT_SECONDS)
+        except BaseException:
+            original_search.cancel()
+            raise
+        if rewrite in done:
+            rewritten_query = rewrite.result()
+        else:
+            # Answer from the original question; the late rewrite still lands in the rewrite cache
+            logger.warning(f"Query rewrite exceeded {REWRITE_TIMEOUT_SECONDS}s; using the original query")
+            timings["rewrite_timed_out"] = True
+    else:
+        logger.info("Query is specific enough; skipping rewrite")
+        timings["rewrite_skipped"] = True
+
+    logger.info("Performing similarity search...")
+    query_vector, candidates = await original_search
+    if rewritten_query != question:
+        query_vector, rewritten_candidates = await _timed(
+            timings, "rewritten_search_seconds", "similarity_search", _search, vector_store, rewritten_query, fetch_k
+        )
+        fused = reciprocal_rank_fusion([[doc for doc, _ in rewritten_candidates], [doc for doc, _ in candidates]],
+                                       k=fetch_k)
+        candidates = attach_vectors(fused, rewritten_candidates + candidates, vector_store)
+    timings["retrieval_seconds"] = time.perf_counter() - started
+
+    results, context = _select_context(query_vector, candidates, timings)
+    if CONTEXT_COMPRESSION_ENABLED and results:
+        results, context = await _timed(timings, "compression_seconds", "compress_context", _compress_context,
+                                        query_vector, results, context, vector_store.embeddings, timings)
+    prompt = prompt_template.format(context=context, question=rewritten_query)
+    return rewritten_query, results, prompt, timings
+
+def _retrieve(question, vector_store, prompt_template, run_id, query_vector=None, trace_id=None):
+    """Synchronous wrapper around ``_aretrieve``."""
+    return asyncio.run(_aretrieve(question, vector_store, prompt_template, run_id, query_vector, trace_id=trace_id))
+
+def _error_result(question, error, run_id=None):
+    logger.error(f"Error during query: {error}")
+    metrics.inc("rag_stage_errors_total", stage="query")
+    return {
+        "answer": f"Failed to generate answer due to an error: {error}",
+        "metadata": {
+            "original_query": question,
+            "rewritten_query": question,  # Fallback to original query
+            "run_id": run_id,
+            "error": str(error)
+        }
+    }
+
+def _record_generation(prompt, answer, usage=None):
+    """Count an answer and its prompt/completion tokens (reported by the LLM, or estimated)."""
+    usage = usage or {}
+    metrics.inc("rag_answers_total", cache="miss")
+    metrics.inc("rag_tokens_total", usage.get("input_tokens") or estimate_tokens(prompt), kind="prompt")
+    metrics.inc("rag_tokens_total", usage.get("output_tokens") or estimate_tokens(answer), kind="completion")
+
+def _trace_ids(run_id=None):
+    """(run ID, trace ID) for feedback: ``run_id`` if given, else the LangSmith run being traced.
+
+    The trace ID (the root run's) is only known for the traced run; it is None
+    for a caller's ``run_id`` and when nothing is traced.
+    """
+    if run_id is not None:
+        return run_id, None
+    run_tree = get_current_run_tree()
+    return (run_tree.id, run_tree.trace_id) if run_tree is not None else (None, None)
+
 @traceable(run_type="chain", metadata={"step": "query_rag"})
-def query_rag(question, vector_store, llm, prompt_template, run_id=None):
+def query_rag(question, vector_store, llm, prompt_template, run_id=None, answer_cache=None):
+    """Answer a question from the vector store.
+
+    With an ``answer_cache`` (SemanticAnswerCache), a question similar enough
+    to one already answered against the current corpus version is served from
+    the cache without any rewrite, search or generation call.
+    """
+    run_id, trace_id = _trace_ids(run_id)
     try:
-        # Initialize the Query Rewriting Agent
-        query_agent = QueryRewritingAgent()
-        rewritten_query = query_agent.rewrite_query(question, run_id=run_id)
-        
-        logger.info("Performing similarity search...")
-        results = vector_store.similarity_search(rewritten_query, k=3)
-        context = " ".join([doc.page_content for doc in results])
-        prompt = prompt_template.format(context=context, question=rewritten_query)
+        started = time.perf_counter()
+        cached, query_vector, corpus_version = _check_answer_cache(question, vector_store, answer_cache, started)
+        if cached is not None:
+            cached["metadata"]["run_id"] = run_id
+            return cached
+
+        rewritten_query, results, prompt, timings = _retrieve(question, vector_store, prompt_template, run_id, query_vector,
+                                                                trace_id=trace_id)
         logger.info("Generating response with LLM...")
-        response = llm.invoke(prompt)
-        answer = response.content
-
-        # Post-process the answer to reorder semantic elements
-        if "<header>, <footer>, and <section>" in answer:
-            answer = answer.replace(
-                "<header>, <footer>, and <section>",
-                "<footer>, <section>, <header>"
-            )
+        generation_started = time.perf_counter()
+        with metrics.span("llm_generate"):
+            response = llm.invoke(prompt)
+        timings["generation_seconds"] = time.perf_counter() - generation_started
+        timings["total_seconds"] = time.perf_counter() - started
+        answer = _postprocess_answer(response.content)
+        _record_generation(prompt, answer, getattr(response, "usage_metadata", None))
+
+        sources = _sources(results)
+        if answer_cache is not None:
+            answer_cache.store(query_vector, answer, sources, rewritten_query,
+                               time.perf_counter() - started, corpus_version)
 
         # Return the answer along with metadata for LangSmith
         return {
             "answer": answer,
             "metadata": {
                 "original_query": question,
-                "rewritten_query": rewritten_query
+                "rewritten_query": rewritten_query,
+                "sources": sources,
+                "cache_hit": False,
+                "timings": timings,
+                "run_id": run_id
             }
         }
     except Exception as e:
-        logger.error(f"Error during query: {e}")
+        return _error_result(question, e, run_id)
+
+@traceable(run_type="chain", metadata={"step": "aquery_rag"})
+async def aquery_rag(question, vector_store, llm, prompt_template, run_id=None, answer_cache=None):
+    """Async ``query_rag`` for callers that already run an event loop."""
+    run_id, trace_id = _trace_ids(run_id)
+    try:
+        started = time.perf_counter()
+        cached, query_vector, corpus_version = await asyncio.to_thread(
+            _check_answer_cache, question, vector_store, answer_cache, started
+        )
+        if cached is not None:
+            cached["metadata"]["run_id"] = run_id
+            return cached
+
+        rewritten_query, results, prompt, timings = await _aretrieve(question, vector_store, prompt_template, run_id,
+                                                                      query_vector, trace_id=trace_id)
+        logger.info("Generating response with LLM...")
+        generation_started = time.perf_counter()
+        with metrics.span("llm_generate"):
+            response = await llm.ainvoke(prompt)
+        timings["generation_seconds"] = time.perf_counter() - generation_started
+        timings["total_seconds"] = time.perf_counter() - started
+        answer = _postprocess_answer(response.content)
+        _record_generation(prompt, answer, getattr(response, "usage_metadata", None))
+
+        sources = _sources(results)
+        if answer_cache is not None:
+            answer_cache.store(query_vector, answer, sources, rewritten_query,
+                               time.perf_counter() - started, corpus_version)
         return {
-            "answer": f"Failed to generate answer due to an error: {e}",
+            "answer": answer,
             "metadata": {
                 "original_query": question,
-                "rewritten_query": question  # Fallback to original query
+                "rewritten_query": rewritten_query,
+                "sources": sources,
+                "cache_hit": False,
+                "timings": timings,
+                "run_id": run_id
             }
-        }
\ No newline at end of file
+        }
+    except Exception as e:
+        return _error_result(question, e, run_id)
+
+class StreamingAnswer:
+    """Iterates over answer text as it is generated.
+
+    ``result`` holds the same dict ``query_rag`` returns (with the
+    post-processed answer and timing metadata) once iteration has finished.
+    ``run_id`` is the LangSmith run the answer is traced under, known before
+    iteration starts, or None when the request is not traced; ``trace_id`` is
+    the ID of that run's trace (the run itself unless it is nested in another).
+    """
+
+    def __init__(self, events, run_id=None, trace_id=None):
+        self._events = events
+        self.run_id = run_id
+        self.trace_id = trace_id
+        self.result = None
+
+    def __iter__(self):
+        for event in self._events:
+            if isinstance(event, dict):
+                self.result = event
+            else:
+                yield event
+
+    def close(self):
+        """Stop generating (e.g. for a client that went away), closing the LLM stream."""
+        close = getattr(self._events, "close", None)
+        if close is not None:
+            close()
+
+@traceable(run_type="chain", metadata={"step": "stream_query_rag"})
+def _stream_query_rag(question, vector_store, llm, prompt_template, run_id=None, answer_cache=None):
+    started = time.perf_counter()
+    run_id, trace_id = _trace_ids(run_id)
+    try:
+        cached, query_vector, corpus_version = _check_answer_cache(question, vector_store, answer_cache, started)
+        if cached is not None:
+            cached["metadata"]["run_id"] = run_id
+            yield cached["answer"]
+            yield cached
+            return
+
+        rewritten_query, results, prompt, timings = _retrieve(question, vector_store, prompt_template, run_id, query_vector,
+                                                                trace_id=trace_id)
+        logger.info("Streaming response from LLM...")
+        generation_started = time.perf_counter()
+        first_token_at = None
+        output_tokens = None
+        pieces = []
+        # Only time spent waiting on the model counts, not time the caller spends rendering
+        for chunk in metrics.timed_iter("llm_generate", llm.stream(prompt)):
+            text = chunk.content if isinstance(chunk.content, str) else "".join(
+                part.get("text", "") if isinstance(part, dict) else str(part) for part in chunk.content
+            )
+            usage = getattr(chunk, "usage_metadata", None)
+            if usage and usage.get("output_tokens"):
+                output_tokens = usage["output_tokens"]
+            if not text:
+                continue
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            pieces.append(text)
+            yield text
+        finished = time.perf_counter()
+    except Exception as e:
+        result = _error_result(question, e, run_id)
+        yield result["answer"]
+        yield result
+        return
+
+    answer = _postprocess_answer("".join(pieces))
+    output_tokens = output_tokens or estimate_tokens(answer)
+    first_token_at = first_token_at or finished
+    generation_seconds = finished - first_token_at
+    timings.update({
+        "time_to_first_token_seconds": first_token_at - started,
+        "llm_time_to_first_token_seconds": first_token_at - generation_started,
+        "output_tokens": output_tokens,
+        "tokens_per_second": output_tokens / generation_seconds if generation_seconds > 0 else None,
+        "total_seconds": finished - started
+    })
+    logger.info(f"Streamed answer: {timings}")
+    metrics.observe("rag_time_to_first_token_seconds", timings["time_to_first_token_seconds"])
+    _record_generation(prompt, answer, {"output_tokens": output_tokens})
+
+    sources = _sources(results)
+    if answer_cache is not None:
+        answer_cache.store(query_vector, answer, sources, rewritten_query, finished - started, corpus_version)
+    yield {
+        "answer": answer,
+        "metadata": {
+            "original_query": question,
+            "rewritten_query": rewritten_query,
+            "sources": sources,
+            "cache_hit": False,
+            "timings": timings,
+            "run_id": run_id
+        }
+    }
+
+def stream_query_rag(question, vector_store, llm, prompt_template, run_id=None, answer_cache=None):
+    """Streaming variant of ``query_rag``; returns a StreamingAnswer.
+
+    The trace's run ID is chosen here rather than looked up afterwards, so
+    feedback can be attached to the right run without a LangSmith round trip.
+    Requests are left untraced while the client's upload backlog is full.
+    """
+    trace_run_id = new_trace_run_id(get_langsmith_client, TRACE_BACKLOG_LIMIT)
+    if trace_run_id is None:
+        return StreamingAnswer(untraced(_stream_query_rag(question, vector_store, llm, prompt_template,
+                                                          run_id=run_id, answer_cache=answer_cache)))
+    parent = get_current_run_tree()
+    events = _stream_query_rag(question, vector_store, llm, prompt_template, run_id=run_id,
+                               answer_cache=answer_cache,
+                               langsmith_extra={"run_id": trace_run_id, "client": get_langsmith_client()})
+    return StreamingAnswer(events, run_id=trace_run_id,
+                           trace_id=parent.trace_id if parent is not None else trace_run_id)
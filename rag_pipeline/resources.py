@@ -0,0 +1,198 @@
+import atexit
+import logging
+import threading
+from langsmith import Client
+from rag_pipeline.config import (
+    VECTOR_BACKEND,
+    FEEDBACK_QUEUE_SIZE,
+    FEEDBACK_BATCH_SIZE,
+    FEEDBACK_FLUSH_SECONDS,
+    INGEST_MANIFEST_PATH,
+    QUERY_BATCH_WINDOW_MS,
+    QUERY_BATCH_MAX_SIZE,
+    QUERY_BATCH_WORKERS,
+)
+from rag_pipeline.embedder import initialize_embeddings, initialize_llm
+from rag_pipeline.weviate_helper import initialize_weaviate
+from rag_pipeline.tracing import FeedbackQueue
+from rag_pipeline.manifest import IngestManifest
+from rag_pipeline.query_batcher import QueryBatcher
+
+logger = logging.getLogger(__name__)
+
+
+class ResourceRegistry:
+    """Thread-safe, process-wide home for long-lived clients.
+
+    Each resource is registered with a factory and is created once, on first
+    ``get`` or during ``warm_up``, then shared by every session and request.
+    Optional ``health_check`` and ``close`` callables take the instance;
+    ``reset`` drops an instance so the next ``get`` builds a fresh one.
+    """
+
+    def __init__(self):
+        self._specs = {}
+        self._instances = {}
+        self._locks = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+        self._warm_up_thread = None
+
+    def register(self, name, factory, health_check=None, close=None):
+        with self._lock:
+            self._specs[name] = {"factory": factory, "health_check": health_check, "close": close}
+            self._locks.setdefault(name, threading.Lock())
+
+    def get(self, name):
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+        with self._locks[name]:
+            instance = self._instances.get(name)
+            if instance is None:
+                logger.info(f"Creating shared resource: {name}")
+                try:
+                    instance = self._specs[name]["factory"]()
+                except Exception as e:
+                    self._errors[name] = str(e)
+                    raise
+                self._errors.pop(name, None)
+                self._instances[name] = instance
+            return instance
+
+    def warm_up(self, names=None, background=True):
+        """Create resources ahead of the first request; runs once per process."""
+        with self._lock:
+            if self._warm_up_thread is not None:
+                return
+            names = list(names or self._specs)
+            self._warm_up_thread = threading.Thread(
+                target=self._warm_up, args=(names,), name="resource-warm-up", daemon=True
+            )
+        if background:
+            self._warm_up_thread.start()
+        else:
+            self._warm_up_thread.run()
+
+    def _warm_up(self, names):
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.error(f"Warm-up of {name} failed: {e}")
+
+    def health(self):
+        """Status of every registered resource: ok, error, unhealthy or not_started."""
+        report = {}
+        for name, spec in list(self._specs.items()):
+            instance = self._instances.get(name)
+            if instance is None:
+                report[name] = {"status": "error", "error": self._errors[name]} if name in self._errors \
+                    else {"status": "not_started"}
+                continue
+            if spec["health_check"] is None:
+                report[name] = {"status": "ok"}
+                continue
+            try:
+                healthy = spec["health_check"](instance)
+                report[name] = {"status": "ok" if healthy else "unhealthy"}
+            except Exception as e:
+                report[name] = {"status": "unhealthy", "error": str(e)}
+        return report
+
+    def reset(self, name):
+        with self._locks[name]:
+            instance = self._instances.pop(name, None)
+        if instance is not None:
+            self._close(name, instance)
+
+    def shutdown(self):
+        """Close every created resource, newest first."""
+        for name in reversed(list(self._instances)):
+            self.reset(name)
+
+    def _close(self, name, instance):
+        close = self._specs[name]["close"]
+        if close is None:
+            return
+        try:
+            close(instance)
+            logger.info(f"Closed shared resource: {name}")
+        except Exception as e:
+            logger.error(f"Error closing {name}: {e}")
+
+
+def _close_embeddings(embeddings):
+    if hasattr(embeddings, "close"):
+        embeddings.close()
+
+
+def _create_feedback_queue():
+    # Create the client first so shutdown flushes the queue before closing it
+    get_langsmith_client()
+    return FeedbackQueue(get_langsmith_client, max_size=FEEDBACK_QUEUE_SIZE,
+                         batch_size=FEEDBACK_BATCH_SIZE, flush_interval=FEEDBACK_FLUSH_SECONDS)
+
+
+def _create_query_agent():
+    from query_rewriting_agent import get_query_rewriting_agent
+    return get_query_rewriting_agent(registry.get("embeddings"))
+
+
+def _create_ingest_jobs():
+    from rag_pipeline.ingest_jobs import IngestJobQueue
+    return IngestJobQueue()
+
+
+registry = ResourceRegistry()
+registry.register("embeddings", initialize_embeddings, close=_close_embeddings)
+registry.register("llm", initialize_llm)
+registry.register("langsmith", Client, close=lambda client: client.flush())
+registry.register("feedback_queue", _create_feedback_queue, close=lambda feedback: feedback.close())
+if VECTOR_BACKEND != "local":
+    registry.register("weaviate", initialize_weaviate, health_check=lambda client: client.is_ready(),
+                      close=lambda client: client.close())
+registry.register("query_agent", _create_query_agent)
+# One manifest instance, so concurrent ingestion jobs don't overwrite each other's entries
+registry.register("ingest_manifest", lambda: IngestManifest(INGEST_MANIFEST_PATH))
+registry.register("query_batcher", lambda: QueryBatcher(window=QUERY_BATCH_WINDOW_MS / 1000,
+                                                       max_batch_size=QUERY_BATCH_MAX_SIZE,
+                                                       workers=QUERY_BATCH_WORKERS),
+                  close=lambda batcher: batcher.close())
+# Started during warm-up so jobs interrupted by a restart resume straight away
+registry.register("ingest_jobs", _create_ingest_jobs, close=lambda jobs: jobs.shutdown())
+atexit.register(registry.shutdown)
+
+
+def get_embeddings():
+    return registry.get("embeddings")
+
+def get_llm():
+    return registry.get("llm")
+
+def get_langsmith_client():
+    return registry.get("langsmith")
+
+def get_query_agent():
+    return registry.get("query_agent")
+
+def get_feedback_queue():
+    return registry.get("feedback_queue")
+
+def get_query_batcher():
+    return registry.get("query_batcher")
+
+def get_ingest_manifest():
+    return registry.get("ingest_manifest")
+
+def get_ingest_jobs():
+    return registry.get("ingest_jobs")
+
+def get_weaviate_client():
+    """Shared Weaviate client; recreated if the cluster stops answering."""
+    client = registry.get("weaviate")
+    if not client.is_connected():
+        logger.warning("Shared Weaviate client disconnected; reconnecting")
+        registry.reset("weaviate")
+        client = registry.get("weaviate")
+    return client
@@ -0,0 +1,41 @@
+import os
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:  # Windows: files are not shared between processes
+    fcntl = None
+
+
+def file_version(path):
+    """Identifies the current contents of ``path`` (None if it doesn't exist).
+
+    Files are always replaced atomically, so a new inode or mtime means
+    another process (or this one) wrote them.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+@contextmanager
+def file_lock(path, shared=False):
+    """Hold a lock on ``path`` across processes, via the ``<path>.lock`` file next to it.
+
+    Writers take it exclusively around read-modify-write cycles; readers of
+    data spread over several files take it ``shared`` so they never see half
+    of a save.
+    """
+    if fcntl is None:
+        yield
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{path}.lock", "a") as handle:
+        fcntl.flock(handle, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(handle, fcntl.LOCK_UN)
@@ -0,0 +1,118 @@
+import os
+import re
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from rag_pipeline.config import LOCAL_VECTOR_STORE_DIR, KEYWORD_INDEX_DIR, DEDUP_INDEX_DIR, TENANT_IDLE_SECONDS
+from rag_pipeline.local_vector_store import release_local_vector_store
+from rag_pipeline.keyword_index import release_keyword_index
+from rag_pipeline.dedup import release_deduplicator
+from rag_pipeline.answer_cache import drop_answer_cache, notify_corpus_changed
+from rag_pipeline.weviate_helper import deactivate_tenant, drop_tenant
+
+logger = logging.getLogger(__name__)
+
+# Weaviate tenant names may only contain letters, digits, "-" and "_" (at most 64)
+_INVALID_TENANT_CHARACTERS = re.compile(r"[^A-Za-z0-9_-]")
+
+
+def tenant_name(username):
+    """Weaviate-safe tenant name for a user; names that had to be changed get a hash suffix."""
+    name = _INVALID_TENANT_CHARACTERS.sub("_", username)
+    if name != username or not name or len(name) > 64:
+        name = f"{name[:48]}-{hashlib.sha1(username.encode('utf-8')).hexdigest()[:12]}"
+    return name
+
+
+def tenant_scope(collection_name, tenant=None):
+    """Key of a tenant's data in the manifest, answer cache and local index paths."""
+    return collection_name if tenant is None else f"{collection_name}.{tenant}"
+
+
+def local_store_path(scope):
+    return os.path.join(LOCAL_VECTOR_STORE_DIR, scope)
+
+
+def keyword_index_path(scope):
+    return os.path.join(KEYWORD_INDEX_DIR, f"{scope}.json")
+
+
+def dedup_index_path(scope):
+    return os.path.join(DEDUP_INDEX_DIR, scope)
+
+
+def offload_tenant(collection_name, tenant, client=None):
+    """Free a tenant's in-process indexes and cached answers, and deactivate its Weaviate shard.
+
+    Everything stays on disk (or in Weaviate) and is loaded again on next use.
+    """
+    scope = tenant_scope(collection_name, tenant)
+    release_local_vector_store(local_store_path(scope))
+    release_keyword_index(keyword_index_path(scope))
+    release_deduplicator(dedup_index_path(scope))
+    drop_answer_cache(scope)
+    if client is not None and tenant is not None:
+        deactivate_tenant(client, collection_name, tenant)
+    logger.info(f"Offloaded tenant {tenant} of {collection_name}")
+
+
+def delete_tenant(collection_name, tenant, client=None, manifest=None):
+    """Delete every chunk, index and manifest entry stored for a tenant."""
+    scope = tenant_scope(collection_name, tenant)
+    offload_tenant(collection_name, tenant)
+    shutil.rmtree(local_store_path(scope), ignore_errors=True)
+    shutil.rmtree(dedup_index_path(scope), ignore_errors=True)
+    if os.path.exists(keyword_index_path(scope)):
+        os.remove(keyword_index_path(scope))
+    if manifest is not None:
+        manifest.forget(scope)
+    # Other processes still hold answers from the deleted documents
+    notify_corpus_changed(scope)
+    if client is not None and tenant is not None:
+        drop_tenant(client, collection_name, tenant)
+    logger.info(f"Deleted tenant {tenant} of {collection_name}")
+
+
+class TenantTracker:
+    """Remembers when each tenant was last used, so idle ones can be offloaded."""
+
+    def __init__(self, idle_seconds=TENANT_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._last_used = {}
+        self._lock = threading.Lock()
+
+    def touch(self, collection_name, tenant):
+        """Mark a tenant as in use; returns True if it was not active (new or offloaded)."""
+        with self._lock:
+            inactive = (collection_name, tenant) not in self._last_used
+            self._last_used[(collection_name, tenant)] = time.monotonic()
+            return inactive
+
+    def forget(self, collection_name, tenant):
+        with self._lock:
+            self._last_used.pop((collection_name, tenant), None)
+
+    def offload_idle(self, client_factory=None):
+        """Offload tenants unused for ``idle_seconds``; returns their (collection, tenant) pairs.
+
+        ``client_factory`` returns the Weaviate client; it is only called when
+        there is something to offload.
+        """
+        now = time.monotonic()
+        with self._lock:
+            idle = [key for key, last_used in self._last_used.items() if now - last_used > self.idle_seconds]
+            for key in idle:
+                del self._last_used[key]
+        if idle:
+            client = client_factory() if client_factory else None
+            for collection_name, tenant in idle:
+                try:
+                    offload_tenant(collection_name, tenant, client)
+                except Exception as e:
+                    logger.error(f"Failed to offload tenant {tenant} of {collection_name}: {e}")
+        return idle
+
+
+tenant_tracker = TenantTracker()
@@ -0,0 +1,3 @@
+def estimate_tokens(text):
+    """Rough Gemini token count (about four characters per token)."""
+    return max(1, (len(text) + 3) // 4) if text else 0
@@ -0,0 +1,139 @@
+import uuid
+import queue
+import logging
+import threading
+from langsmith import tracing_context
+from langsmith.utils import tracing_is_enabled
+
+logger = logging.getLogger(__name__)
+
+
+class FeedbackQueue:
+    """Bounded background queue for LangSmith feedback.
+
+    ``submit`` never blocks: feedback is dropped (and counted) when the queue
+    is full. A daemon thread drains up to ``batch_size`` items at a time, at
+    least every ``flush_interval`` seconds, and hands them to the client. Items
+    submitted with the ``trace_id`` of their run's root ride along with its
+    batched trace uploads; without one the client sends them on their own.
+    """
+
+    def __init__(self, client_factory, max_size=1000, batch_size=50, flush_interval=1.0):
+        self._client_factory = client_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.submitted = 0
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_size)
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="langsmith-feedback", daemon=True)
+        self._worker.start()
+
+    def submit(self, run_id, key, score=None, comment=None, trace_id=None):
+        """Queue feedback for ``run_id`` (in trace ``trace_id``, if known); returns False if it was dropped."""
+        if run_id is None or self._stopped.is_set():
+            return False
+        try:
+            self._queue.put_nowait({"run_id": run_id, "trace_id": trace_id, "key": key,
+                                 "score": score, "comment": comment})
+        except queue.Full:
+            self.dropped += 1
+            logger.warning(f"Feedback queue full; dropped '{key}' feedback for run {run_id}")
+            return False
+        self.submitted += 1
+        return True
+
+    def close(self, timeout=5.0):
+        """Send what is queued (waiting up to ``timeout`` seconds) and stop the worker."""
+        self._stopped.set()
+        self._worker.join(timeout)
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "pending": self._queue.qsize(),
+        }
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch:
+                self._send(batch)
+            elif self._stopped.is_set():
+                return
+
+    def _next_batch(self):
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=self.flush_interval))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _send(self, batch):
+        try:
+            client = self._client_factory()
+        except Exception as e:
+            self.failed += len(batch)
+            logger.error(f"Dropping {len(batch)} feedback item(s); LangSmith client unavailable: {e}")
+            return
+        for item in batch:
+            try:
+                client.create_feedback(
+                    run_id=item["run_id"],
+                    trace_id=item["trace_id"],
+                    key=item["key"],
+                    score=item["score"],
+                    comment=item["comment"]
+                )
+                self.sent += 1
+            except Exception as e:
+                self.failed += 1
+                logger.error(f"Error logging '{item['key']}' feedback to LangSmith: {e}")
+
+
+def trace_backlog(client):
+    """Number of run and feedback operations the client has not uploaded yet."""
+    tracing_queue = getattr(client, "tracing_queue", None)
+    return tracing_queue.qsize() if tracing_queue is not None else 0
+
+
+def new_trace_run_id(client_factory, backlog_limit):
+    """Run ID for a new root trace, or None when tracing is off or backed up.
+
+    A trace is dropped, rather than queued, while ``backlog_limit`` or more
+    operations are already waiting to be uploaded. The client is only created
+    when tracing is enabled.
+    """
+    if not tracing_is_enabled():
+        return None
+    backlog = trace_backlog(client_factory())
+    if backlog >= backlog_limit:
+        logger.warning(f"LangSmith upload backlog at {backlog} operation(s); not tracing this request")
+        return None
+    return uuid.uuid4()
+
+
+def untraced(events):
+    """Iterate over a traced generator with tracing disabled for every step; closing stops it too."""
+    iterator = iter(events)
+    try:
+        while True:
+            with tracing_context(enabled=False):
+                try:
+                    event = next(iterator)
+                except StopIteration:
+                    return
+            yield event
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            with tracing_context(enabled=False):
+                close()
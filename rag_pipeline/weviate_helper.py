@@ -1,7 +1,29 @@
 import os
+import json
+import time
+import logging
+import datetime
+import threading
 import weaviate
-from weaviate.classes.config import Configure, Property, DataType, VectorDistances
+from weaviate.classes.config import Configure, Reconfigure, Property, DataType, VectorDistances
+from weaviate.classes.data import DataObject
+from weaviate.classes.query import Filter
 from weaviate.classes.init import Auth, AdditionalConfig, Timeout
+from weaviate.config import ConnectionConfig
+from langchain_core.documents import Document
+from langchain_weaviate.vectorstores import WeaviateVectorStore
+from rag_pipeline.config import WEAVIATE_POOL_CONNECTIONS, WEAVIATE_POOL_MAXSIZE
+from rag_pipeline.quantization import QUANTIZATION_MODES, rescore
+
+logger = logging.getLogger(__name__)
+
+# Property types that can be selected in GraphQL without a sub-selection
+_SCALAR_TYPES = {"text", "text[]", "int", "int[]", "boolean", "boolean[]", "number", "number[]",
+                 "date", "date[]", "uuid", "uuid[]", "blob"}
+# Property names read for batched GraphQL searches are refreshed this often
+_PROPERTY_CACHE_SECONDS = 60
+_property_cache = {}
+_property_cache_lock = threading.Lock()
 
 def initialize_weaviate():
     try:
@@ -13,7 +35,12 @@ def initialize_weaviate():
             cluster_url=weaviate_url,
             auth_credentials=Auth.api_key(weaviate_api_key),
             additional_config=AdditionalConfig(
-                timeout=Timeout(init=30, query=60)  # Increased init timeout
+                timeout=Timeout(init=30, query=60),  # Increased init timeout
+                # One client is shared by all sessions, so keep enough pooled connections
+                connection=ConnectionConfig(
+                    session_pool_connections=WEAVIATE_POOL_CONNECTIONS,
+                    session_pool_maxsize=WEAVIATE_POOL_MAXSIZE
+                )
             ),
             skip_init_checks=True  # Skip gRPC health check
         )
@@ -27,7 +54,32 @@ def initialize_weaviate():
         print(f"Error initializing Weaviate: {e}")
         raise
 
-def create_or_connect_class(client, class_name):
+def _quantizer_config(quantization, pq_segments=None, update=False):
+    """Weaviate quantizer settings for a VECTOR_QUANTIZATION mode (None for "none")."""
+    if quantization not in QUANTIZATION_MODES:
+        raise ValueError(f"Unsupported quantization: {quantization}. Supported: {', '.join(QUANTIZATION_MODES)}")
+    quantizer = Reconfigure.VectorIndex.Quantizer if update else Configure.VectorIndex.Quantizer
+    if quantization == "pq":
+        return quantizer.pq(segments=pq_segments)
+    if quantization == "sq":
+        return quantizer.sq()
+    if quantization == "bq":
+        return quantizer.bq()
+    return None
+
+def _quantizer_name(quantizer):
+    # _PQConfig -> "pq", _SQConfig -> "sq", ...
+    return type(quantizer).__name__.strip("_").replace("Config", "").lower() if quantizer is not None else "none"
+
+def create_or_connect_class(client, class_name, multi_tenancy=False, quantization="none", pq_segments=None):
+    """Create the class if needed and return it.
+
+    With ``multi_tenancy`` each tenant gets its own shard and HNSW index;
+    tenants are created and reactivated automatically on first use. A
+    ``quantization`` other than "none" compresses the HNSW index ("pq", "sq"
+    or "bq"); it is also enabled on an existing uncompressed class, but
+    Weaviate cannot switch a compressed class to another mode or back.
+    """
     try:
         print(f"Checking for existing Weaviate class: {class_name}")
         # Check if class exists using collections.exists
@@ -42,12 +94,172 @@ def create_or_connect_class(client, class_name):
                 vector_index_config=Configure.VectorIndex.hnsw(
                     distance_metric=VectorDistances.COSINE,
                     ef_construction=128,
-                    max_connections=32
-                )
+                    max_connections=32,
+                    quantizer=_quantizer_config(quantization, pq_segments)
+                ),
+                multi_tenancy_config=Configure.multi_tenancy(
+                    enabled=True, auto_tenant_creation=True, auto_tenant_activation=True
+                ) if multi_tenancy else None
             )
         collection = client.collections.get(class_name)
+        config = collection.config.get()
+        if config.multi_tenancy_config.enabled != multi_tenancy:
+            raise ValueError(
+                f"Weaviate class {class_name} was created with multi-tenancy "
+                f"{'disabled' if multi_tenancy else 'enabled'}; delete it or change MULTI_TENANCY_ENABLED"
+            )
+        current = _quantizer_name(config.vector_index_config.quantizer)
+        if current == "none" and quantization != "none":
+            print(f"Enabling {quantization} compression on Weaviate class: {class_name}")
+            collection.config.update(vector_index_config=Reconfigure.VectorIndex.hnsw(
+                quantizer=_quantizer_config(quantization, pq_segments, update=True)
+            ))
+        elif current != quantization:
+            logger.warning(f"Weaviate class {class_name} uses {current} compression, not {quantization}; "
+                           f"re-create it to change VECTOR_QUANTIZATION")
         print(f"Connected to Weaviate class: {class_name}")
         return collection
     except Exception as e:
         print(f"Error creating/connecting to Weaviate class: {e}")
-        raise
\ No newline at end of file
+        raise
+
+def _property_value(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    return value
+
+def deactivate_tenant(client, class_name, tenant):
+    """Move an idle tenant's shard out of memory; it is reactivated on its next request."""
+    collection = client.collections.get(class_name)
+    if collection.tenants.exists(tenant):
+        collection.tenants.deactivate(tenant)
+        logger.info(f"Deactivated Weaviate tenant {tenant} of {class_name}")
+
+def drop_tenant(client, class_name, tenant):
+    """Delete a tenant and every object stored for it."""
+    collection = client.collections.get(class_name)
+    if collection.tenants.exists(tenant):
+        collection.tenants.remove([tenant])
+        logger.info(f"Dropped Weaviate tenant {tenant} of {class_name}")
+
+def _scalar_properties(client, class_name):
+    """Names of a class's scalar properties, cached for _PROPERTY_CACHE_SECONDS."""
+    key = (id(client), class_name)
+    with _property_cache_lock:
+        cached = _property_cache.get(key)
+    if cached is not None and time.monotonic() - cached[0] < _PROPERTY_CACHE_SECONDS:
+        return cached[1]
+    config = client.collections.get(class_name).config.get(simple=True)
+    names = [prop.name for prop in config.properties if prop.data_type.value in _SCALAR_TYPES]
+    with _property_cache_lock:
+        _property_cache[key] = (time.monotonic(), names)
+    return names
+
+class DocumentVectorStore(WeaviateVectorStore):
+    """WeaviateVectorStore that can also store vectors embedded elsewhere.
+
+    With a ``tenant`` every read and write goes to that tenant of a
+    multi-tenant class, so searches only touch the tenant's own index. On a
+    compressed class, searches returning vectors fetch ``rescore_factor`` x k
+    hits and keep the k most similar by their full-precision vectors.
+    """
+
+    def __init__(self, *args, tenant=None, rescore_factor=1, **kwargs):
+        super().__init__(*args, use_multi_tenancy=tenant is not None, **kwargs)
+        self.tenant = tenant
+        self.rescore_factor = max(1, rescore_factor)
+
+    @property
+    def _scoped_collection(self):
+        return self._collection.with_tenant(self.tenant) if self.tenant is not None else self._collection
+
+    def _perform_search(self, query, k, **kwargs):
+        if self.tenant is not None:
+            kwargs.setdefault("tenant", self.tenant)
+        return super()._perform_search(query, k, **kwargs)
+
+    def delete(self, ids=None, tenant=None, **kwargs):
+        return super().delete(ids, tenant=tenant or self.tenant, **kwargs)
+
+    def add_vectors(self, documents, vectors, ids):
+        """Upsert documents with precomputed vectors in a single batch request."""
+        objects = []
+        for doc, vector, doc_id in zip(documents, vectors, ids):
+            properties = {key: _property_value(value) for key, value in doc.metadata.items()}
+            properties[self._text_key] = doc.page_content
+            objects.append(DataObject(properties=properties, uuid=doc_id, vector=vector))
+        result = self._scoped_collection.data.insert_many(objects)
+        for index, error in result.errors.items():
+            logger.error(f"Failed to add object {ids[index]}: {error.message}")
+        if result.errors:
+            raise RuntimeError(f"Weaviate rejected {len(result.errors)} of {len(objects)} object(s)")
+        return list(ids)
+
+    def update_metadata(self, updates):
+        """Merge ``{id: metadata}`` into the properties of stored objects."""
+        for doc_id, metadata in updates.items():
+            properties = {key: _property_value(value) for key, value in metadata.items()}
+            self._scoped_collection.data.update(uuid=doc_id, properties=properties)
+
+    def vectors_by_ids(self, ids):
+        """Stored vectors of the chunks with these IDs, as ``{id: vector}``; unknown IDs are left out."""
+        if not ids:
+            return {}
+        response = self._scoped_collection.query.fetch_objects(
+            filters=Filter.by_id().contains_any(list(ids)), limit=len(ids), include_vector=True
+        )
+        return {
+            str(obj.uuid): obj.vector.get("default") if isinstance(obj.vector, dict) else obj.vector
+            for obj in response.objects
+        }
+
+    def similarity_search_with_vectors(self, query, k=4, query_vector=None):
+        """Return up to ``k`` (Document, vector) pairs, fetching stored vectors with the hits."""
+        if query_vector is None:
+            query_vector = self.embeddings.embed_query(query)
+        response = self._scoped_collection.query.near_vector(
+            near_vector=query_vector, limit=k * self.rescore_factor, include_vector=True
+        )
+        results = []
+        for obj in response.objects:
+            properties = dict(obj.properties)
+            text = properties.pop(self._text_key, "")
+            vector = obj.vector.get("default") if isinstance(obj.vector, dict) else obj.vector
+            results.append((Document(id=str(obj.uuid), page_content=text, metadata=properties), vector))
+        return rescore(query_vector, results, k) if self.rescore_factor > 1 else results
+
+    @property
+    def batch_group(self):
+        """Searches through the same client can be sent as one request, whatever their class or tenant."""
+        return id(self._client)
+
+    @classmethod
+    def batch_similarity_search_with_vectors(cls, searches):
+        """``similarity_search_with_vectors`` results for ``[(store, query vector, k)]`` in one GraphQL request.
+
+        Each search is an aliased ``Get`` with its own class, tenant and limit.
+        """
+        client = searches[0][0]._client
+        queries = []
+        for index, (store, query_vector, k) in enumerate(searches):
+            properties = set(_scalar_properties(client, store._index_name)) | {store._text_key}
+            tenant = f', tenant: "{store.tenant}"' if store.tenant is not None else ""
+            vector = json.dumps([float(value) for value in query_vector])
+            queries.append(
+                f"q{index}: {store._index_name}(nearVector: {{vector: {vector}}}, "
+                f"limit: {int(k) * store.rescore_factor}{tenant}) "
+                f"{{ {' '.join(sorted(properties))} _additional {{ id vector }} }}"
+            )
+        response = client.graphql_raw_query(f"{{ Get {{ {' '.join(queries)} }} }}")
+        if response.errors:
+            raise RuntimeError(f"Weaviate batch search failed: {response.errors}")
+        results = []
+        for index, (store, query_vector, k) in enumerate(searches):
+            pairs = []
+            for obj in response.get.get(f"q{index}") or []:
+                additional = obj.pop("_additional")
+                text = obj.pop(store._text_key, None) or ""
+                metadata = {key: value for key, value in obj.items() if value is not None}
+                pairs.append((Document(id=additional["id"], page_content=text, metadata=metadata), additional["vector"]))
+            results.append(rescore(query_vector, pairs, k) if store.rescore_factor > 1 else pairs)
+        return results
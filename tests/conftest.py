@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+# Point the pipeline's on-disk state at a scratch directory before any of it is imported
+_cache_dir = tempfile.mkdtemp(prefix="docquery-tests-")
+os.environ.update(
+    VECTOR_BACKEND="local",
+    LOCAL_VECTOR_STORE_DIR=os.path.join(_cache_dir, "vector_store"),
+    INGEST_JOB_DIR=os.path.join(_cache_dir, "ingest_jobs"),
+    EMBEDDING_CACHE_ENABLED="false",
+    LANGCHAIN_TRACING_V2="false",
+    LANGSMITH_TRACING="false",
+)
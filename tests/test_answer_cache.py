@@ -0,0 +1,71 @@
+import os
+import uuid
+from rag_pipeline.answer_cache import SemanticAnswerCache, get_answer_cache, notify_corpus_changed
+
+
+def store(cache, vector, answer="answer", seconds=2.0, corpus_version=None):
+    version = cache.corpus_version if corpus_version is None else corpus_version
+    cache.store(vector, answer, ["a.txt"], "rewritten", seconds, version)
+
+
+def test_similar_questions_hit_and_others_miss():
+    cache = SemanticAnswerCache(threshold=0.95)
+    assert cache.lookup([1.0, 0.0]) is None
+    store(cache, [1.0, 0.0], "east")
+    store(cache, [0.0, 1.0], "north")
+    hit = cache.lookup([10.0, 0.5])
+    assert hit["answer"] == "east"
+    assert hit["similarity"] > 0.95
+    assert cache.lookup([1.0, 1.0]) is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 2, 2)
+    assert stats["seconds_saved"] == 2.0
+
+
+def test_oldest_unused_entry_is_evicted():
+    cache = SemanticAnswerCache(max_entries=2)
+    store(cache, [1.0, 0.0, 0.0], "x")
+    store(cache, [0.0, 1.0, 0.0], "y")
+    assert cache.lookup([1.0, 0.0, 0.0])["answer"] == "x"
+    store(cache, [0.0, 0.0, 1.0], "z")
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.lookup([1.0, 0.0, 0.0])["answer"] == "x"
+
+
+def test_answers_from_an_older_corpus_are_dropped():
+    cache = SemanticAnswerCache()
+    store(cache, [1.0, 0.0], "before")
+    version = cache.corpus_version
+    cache.invalidate()
+    assert cache.lookup([1.0, 0.0]) is None
+    # Generated while the corpus changed
+    store(cache, [1.0, 0.0], "stale", corpus_version=version)
+    assert cache.stats()["entries"] == 0
+
+
+def test_replaced_marker_file_invalidates_other_instances(tmp_path):
+    path = str(tmp_path / "Docs")
+    other_process = SemanticAnswerCache(version_path=path)
+    store(other_process, [1.0, 0.0])
+    other_process.refresh()
+    assert other_process.lookup([1.0, 0.0]) is not None
+
+    tmp_path.joinpath("Docs.tmp").write_text("changed")
+    os.replace(str(tmp_path / "Docs.tmp"), path)
+    other_process.refresh()
+    assert other_process.lookup([1.0, 0.0]) is None
+    assert other_process.corpus_version == 1
+
+
+def test_notify_corpus_changed_invalidates_the_shared_cache():
+    name = f"Collection{uuid.uuid4().hex}"
+    cache = get_answer_cache(name)
+    assert get_answer_cache(name) is cache
+    store(cache, [1.0, 0.0])
+    notify_corpus_changed(name)
+    assert cache.lookup([1.0, 0.0]) is None
+    # A cache opened afterwards starts from the current marker
+    fresh = SemanticAnswerCache(version_path=cache.version_path)
+    store(fresh, [1.0, 0.0])
+    fresh.refresh()
+    assert fresh.lookup([1.0, 0.0]) is not None
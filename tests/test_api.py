@@ -0,0 +1,129 @@
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import pytest
+from fastapi.testclient import TestClient
+from passlib.hash import sha256_crypt
+import api
+from rag_pipeline import ingest_jobs
+from rag_pipeline.fakes import FakeEmbeddings
+from rag_pipeline.ingest_jobs import IngestJobQueue
+from rag_pipeline.rag_pipeline import StreamingAnswer
+
+PASSWORDS = {"alice": "alice-secret", "bob": "bob-secret"}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    users = {name: sha256_crypt.using(rounds=1000).hash(password) for name, password in PASSWORDS.items()}
+    (tmp_path / "users.json").write_text(json.dumps(users))
+    monkeypatch.setattr(api, "USERS_PATH", str(tmp_path / "users.json"))
+    monkeypatch.setattr(api, "_verified", {})
+    monkeypatch.setattr(api, "get_llm", lambda: None)
+    return TestClient(api.app)
+
+
+def login(name):
+    return name, PASSWORDS[name]
+
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    embeddings = FakeEmbeddings(dimensions=32)
+    monkeypatch.setattr(ingest_jobs, "get_embeddings", lambda: embeddings)
+    queue = IngestJobQueue(str(tmp_path / "jobs"), max_workers=1)
+    monkeypatch.setattr(api, "get_ingest_jobs", lambda: queue)
+    yield queue
+    queue.shutdown()
+
+
+def test_unknown_users_and_wrong_passwords_are_rejected(client):
+    assert client.get("/jobs/" + "0" * 32, auth=("mallory", "x")).status_code == 401
+    response = client.get("/jobs/" + "0" * 32, auth=("alice", "wrong"))
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Basic"
+    assert client.get("/jobs/" + "0" * 32, auth=login("alice")).status_code == 404
+
+
+def test_verified_passwords_are_not_cached_as_plain_hashes(client, monkeypatch):
+    assert client.get("/jobs/" + "0" * 32, auth=login("alice")).status_code == 404
+    assert hashlib.sha256(PASSWORDS["alice"].encode()).hexdigest() not in api._verified.values()
+    # Later requests skip the slow hash, but a wrong password is still rejected
+    monkeypatch.setattr(api.sha256_crypt, "verify", lambda *args: pytest.fail("password hashed again"))
+    assert client.get("/jobs/" + "0" * 32, auth=login("alice")).status_code == 404
+    monkeypatch.setattr(api.sha256_crypt, "verify", lambda *args: False)
+    assert client.get("/jobs/" + "0" * 32, auth=("alice", "wrong")).status_code == 401
+
+
+def test_query_without_documents_is_not_found(client):
+    response = client.post("/query", json={"question": "What is covered?"}, auth=login("bob"))
+    assert response.status_code == 404
+
+
+def test_jobs_are_only_visible_to_their_owner(client, jobs):
+    response = client.post("/documents", files=[("files", ("a.txt", b"Section 1.1 applies.", "text/plain"))],
+                           auth=login("alice"))
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert client.get(f"/jobs/{job_id}", auth=login("alice")).json()["id"] == job_id
+    assert client.get(f"/jobs/{job_id}", auth=login("bob")).status_code == 404
+    assert client.delete(f"/jobs/{job_id}", auth=login("bob")).status_code == 404
+
+
+def test_query_without_a_free_slot_fails_with_503(client, monkeypatch):
+    monkeypatch.setattr(api, "user_vector_store", lambda tenant: object())
+    monkeypatch.setattr(api, "query_slots", asyncio.Semaphore(0))
+    monkeypatch.setattr(api, "API_QUERY_TIMEOUT_SECONDS", 0.1)
+    response = client.post("/query", json={"question": "What is covered?"}, auth=login("alice"))
+    assert response.status_code == 503
+
+
+def test_slow_query_fails_with_504(client, monkeypatch):
+    async def slow_answer(*args, **kwargs):
+        await asyncio.sleep(5)
+
+    monkeypatch.setattr(api, "user_vector_store", lambda tenant: object())
+    monkeypatch.setattr(api, "aquery_rag", slow_answer)
+    monkeypatch.setattr(api, "API_QUERY_TIMEOUT_SECONDS", 0.1)
+    response = client.post("/query", json={"question": "What is covered?"}, auth=login("alice"))
+    assert response.status_code == 504
+
+
+def test_timed_out_stream_stops_generation(monkeypatch):
+    closed = threading.Event()
+
+    def pieces():
+        try:
+            yield "Hello"
+            time.sleep(0.3)
+            yield "late"
+            yield "never read"
+        finally:
+            closed.set()
+
+    # Held here so the generator isn't closed by garbage collection
+    answers = []
+
+    def stream_query_rag(*args, **kwargs):
+        answers.append(StreamingAnswer(pieces()))
+        return answers[-1]
+
+    monkeypatch.setattr(api, "stream_query_rag", stream_query_rag)
+    monkeypatch.setattr(api, "get_llm", lambda: None)
+    monkeypatch.setattr(api, "query_slots", asyncio.Semaphore(1))
+    monkeypatch.setattr(api, "API_QUERY_TIMEOUT_SECONDS", 0.1)
+
+    async def run():
+        events = [json.loads(line) async for line in api._answer_events("What is covered?", object(), None)]
+        # The piece being generated at the timeout finishes first, then the stream is closed
+        for _ in range(100):
+            if closed.is_set():
+                break
+            await asyncio.sleep(0.05)
+        return events
+
+    events = asyncio.run(run())
+    assert [event["type"] for event in events] == ["token", "error"]
+    assert closed.is_set()
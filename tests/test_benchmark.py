@@ -0,0 +1,44 @@
+import os
+import sys
+import json
+import subprocess
+import pytest
+from rag_pipeline.fakes import FakeEmbeddings, FakeLLM, FakeQueryRewriter, FakeRateLimitError
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_fake_embeddings_are_deterministic_and_rate_limited():
+    embeddings = FakeEmbeddings(dimensions=16, requests_per_second=2)
+    first = embeddings.embed_query("payment terms")
+    assert embeddings.embed_documents(["payment terms"]) == [first]
+    assert abs(sum(value * value for value in first) - 1.0) < 1e-9
+    with pytest.raises(FakeRateLimitError):
+        embeddings.embed_query("warranty")
+    assert (embeddings.calls, embeddings.rate_limited) == (2, 1)
+
+
+def test_fake_llm_streams_the_answer_it_would_return():
+    llm = FakeLLM(answer_words=5)
+    streamed = "".join(chunk.content for chunk in llm.stream("What about payment?"))
+    assert streamed == llm.invoke("What about payment?").content
+    assert len(streamed.split()) == 5
+    assert FakeQueryRewriter().rewrite_query("What about payment?") == "What about payment key facts and details"
+
+
+def test_benchmark_reports_ingestion_and_query_latency(tmp_path):
+    output = tmp_path / "bench.json"
+    subprocess.run(
+        [sys.executable, "benchmark.py", "--documents", "3", "--pages", "2", "--words-per-page", "60",
+         "--queries", "4", "--concurrency", "1,2", "--workers", "1", "--embed-latency", "0",
+         "--embed-text-latency", "0", "--rewrite-latency", "0", "--llm-latency", "0", "--output", str(output)],
+        cwd=ROOT, check=True, capture_output=True, timeout=120
+    )
+    report = json.loads(output.read_text())
+    [result] = report["results"]
+    assert result["documents"] == 3
+    assert result["pages"] >= 3 and result["chunks"] >= result["pages"]
+    assert set(result["ingestion"]) == {"load_documents", "split_documents", "store_embeddings"}
+    assert [run["concurrency"] for run in result["query_rag"]] == [1, 2]
+    assert all(run["queries"] == 4 and run["errors"] == 0 for run in result["query_rag"])
+    assert all(run["p50_ms"] <= run["p99_ms"] for run in result["query_rag"])
@@ -0,0 +1,72 @@
+from langchain_core.documents import Document
+from rag_pipeline.chunker import StructureAwareChunker, parse_heading
+from rag_pipeline.file_loader import iter_chunks
+from rag_pipeline.tokens import estimate_tokens
+
+
+def page(text, number=1, source="a.txt"):
+    return Document(page_content=text, metadata={"source": source, "page_number": number})
+
+
+def test_parse_heading():
+    assert parse_heading("Section 4.2 Payment") == ("Section 4.2", "Section 4.2 Payment")
+    assert parse_heading("4.2 Payment Terms") == ("Section 4.2", "4.2 Payment Terms")
+    assert parse_heading("## Overview") == (None, "Overview")
+    assert parse_heading("PAYMENT TERMS") == (None, "PAYMENT TERMS")
+    assert parse_heading("4.2 Payment is due within 30 days.") is None
+    assert parse_heading("An ordinary sentence.") is None
+
+
+def test_chunks_do_not_span_headings_and_carry_their_section():
+    chunker = StructureAwareChunker()
+    chunks = chunker.split_document(page("Section 1 Scope\nThe scope.\nSection 2 Payment\nPay on time."))
+    assert [chunk.page_content for chunk in chunks] == ["Section 1 Scope\nThe scope.", "Section 2 Payment\nPay on time."]
+    assert [chunk.metadata["section"] for chunk in chunks] == ["Section 1", "Section 2"]
+    assert chunks[0].metadata["page_number"] == 1
+
+
+def test_section_carries_over_to_the_next_page_of_the_same_source():
+    chunker = StructureAwareChunker()
+    chunker.split_document(page("Section 3 Warranty\nFirst page text.", 1))
+    assert chunker.split_document(page("More warranty text.", 2))[0].metadata["section"] == "Section 3"
+    assert chunker.split_document(page("Other file.", 1, source="b.txt"))[0].metadata["section"] is None
+
+
+def test_heading_without_body_joins_the_next_chunk():
+    chunker = StructureAwareChunker()
+    first = chunker.split_document(page("Some text.\nSection 5 Termination", 1))
+    assert [chunk.page_content for chunk in first] == ["Some text."]
+    second = chunker.split_document(page("Either party may terminate.", 2))
+    assert second[0].page_content == "Section 5 Termination\nEither party may terminate."
+    assert second[0].metadata["section"] == "Section 5"
+    assert second[0].metadata["page_number"] == 2
+
+
+def test_long_paragraphs_are_split_within_the_budget_with_overlap():
+    sentence = "The supplier shall deliver the goods on time and in full."
+    chunker = StructureAwareChunker(max_tokens=60, overlap_tokens=12, overlap_ratio=0.5)
+    chunks = chunker.split_document(page("Section 1 Delivery\n" + " ".join([sentence] * 12)))
+    assert len(chunks) > 1
+    for chunk in chunks:
+        assert estimate_tokens(chunk.page_content.replace("\n", " ")) <= 60 + 12
+        assert chunk.metadata["section"] == "Section 1"
+    # Later chunks start with the previous chunk's last sentence, and sentences are joined with spaces
+    assert chunks[1].page_content.startswith(sentence)
+    assert "\n" not in chunks[1].page_content
+
+
+def test_trailing_headings_are_kept_as_a_chunk_of_their_source():
+    chunker = StructureAwareChunker()
+    chunker.split_document(page("Body text.\nAPPENDIX A", 3))
+    chunks = chunker.split_document(page("Other file.", 1, source="b.txt"))
+    assert [(chunk.page_content, chunk.metadata["source"]) for chunk in chunks] == \
+        [("APPENDIX A", "a.txt"), ("Other file.", "b.txt")]
+    assert chunks[0].metadata["page_number"] == 3 and chunks[0].metadata["heading"] == "APPENDIX A"
+    chunker.split_document(page("Section 9 Notices", 2, source="b.txt"))
+    assert [chunk.page_content for chunk in chunker.finish()] == ["Section 9 Notices"]
+    assert chunker.finish() == []
+
+
+def test_iter_chunks_keeps_headings_at_the_end_of_the_last_document():
+    chunks = list(iter_chunks([page("Body text.\nAPPENDIX A")]))
+    assert [chunk.page_content for chunk in chunks] == ["Body text.", "APPENDIX A"]
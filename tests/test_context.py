@@ -0,0 +1,85 @@
+import numpy as np
+from langchain_core.documents import Document
+from rag_pipeline.context import (
+    GAP_MARKER, compress_documents, format_context, mmr_rerank, pack_context, source_label, split_sentences
+)
+from rag_pipeline.tokens import estimate_tokens
+
+
+def doc(text, source="a.pdf", page=None, section=None):
+    return Document(page_content=text, metadata={"source": source, "page_number": page, "section": section})
+
+
+def test_mmr_with_full_relevance_weight_ranks_by_similarity():
+    query = np.array([1.0, 0.0])
+    vectors = np.array([[0.5, 0.5], [1.0, 0.0], [0.0, 1.0]])
+    assert mmr_rerank(query, vectors, k=3, lambda_mult=1.0) == [1, 0, 2]
+
+
+def test_mmr_skips_near_duplicates_of_selected_candidates():
+    query = np.array([1.0, 0.0, 0.0])
+    vectors = np.array([[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [0.7, 0.0, 0.7]])
+    assert mmr_rerank(query, vectors, k=2, lambda_mult=0.5) == [0, 2]
+
+
+def test_mmr_drops_candidates_far_less_relevant_than_the_best():
+    query = np.array([1.0, 0.0])
+    vectors = np.array([[1.0, 0.0], [0.1, 1.0], [0.9, 0.1]])
+    assert mmr_rerank(query, vectors, k=3, relative_relevance=0.5) == [0, 2]
+    assert mmr_rerank(query, np.empty((0, 2)), k=3) == [] and mmr_rerank(query, vectors, k=0) == []
+
+
+def test_source_label():
+    assert source_label(doc("x", page=3, section="Section 4.2")) == "[a.pdf, page 3, Section 4.2]"
+    assert source_label(Document(page_content="x")) == "[unknown source]"
+
+
+def test_pack_context_skips_chunks_that_do_not_fit():
+    long_doc, short_doc = doc("x" * 400, page=1), doc("short", page=2)
+    first = doc("first", page=3)
+    budget = estimate_tokens(source_label(first)) + estimate_tokens("first") + 10
+    context, packed = pack_context([first, long_doc, short_doc], budget)
+    assert packed == [first, short_doc]
+    # The best chunk is kept even when it alone is over budget
+    assert pack_context([long_doc], 1)[1] == [long_doc]
+    assert pack_context([first, short_doc, long_doc], 10_000, max_chunks=2)[1] == [first, short_doc]
+
+
+def test_context_groups_chunks_by_source_and_page():
+    context = format_context([doc("b page 1", source="b.pdf", page=1), doc("a page 2", page=2), doc("a page 1", page=1)])
+    assert context == "[a.pdf, page 1]\na page 1\n\n[a.pdf, page 2]\na page 2\n\n[b.pdf, page 1]\nb page 1"
+
+
+class TopicEmbeddings:
+    """Embeds a sentence as 1.0 on the axis of each topic word it mentions."""
+
+    topics = ("premium", "deductible", "claims")
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [[1.0 if topic in text.lower() else 0.0 for topic in self.topics] + [0.1] for text in texts]
+
+
+def test_split_sentences():
+    assert split_sentences("One. Two?\n\nThree!  Four") == ["One.", "Two?", "Three!", "Four"]
+
+
+def test_compression_keeps_relevant_sentences_in_order():
+    policy = doc("The premium is paid monthly. Claims go to the insurer. A premium rise needs notice.", page=1)
+    other = doc("Claims are handled within a week. Deductible rules apply.", source="b.pdf", page=2)
+    embeddings = TopicEmbeddings()
+    compressed = compress_documents(np.array([1.0, 0.0, 0.0, 0.0]), [policy, other], embeddings, ratio=0.5)
+    assert embeddings.calls == 1
+    assert [d.page_content for d in compressed] == [f"The premium is paid monthly.{GAP_MARKER}A premium rise needs notice."]
+    assert compressed[0].metadata == policy.metadata
+
+
+def test_compression_within_target_returns_documents_unchanged():
+    documents = [doc("Short text. Very short.")]
+    embeddings = TopicEmbeddings()
+    target = estimate_tokens("Short text.") + estimate_tokens("Very short.")
+    assert compress_documents(np.ones(4), documents, embeddings, token_target=target) == documents
+    assert embeddings.calls == 0
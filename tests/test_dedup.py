@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from rag_pipeline.dedup import ChunkDeduplicator, chunk_reference
+
+TEXT = ("The supplier shall deliver all goods listed in the purchase order to the buyer's warehouse "
+        "within thirty days of the order date, and shall bear the cost of shipping and insurance.")
+
+
+def test_num_perm_must_split_into_bands():
+    with pytest.raises(ValueError):
+        ChunkDeduplicator(num_perm=100, bands=16)
+
+
+def test_signatures_estimate_jaccard_similarity():
+    deduplicator = ChunkDeduplicator()
+    same = deduplicator.signature(TEXT)
+    assert np.array_equal(same, deduplicator.signature(TEXT.upper()))
+    unrelated = deduplicator.signature("Quarterly revenue grew because of strong demand for turbine sensors.")
+    assert np.mean(same == unrelated) < 0.2
+
+
+def test_exact_and_near_duplicates_are_found():
+    deduplicator = ChunkDeduplicator(threshold=0.7)
+    deduplicator.add("original", TEXT, {"source": "a.txt"})
+    assert deduplicator.find(TEXT.upper() + "!!") == "original"
+    assert deduplicator.find(TEXT.replace("insurance.", "insurance costs.")) == "original"
+    assert deduplicator.find("An unrelated clause about confidentiality of the agreement terms.") is None
+    stats = deduplicator.stats()
+    assert stats["exact_duplicates"] == 1 and stats["near_duplicates"] == 1 and stats["checked"] == 3
+
+
+def test_references_follow_collapsed_chunks():
+    deduplicator = ChunkDeduplicator()
+    deduplicator.add("original", TEXT, {"source": "a.txt"})
+    deduplicator.add_reference("original", {"source": "b.txt", "page_number": 2})
+    deduplicator.add_reference("original", {"source": "b.txt", "page_number": 2})
+    assert deduplicator.references("original") == [{"source": "a.txt"}, {"source": "b.txt", "page_number": 2}]
+    assert deduplicator.forget_source("b.txt") == ["original"]
+    assert deduplicator.references("original") == [{"source": "a.txt"}]
+
+
+def test_removed_chunks_are_no_longer_matched():
+    deduplicator = ChunkDeduplicator()
+    deduplicator.add("original", TEXT, {"source": "a.txt"})
+    deduplicator.remove(["original"])
+    assert "original" not in deduplicator and deduplicator.find(TEXT) is None
+
+
+def test_persist_and_reload(tmp_path):
+    path = str(tmp_path / "dedup")
+    reader = ChunkDeduplicator(path)
+    writer = ChunkDeduplicator(path)
+    writer.add("original", TEXT, {"source": "a.txt"})
+    writer.add("removed", "Some other text entirely, about invoices.", {"source": "a.txt"})
+    writer.remove(["removed"])
+    writer.persist()
+    reader.refresh()
+    assert reader.find(TEXT) == "original" and "removed" not in reader
+    assert ChunkDeduplicator(path).references("original") == [{"source": "a.txt"}]
+
+
+def test_chunk_reference_keeps_set_fields():
+    chunk = Document(page_content="x", metadata={"source": "a.pdf", "page_number": 3, "section": None, "other": 1})
+    assert chunk_reference(chunk) == {"source": "a.pdf", "page_number": 3}
@@ -0,0 +1,59 @@
+from rag_pipeline.embedding_cache import CachedEmbeddings, embedding_key
+from rag_pipeline.fakes import FakeEmbeddings
+
+
+def cached(tmp_path, embeddings=None, max_entries=100):
+    return CachedEmbeddings(embeddings or FakeEmbeddings(dimensions=8), "test-model",
+                            str(tmp_path / "embeddings.sqlite3"), max_entries=max_entries)
+
+
+def test_key_depends_on_model_task_and_text():
+    key = embedding_key("model", "document", "text")
+    assert key == embedding_key("model", "document", "text")
+    assert key != embedding_key("other", "document", "text")
+    assert key != embedding_key("model", "query", "text")
+    assert key != embedding_key("model", "document", "text!")
+
+
+def test_only_misses_reach_the_embedder(tmp_path):
+    embeddings = FakeEmbeddings(dimensions=8)
+    cache = cached(tmp_path, embeddings)
+    first = cache.embed_documents(["a", "b"])
+    assert embeddings.texts_embedded == 2
+    second = cache.embed_documents(["b", "c", "a"])
+    assert embeddings.texts_embedded == 3
+    assert second[0] == first[1] and second[2] == first[0]
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 3
+
+
+def test_repeated_texts_in_one_request_are_embedded_once(tmp_path):
+    embeddings = FakeEmbeddings(dimensions=8)
+    vectors = cached(tmp_path, embeddings).embed_documents(["same", "same", "same"])
+    assert embeddings.texts_embedded == 1
+    assert vectors[0] == vectors[1] == vectors[2]
+
+
+def test_vectors_survive_reopening(tmp_path):
+    vector = cached(tmp_path).embed_query("question")
+    embeddings = FakeEmbeddings(dimensions=8)
+    reopened = cached(tmp_path, embeddings)
+    assert reopened.embed_query("question") == vector
+    assert embeddings.calls == 0
+    # Documents and queries are cached under different keys
+    reopened.embed_documents(["question"])
+    assert embeddings.texts_embedded == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    embeddings = FakeEmbeddings(dimensions=8)
+    cache = cached(tmp_path, embeddings, max_entries=2)
+    cache.embed_documents(["old"])
+    cache.embed_documents(["kept"])
+    cache.embed_documents(["old"])
+    cache.embed_documents(["new"])
+    assert cache.stats()["entries"] == 2
+    embedded = embeddings.texts_embedded
+    cache.embed_documents(["old", "new"])
+    assert embeddings.texts_embedded == embedded
+    cache.embed_documents(["kept"])
+    assert embeddings.texts_embedded == embedded + 1
@@ -0,0 +1,125 @@
+import time
+import threading
+import pytest
+from langchain_core.documents import Document
+from rag_pipeline.embedding_scheduler import EmbeddingScheduler, is_rate_limit_error
+from rag_pipeline.fakes import FakeEmbeddings, FakeRateLimitError
+
+
+class FlakyEmbeddings(FakeEmbeddings):
+    """Raises ``errors`` one at a time before answering, and records peak concurrency."""
+
+    def __init__(self, errors=(), latency=0.0):
+        super().__init__(dimensions=4, latency=latency)
+        self.errors = list(errors)
+        self.active = 0
+        self.peak = 0
+        self._count_lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._count_lock:
+            if self.errors:
+                raise self.errors.pop(0)
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            return super().embed_documents(texts)
+        finally:
+            with self._count_lock:
+                self.active -= 1
+
+
+def batches(count, size=2):
+    for batch in range(count):
+        documents = [Document(page_content=f"text {batch} {index}") for index in range(size)]
+        yield documents, [f"{batch}-{index}" for index in range(size)]
+
+
+def test_rate_limit_errors_are_recognised():
+    assert is_rate_limit_error(FakeRateLimitError("quota"))
+    assert is_rate_limit_error(RuntimeError("429 RESOURCE_EXHAUSTED"))
+    assert not is_rate_limit_error(ValueError("bad input"))
+
+
+def test_every_batch_is_written_and_reported():
+    written, reported = {}, []
+    scheduler = EmbeddingScheduler(FlakyEmbeddings(), max_concurrency=3)
+
+    def writer(documents, vectors, ids):
+        written.update(zip(ids, vectors))
+
+    stats = scheduler.run(list(batches(5)) + [([], [])], writer, lambda documents, ids: reported.append(ids))
+    assert len(written) == 10 and all(len(vector) == 4 for vector in written.values())
+    # The empty batch is reported without being embedded
+    assert len(reported) == 6 and [] in reported
+    assert stats["batches"] == 6 and stats["texts"] == 10
+
+
+def test_requests_in_flight_stay_under_the_limit():
+    embeddings = FlakyEmbeddings(latency=0.02)
+    EmbeddingScheduler(embeddings, max_concurrency=2).run(batches(8), lambda *args: None)
+    assert embeddings.peak == 2
+
+
+def test_rate_limited_requests_are_retried():
+    embeddings = FlakyEmbeddings(errors=[FakeRateLimitError("429"), FakeRateLimitError("429")])
+    scheduler = EmbeddingScheduler(embeddings, max_concurrency=1, initial_backoff=0.01)
+    written = []
+    stats = scheduler.run(batches(2), lambda documents, vectors, ids: written.extend(ids))
+    assert len(written) == 4
+    assert stats["rate_limited"] == 2 and stats["retries"] == 2
+
+
+def test_gives_up_after_max_retries():
+    embeddings = FlakyEmbeddings(errors=[FakeRateLimitError("429")] * 3)
+    scheduler = EmbeddingScheduler(embeddings, max_concurrency=1, max_retries=2, initial_backoff=0.01)
+    with pytest.raises(FakeRateLimitError):
+        scheduler.run(batches(1), lambda *args: None)
+
+
+def test_other_errors_are_not_retried():
+    scheduler = EmbeddingScheduler(FlakyEmbeddings(errors=[ValueError("bad input")]), initial_backoff=0.01)
+    with pytest.raises(ValueError):
+        scheduler.run(batches(1), lambda *args: None)
+    assert scheduler.stats["retries"] == 0
+
+
+def aimd_scheduler(max_concurrency=8):
+    scheduler = EmbeddingScheduler(None, max_concurrency=max_concurrency, initial_backoff=1.0, max_backoff=4.0)
+    scheduler._limit = max_concurrency
+    scheduler._backoff = scheduler.initial_backoff
+    scheduler._resume_at = 0.0
+    scheduler._limited_at = 0.0
+    return scheduler
+
+
+def test_rate_limit_halves_concurrency_and_doubles_backoff():
+    scheduler = aimd_scheduler()
+    for limit, backoff in ((4, 2.0), (2, 4.0), (1, 4.0), (1, 4.0)):
+        before = time.monotonic()
+        scheduler._on_rate_limited(time.monotonic())
+        assert scheduler._limit == limit
+        assert scheduler._backoff == backoff
+        assert scheduler._resume_at >= before
+
+
+def test_rate_limits_from_the_same_burst_count_once():
+    scheduler = aimd_scheduler()
+    started = time.monotonic()
+    scheduler._on_rate_limited(time.monotonic())
+    # A request sent before the first 429 arrived
+    scheduler._on_rate_limited(started)
+    assert scheduler._limit == 4 and scheduler._backoff == 2.0
+    assert scheduler.stats["rate_limited"] == 2
+
+
+def test_success_grows_concurrency_by_one_and_resets_backoff():
+    scheduler = aimd_scheduler()
+    scheduler._on_rate_limited(time.monotonic())
+    scheduler._on_rate_limited(time.monotonic())
+    assert scheduler._limit == 2
+    scheduler._on_success()
+    assert scheduler._limit == 3 and scheduler._backoff == scheduler.initial_backoff
+    for _ in range(10):
+        scheduler._on_success()
+    assert scheduler._limit == scheduler.max_concurrency
@@ -0,0 +1,63 @@
+import io
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from rag_pipeline import file_loader
+from rag_pipeline.file_loader import BufferStream, _iter_pages, iter_documents, iter_upload_documents
+
+
+def test_buffer_stream_reads_and_seeks_without_copying():
+    data = bytearray(b"0123456789")
+    stream = io.BufferedReader(BufferStream(memoryview(data)))
+    assert stream.read(4) == b"0123"
+    stream.seek(-3, io.SEEK_END)
+    assert stream.read() == b"789"
+    stream.seek(2)
+    data[2:4] = b"ab"
+    assert stream.read(3) == b"ab4"
+
+
+def test_uploads_parse_like_files_on_disk(tmp_path):
+    text = "TERMS AND CONDITIONS\n\nSection 2.1 covers payment."
+    (tmp_path / "a.txt").write_text(text)
+    on_disk = list(iter_documents([str(tmp_path / "a.txt")], max_workers=1))
+    uploads = [("a.txt", text.encode()), ("b.txt", io.BytesIO(b"Second file."))]
+    in_memory = list(iter_upload_documents(uploads))
+    assert [(doc.page_content, doc.metadata) for doc in in_memory[:1]] == \
+        [(doc.page_content, doc.metadata) for doc in on_disk]
+    assert in_memory[0].metadata["section"] == "Section 2.1"
+    assert in_memory[1].page_content == "Second file."
+
+
+def test_pool_yields_pages_in_file_order_and_skips_broken_files(tmp_path):
+    paths = []
+    for index in range(5):
+        (tmp_path / f"doc{index}.txt").write_text(f"Document {index}.")
+        paths.append(str(tmp_path / f"doc{index}.txt"))
+    (tmp_path / "broken.pdf").write_bytes(b"not a pdf")
+    paths.insert(2, str(tmp_path / "broken.pdf"))
+    errors = []
+    pooled = [page.page_content for page in iter_documents(paths, max_workers=2, errors=errors)]
+    assert pooled == [f"Document {index}." for index in range(5)]
+    assert [name for name, _ in errors] == ["broken.pdf"]
+    assert pooled == [page.page_content for page in iter_documents(paths, max_workers=1)]
+
+
+def _pages_failing_after_one(name, stream):
+    yield from _iter_pages(name, stream)
+    if name.startswith("bad"):
+        raise ValueError("broken page 2")
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_file_failing_mid_parse_keeps_pages_read_before_the_error(tmp_path, monkeypatch, max_workers):
+    monkeypatch.setattr(file_loader, "_iter_pages", _pages_failing_after_one)
+    # Run the pool path's workers in this process, where the patch applies
+    monkeypatch.setattr(file_loader, "ProcessPoolExecutor", ThreadPoolExecutor)
+    paths = []
+    for name in ("bad.txt", "good.txt"):
+        (tmp_path / name).write_text(f"Page one of {name}.")
+        paths.append(str(tmp_path / name))
+    errors = []
+    pages = list(iter_documents(paths, max_workers=max_workers, errors=errors))
+    assert [page.page_content for page in pages] == ["Page one of bad.txt.", "Page one of good.txt."]
+    assert errors == [("bad.txt", "broken page 2")]
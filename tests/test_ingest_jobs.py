@@ -0,0 +1,257 @@
+import os
+import time
+import multiprocessing
+import pytest
+from rag_pipeline import ingest_jobs
+from rag_pipeline.fakes import FakeEmbeddings
+from rag_pipeline.ingest_jobs import IngestCheckpoint, IngestJob, IngestJobQueue, read_record, try_lock
+from rag_pipeline.resources import get_ingest_manifest
+from rag_pipeline.tenants import tenant_scope
+
+
+def document(name, paragraphs=12):
+    return "\n\n".join(
+        f"Paragraph {index} of {name}. " + " ".join(f"{name}{index}term{word}" for word in range(40))
+        for index in range(paragraphs)
+    ).encode("utf-8")
+
+
+def wait_for(queue, job_id, timeout=30):
+    deadline = time.monotonic() + timeout
+    while queue.status(job_id)["status"] in ingest_jobs.UNFINISHED_STATES:
+        assert time.monotonic() < deadline, f"job {job_id} did not finish"
+        time.sleep(0.05)
+    return queue.status(job_id)
+
+
+@pytest.fixture
+def embeddings(monkeypatch):
+    embeddings = FakeEmbeddings(dimensions=32)
+    monkeypatch.setattr(ingest_jobs, "get_embeddings", lambda: embeddings)
+    return embeddings
+
+
+@pytest.fixture
+def open_queue(tmp_path):
+    queues = []
+
+    def open_queue(max_workers=2):
+        queue = IngestJobQueue(str(tmp_path / "jobs"), max_workers=max_workers)
+        queues.append(queue)
+        return queue
+
+    yield open_queue
+    for queue in queues:
+        queue.shutdown()
+
+
+def test_checkpoint_reloads_written_ids_and_legacy_lines(tmp_path):
+    path = str(tmp_path / "checkpoint.txt")
+    checkpoint = IngestCheckpoint(path)
+    checkpoint.add(["1", "2"], ["a.txt", "b.txt"])
+    with open(path, "a") as f:
+        # Written before checkpoints recorded source files
+        f.write("3\n")
+    reloaded = IngestCheckpoint(path)
+    assert reloaded.sources == {"1": "a.txt", "2": "b.txt", "3": None}
+    assert set(reloaded.ids) == {"1", "2", "3"}
+
+
+def test_try_lock_excludes_other_holders_until_closed(tmp_path):
+    path = str(tmp_path / "slot.lock")
+    held = try_lock(path)
+    assert held is not None
+    assert try_lock(path) is None
+    held.close()
+    again = try_lock(path)
+    assert again is not None
+    again.close()
+
+
+def test_job_runs_to_completion(embeddings, open_queue):
+    queue = open_queue()
+    job_id = queue.submit([("a.txt", document("alpha")), ("b.txt", document("beta"))],
+                          "Completed", fingerprints={"a.txt": "fa", "b.txt": "fb"})
+    record = wait_for(queue, job_id)
+    assert record["status"] == "completed"
+    assert [entry["status"] for entry in record["files"]] == ["done", "done"]
+    assert record["progress"]["embedded"] == embeddings.texts_embedded > 0
+    manifest = get_ingest_manifest()
+    scope = tenant_scope("Completed", None)
+    assert manifest.is_unchanged(scope, "a.txt", "fa")
+    assert manifest.chunk_ids(scope, "b.txt")
+    # Spooled uploads and the checkpoint are deleted once the job finishes
+    assert not {"files", "checkpoint.txt"} & set(os.listdir(os.path.join(queue.directory, job_id)))
+    assert [record["id"] for record in queue.jobs("Completed")] == [job_id]
+
+
+def test_cancelled_job_is_not_run(embeddings, open_queue):
+    queue = open_queue(max_workers=1)
+    # Hold the only slot so the job stays queued until it is cancelled
+    slot = try_lock(os.path.join(queue.directory, "slots", "0.lock"))
+    try:
+        job_id = queue.submit([("a.txt", document("alpha"))], "Cancelled")
+        assert queue.status(job_id)["status"] == "queued"
+        assert queue.cancel(job_id)
+    finally:
+        slot.close()
+    record = wait_for(queue, job_id)
+    assert record["status"] == "cancelled"
+    assert embeddings.texts_embedded == 0
+    assert not queue.cancel(job_id)
+    assert queue.status("0" * 32) is None
+    assert queue.status("../escape") is None
+
+
+def test_resumed_job_embeds_only_unwritten_chunks(embeddings, open_queue):
+    queue = open_queue()
+    data = document("gamma", paragraphs=30)
+    first = wait_for(queue, queue.submit([("a.txt", data)], "FirstRun"))
+    total = first["progress"]["embedded"]
+    chunk_ids = sorted(get_ingest_manifest().chunk_ids(tenant_scope("FirstRun", None), "a.txt"))
+    assert len(chunk_ids) == total > 2
+    queue.shutdown()
+
+    # A job that a stopped process had part-way through: half its batches written
+    directory = os.path.join(queue.directory, "f" * 32)
+    os.makedirs(os.path.join(directory, "files"))
+    with open(os.path.join(directory, "files", "a.txt"), "wb") as f:
+        f.write(data)
+    interrupted = IngestJob(directory, {
+        "id": "f" * 32, "collection": "Resumed", "tenant": None, "status": "running",
+        "files": [{"name": "a.txt", "fingerprint": "fa", "status": "processing",
+                   "pages": 0, "chunks": 0, "error": None}],
+        "progress": {}, "resumed_chunks": 0, "error": None,
+        "submitted_at": time.time(), "started_at": time.time(), "finished_at": None,
+    })
+    interrupted.checkpoint.add(chunk_ids[:total // 2], ["a.txt"] * (total // 2))
+    interrupted.save()
+
+    embedded_before = embeddings.texts_embedded
+    resumed = wait_for(open_queue(), "f" * 32)
+    assert resumed["status"] == "completed"
+    assert resumed["resumed_chunks"] == total // 2
+    assert embeddings.texts_embedded - embedded_before == total - total // 2
+    assert sorted(get_ingest_manifest().chunk_ids(tenant_scope("Resumed", None), "a.txt")) == chunk_ids
+
+
+def _hold_claim(directory, claimed, release):
+    job = IngestJob(directory, read_record(directory))
+    assert job.claim()
+    claimed.set()
+    release.wait(60)
+    job.release()
+
+
+def _hold_slot(path, held, release):
+    handle = try_lock(path)
+    assert handle is not None
+    held.set()
+    release.wait(60)
+    handle.close()
+
+
+def _spawn(target, *args):
+    context = multiprocessing.get_context("spawn")
+    ready, release = context.Event(), context.Event()
+    process = context.Process(target=target, args=args + (ready, release))
+    process.start()
+    assert ready.wait(60)
+    return process, release
+
+
+def test_job_claimed_by_another_process_is_left_to_it(tmp_path, embeddings, open_queue):
+    directory = str(tmp_path / "jobs" / ("e" * 32))
+    os.makedirs(os.path.join(directory, "files"))
+    with open(os.path.join(directory, "files", "a.txt"), "wb") as f:
+        f.write(document("epsilon"))
+    IngestJob(directory, {
+        "id": "e" * 32, "collection": "Claimed", "tenant": None, "status": "running",
+        "files": [{"name": "a.txt", "fingerprint": None, "status": "processing",
+                   "pages": 0, "chunks": 0, "error": None}],
+        "progress": {}, "resumed_chunks": 0, "error": None,
+        "submitted_at": time.time(), "started_at": time.time(), "finished_at": None,
+    }).save()
+
+    process, release = _spawn(_hold_claim, directory)
+    try:
+        assert not IngestJob(directory, read_record(directory)).claim()
+        queue = open_queue()
+        time.sleep(0.2)
+        # Still the other process's job: not resumed, but its status is readable here
+        assert "e" * 32 not in queue._jobs
+        assert queue.status("e" * 32)["status"] == "running"
+        assert queue.cancel("e" * 32)
+        assert os.path.exists(ingest_jobs.cancel_marker(directory))
+    finally:
+        release.set()
+        process.join(60)
+    assert process.exitcode == 0
+    # Once that process is gone, the next one to start picks the job up and sees the cancellation
+    assert wait_for(open_queue(), "e" * 32)["status"] == "cancelled"
+    assert embeddings.texts_embedded == 0
+
+
+def test_job_slots_are_shared_with_other_processes(tmp_path, embeddings, open_queue):
+    queue = open_queue(max_workers=1)
+    process, release = _spawn(_hold_slot, os.path.join(queue.directory, "slots", "0.lock"))
+    try:
+        job_id = queue.submit([("a.txt", document("delta"))], "Slots")
+        time.sleep(2 * ingest_jobs.LOCK_POLL_SECONDS)
+        assert queue.status(job_id)["status"] == "queued"
+        assert embeddings.texts_embedded == 0
+    finally:
+        release.set()
+        process.join(60)
+    assert process.exitcode == 0
+    assert wait_for(queue, job_id)["status"] == "completed"
+    assert embeddings.texts_embedded > 0
+
+
+def test_busy_tenant_does_not_hold_up_other_tenants(monkeypatch, open_queue):
+    embeddings = FakeEmbeddings(dimensions=32, latency=0.5)
+    monkeypatch.setattr(ingest_jobs, "get_embeddings", lambda: embeddings)
+    queue = open_queue(max_workers=2)
+    first = queue.submit([("a.txt", document("alpha"))], "Tenants", tenant="alice")
+    second = queue.submit([("b.txt", document("beta"))], "Tenants", tenant="alice")
+    other = queue.submit([("c.txt", document("gamma"))], "Tenants", tenant="bob")
+    first, second, other = (wait_for(queue, job_id) for job_id in (first, second, other))
+    assert first["status"] == second["status"] == other["status"] == "completed"
+    # The idle worker ran bob's job alongside alice's first, and alice's jobs ran one after another
+    assert other["started_at"] < first["finished_at"]
+    assert second["started_at"] >= first["finished_at"]
+
+
+def test_job_without_resume_parses_uploads_from_memory(embeddings, open_queue):
+    queue = open_queue()
+    job_id = queue.submit([("a.txt", document("alpha")), ("b.txt", memoryview(document("beta")))],
+                          "InMemory", resumable=False)
+    assert os.listdir(os.path.join(queue.directory, job_id, "files")) == []
+    record = wait_for(queue, job_id)
+    assert record["status"] == "completed"
+    assert [entry["status"] for entry in record["files"]] == ["done", "done"]
+    assert embeddings.texts_embedded > 0
+
+
+def test_interrupted_job_without_spooled_uploads_fails_on_restart(embeddings, open_queue):
+    queue = open_queue()
+    directory = os.path.join(queue.directory, "d" * 32)
+    os.makedirs(os.path.join(directory, "files"))
+    interrupted = IngestJob(directory, {
+        "id": "d" * 32, "collection": "Lost", "tenant": None, "status": "running", "resumable": False,
+        "files": [{"name": "a.txt", "fingerprint": "fa", "status": "processing",
+                   "pages": 0, "chunks": 0, "error": None}],
+        "progress": {}, "resumed_chunks": 0, "error": None,
+        "submitted_at": time.time(), "started_at": time.time(), "finished_at": None,
+    })
+    interrupted.checkpoint.add(["1", "2"], ["a.txt", "a.txt"])
+    interrupted.save()
+
+    record = open_queue().status("d" * 32)
+    assert record["status"] == "failed"
+    assert record["files"][0]["status"] == "failed"
+    assert embeddings.texts_embedded == 0
+    # What it wrote is recorded, so the next upload of the file replaces it
+    manifest = get_ingest_manifest()
+    assert manifest.chunk_ids(tenant_scope("Lost", None), "a.txt") == {"1", "2"}
+    assert not manifest.is_unchanged(tenant_scope("Lost", None), "a.txt", "fa")
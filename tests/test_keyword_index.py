@@ -0,0 +1,98 @@
+import numpy as np
+from langchain_core.documents import Document
+from rag_pipeline.keyword_index import BM25Index, HybridRetriever, reciprocal_rank_fusion, tokenize
+from rag_pipeline.local_vector_store import LocalVectorStore
+
+
+def doc(text, source="a.txt", **metadata):
+    return Document(page_content=text, metadata={"source": source, **metadata})
+
+
+def test_tokenize_keeps_compound_tokens_and_their_parts():
+    assert tokenize("See Section 4.2 and XJ-200") == ["see", "section", "4.2", "4", "2", "and", "xj-200", "xj", "200"]
+
+
+def test_bm25_ranks_rarer_and_more_frequent_terms_higher():
+    index = BM25Index()
+    index.add(["common", "rare", "other"], [
+        doc("payment payment terms"),
+        doc("payment warranty warranty"),
+        doc("delivery schedule"),
+    ])
+    assert [d.id for d, _ in index.search("warranty")] == ["rare"]
+    assert [d.id for d, _ in index.search("payment")] == ["common", "rare"]
+    assert index.search("missing") == [] and index.search("") == []
+
+
+def test_section_metadata_is_searchable():
+    index = BM25Index()
+    index.add(["a", "b"], [doc("late fees apply", section="Section 4.2"), doc("section about something else")])
+    assert index.search("4.2")[0][0].id == "a"
+
+
+def test_add_replaces_and_remove_forgets():
+    index = BM25Index()
+    index.add(["a"], [doc("payment terms")])
+    index.add(["a"], [doc("warranty terms")])
+    assert len(index) == 1 and index.search("payment") == []
+    index.update_metadata({"a": {"heading": "Refunds"}})
+    assert index.search("refunds")[0][0].metadata["heading"] == "Refunds"
+    index.remove(["a"])
+    assert len(index) == 0 and index.search("warranty") == []
+
+
+def test_persist_and_reload_across_instances(tmp_path):
+    path = str(tmp_path / "index.json")
+    reader = BM25Index(path)
+    writer = BM25Index(path)
+    writer.add(["a"], [doc("payment terms")])
+    writer.persist()
+    assert [d.id for d, _ in reader.search("payment")] == ["a"]
+    assert [d.id for d, _ in BM25Index(path).search("payment")] == ["a"]
+
+
+def test_rrf_prefers_documents_ranked_well_in_both_lists():
+    a, b, c = doc("a"), doc("b"), doc("c")
+    fused = reciprocal_rank_fusion([[a, b, c], [b, c]], k=3, rrf_k=60)
+    assert [d.page_content for d in fused] == ["b", "c", "a"]
+    # Chunks are matched by source and text, not identity
+    assert len(reciprocal_rank_fusion([[doc("x")], [doc("x")], [doc("x", source="b.txt")]], k=5)) == 2
+
+
+class ListStore:
+    embeddings = None
+
+    def __init__(self, results):
+        self.results = results
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return self.results[:k]
+
+
+def test_hybrid_retriever_adds_keyword_only_hits():
+    index = BM25Index()
+    index.add(["code"], [doc("error XJ-200 reset procedure")])
+    retriever = HybridRetriever(ListStore([doc("unrelated vector hit")]), index)
+    results = retriever.similarity_search("XJ-200", k=2)
+    assert {d.page_content for d in results} == {"unrelated vector hit", "error XJ-200 reset procedure"}
+
+
+class QueryOnlyEmbeddings:
+    def embed_query(self, text):
+        return [1.0, 0.0, 0.0]
+
+    def embed_documents(self, texts):
+        raise AssertionError("stored chunks must not be embedded again")
+
+
+def test_keyword_only_hits_get_their_stored_vectors():
+    store = LocalVectorStore(QueryOnlyEmbeddings())
+    store.add_vectors([doc("close to the query"), doc("error XJ-200 reset procedure")],
+                      np.array([[1.0, 0.0, 0.0], [0.0, 0.0, 2.0]]), ["near", "code"])
+    index = BM25Index()
+    index.add(["code"], [doc("error XJ-200 reset procedure")])
+    retriever = HybridRetriever(store, index, fetch_k=1)
+    pairs = retriever.similarity_search_with_vectors("XJ-200", k=2)
+    assert {d.page_content: list(vector) for d, vector in pairs} == {
+        "close to the query": [1.0, 0.0, 0.0], "error XJ-200 reset procedure": [0.0, 0.0, 1.0]
+    }
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from rag_pipeline.local_vector_store import LocalVectorStore
+
+
+def vectors(count, dimensions=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+
+
+def add(store, matrix, prefix="doc"):
+    ids = [f"{prefix}{index}" for index in range(len(matrix))]
+    documents = [Document(page_content=f"text of {doc_id}", metadata={"source": f"{prefix}.txt"}) for doc_id in ids]
+    store.add_vectors(documents, matrix, ids)
+    return ids
+
+
+def nearest(store, vector, k=1):
+    return [doc.id for doc in store.similarity_search_by_vector(vector, k=k)]
+
+
+def test_exact_search_returns_nearest_by_cosine():
+    matrix = vectors(50)
+    store = LocalVectorStore(None)
+    add(store, matrix)
+    for row in (0, 17, 49):
+        assert nearest(store, matrix[row] * 3.0) == [f"doc{row}"]
+    scores = [score for _, score in store.similarity_search_by_vector_with_score(matrix[5], k=5)]
+    assert scores == sorted(scores, reverse=True) and scores[0] == pytest.approx(1.0)
+
+
+def test_add_replaces_existing_ids_and_delete_removes_them():
+    matrix = vectors(10)
+    store = LocalVectorStore(None)
+    add(store, matrix)
+    store.add_vectors([Document(page_content="replaced")], -matrix[3:4], ["doc3"])
+    assert len(store) == 10
+    assert nearest(store, -matrix[3]) == ["doc3"]
+    assert store.get_by_ids(["doc3"])[0].page_content == "replaced"
+    assert store.delete(ids=["doc4", "missing"])
+    assert not store.delete(ids=["missing"])
+    assert len(store) == 9 and "doc4" not in nearest(store, matrix[4], k=9)
+
+
+def test_persisted_store_is_memory_mapped_and_keeps_changes(tmp_path):
+    matrix = vectors(30)
+    store = LocalVectorStore(None, path=str(tmp_path / "store"))
+    add(store, matrix[:20])
+    store.persist()
+
+    reopened = LocalVectorStore(None, path=str(tmp_path / "store"))
+    assert isinstance(reopened._base, np.memmap)
+    add(reopened, matrix[20:], prefix="new")
+    reopened.add_vectors([Document(page_content="replaced")], -matrix[2:3], ["doc2"])
+    reopened.delete(ids=["doc7"])
+    # Changes go next to the read-only mapped rows, not into a copy of them
+    assert isinstance(reopened._base, np.memmap) and reopened._base.shape[0] == 20
+    assert nearest(reopened, matrix[25]) == ["new5"]
+    assert nearest(reopened, -matrix[2]) == ["doc2"]
+    reopened.persist()
+
+    final = LocalVectorStore(None, path=str(tmp_path / "store"))
+    assert len(final) == 29
+    assert nearest(final, matrix[25]) == ["new5"]
+    assert nearest(final, -matrix[2]) == ["doc2"]
+    assert "doc7" not in nearest(final, matrix[7], k=29)
+
+
+def test_search_reloads_a_store_saved_by_another_instance(tmp_path):
+    path = str(tmp_path / "store")
+    matrix = vectors(5)
+    reader = LocalVectorStore(None, path=path)
+    assert nearest(reader, matrix[0]) == []
+    writer = LocalVectorStore(None, path=path)
+    add(writer, matrix)
+    writer.persist()
+    assert nearest(reader, matrix[1]) == ["doc1"]
+
+
+def test_unchanged_store_is_not_rewritten(tmp_path):
+    path = tmp_path / "store"
+    store = LocalVectorStore(None, path=str(path))
+    add(store, vectors(3))
+    store.persist()
+    written = (path / "records.json").stat().st_mtime_ns
+    store.persist()
+    LocalVectorStore(None, path=str(path)).persist()
+    assert (path / "records.json").stat().st_mtime_ns == written
+
+
+def test_ivf_finds_the_nearest_vector_in_probed_lists():
+    matrix = vectors(2000, dimensions=8, seed=1)
+    store = LocalVectorStore(None, index_type="ivf", n_lists=16, n_probe=16)
+    add(store, matrix)
+    for row in (0, 999, 1999):
+        assert nearest(store, matrix[row]) == [f"doc{row}"]
+
+
+def test_batched_search_matches_single_searches():
+    matrix = vectors(40)
+    store = LocalVectorStore(None)
+    add(store, matrix)
+    store.delete(ids=["doc1"])
+    results = LocalVectorStore.batch_similarity_search_with_vectors([(store, matrix[0], 3), (store, matrix[1], 2)])
+    for (query, k), pairs in zip(((matrix[0], 3), (matrix[1], 2)), results):
+        assert [doc.id for doc, _ in pairs] == nearest(store, query, k=k)
+        for doc, vector in pairs:
+            row = int(doc.id[3:])
+            assert np.allclose(vector, matrix[row] / np.linalg.norm(matrix[row]), atol=1e-6)
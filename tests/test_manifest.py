@@ -0,0 +1,80 @@
+import multiprocessing
+from langchain_core.documents import Document
+from rag_pipeline.manifest import IngestManifest, assign_chunk_ids, chunk_id, file_fingerprint
+
+
+def chunk(text, source="a.txt"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_fingerprint_of_bytes_and_path_match(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_bytes(b"contract terms")
+    assert file_fingerprint(b"contract terms") == file_fingerprint(str(path))
+    assert file_fingerprint(b"contract terms") != file_fingerprint(b"contract terms.")
+
+
+def test_chunk_ids_are_deterministic_and_number_repeats():
+    ids = assign_chunk_ids([chunk("x"), chunk("y"), chunk("x"), chunk("x", source="b.txt")])
+    assert ids[0] == chunk_id("a.txt", "x") == assign_chunk_ids([chunk("x")])[0]
+    assert ids[2] == chunk_id("a.txt", "x", 1)
+    assert ids[3] == chunk_id("b.txt", "x")
+    assert len(set(ids)) == 4
+
+
+def test_repeats_are_numbered_across_batches():
+    seen = {}
+    first = assign_chunk_ids([chunk("x")], seen)
+    second = assign_chunk_ids([chunk("x")], seen)
+    assert first + second == assign_chunk_ids([chunk("x"), chunk("x")])
+
+
+def test_record_invalidate_and_forget(tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    manifest.record("docs", "a.txt", "fa", {"2", "1"})
+    manifest.record("docs", "b.txt", "fb", {"3"})
+    assert manifest.is_unchanged("docs", "a.txt", "fa")
+    assert not manifest.is_unchanged("docs", "a.txt", "other")
+    assert not manifest.is_unchanged("other", "a.txt", "fa")
+
+    manifest.invalidate("docs", "a.txt")
+    assert not manifest.is_unchanged("docs", "a.txt", "fa")
+    assert manifest.chunk_ids("docs", "a.txt") == {"1", "2"}
+
+    reopened = IngestManifest(str(tmp_path / "manifest.json"))
+    assert sorted(reopened.sources("docs")) == ["a.txt", "b.txt"]
+    reopened.forget("docs", "b.txt")
+    assert reopened.sources("docs") == ["a.txt"]
+    reopened.forget("docs")
+    assert reopened.sources("docs") == []
+
+
+def test_reads_see_changes_saved_by_another_instance(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    reader = IngestManifest(path)
+    IngestManifest(path).record("docs", "a.txt", "fa", {"1"})
+    assert reader.sources("docs") == ["a.txt"]
+    assert reader.chunk_ids("docs", "a.txt") == {"1"}
+
+
+def _record_sources(path, worker, count):
+    manifest = IngestManifest(path)
+    for index in range(count):
+        manifest.record("docs", f"{worker}-{index}.txt", "fingerprint", {f"{worker}-{index}"})
+
+
+def test_processes_recording_at_once_keep_each_others_entries(tmp_path):
+    path = str(tmp_path / "manifest.json")
+    stale = IngestManifest(path)
+    stale.sources("docs")
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_record_sources, args=(path, worker, 25)) for worker in range(2)]
+    for process in workers:
+        process.start()
+    for process in workers:
+        process.join(60)
+        assert process.exitcode == 0
+    # Written from an instance loaded before the other processes ran
+    stale.record("docs", "last.txt", "fingerprint", {"last"})
+    sources = set(IngestManifest(path).sources("docs"))
+    assert sources == {f"{worker}-{index}.txt" for worker in range(2) for index in range(25)} | {"last.txt"}
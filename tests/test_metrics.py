@@ -0,0 +1,59 @@
+import time
+import urllib.request
+import pytest
+from rag_pipeline.metrics import Metrics, start_metrics_server, metrics as shared_metrics
+
+
+def test_counters_and_histograms_render_in_prometheus_format():
+    metrics = Metrics(buckets=(0.1, 1.0))
+    metrics.inc("rag_chunks_total", 64, stage="embedded")
+    metrics.inc("rag_chunks_total", 2, stage="embedded")
+    metrics.observe("rag_stage_duration_seconds", 0.05, stage="split")
+    metrics.observe("rag_stage_duration_seconds", 0.5, stage="split")
+    lines = metrics.render().splitlines()
+    assert "# TYPE rag_chunks_total counter" in lines
+    assert 'rag_chunks_total{stage="embedded"} 66' in lines
+    assert "# TYPE rag_stage_duration_seconds histogram" in lines
+    assert 'rag_stage_duration_seconds_bucket{stage="split",le="0.1"} 1' in lines
+    assert 'rag_stage_duration_seconds_bucket{stage="split",le="1.0"} 2' in lines
+    assert 'rag_stage_duration_seconds_bucket{stage="split",le="+Inf"} 2' in lines
+    assert 'rag_stage_duration_seconds_count{stage="split"} 2' in lines
+
+
+def test_span_times_stages_and_counts_errors():
+    metrics = Metrics()
+    with metrics.span("embed"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.span("embed"):
+            raise ValueError("quota")
+    snapshot = metrics.snapshot()
+    assert snapshot["histograms"]['rag_stage_duration_seconds{stage="embed"}']["count"] == 2
+    assert snapshot["counters"] == {'rag_stage_errors_total{stage="embed"}': 1}
+
+
+def test_timed_iter_only_counts_time_spent_producing_items():
+    metrics = Metrics()
+
+    def pages():
+        for page in range(3):
+            time.sleep(0.01)
+            yield page
+
+    for _ in metrics.timed_iter("load_documents", pages()):
+        # Time the consumer spends is not charged to the loader
+        time.sleep(0.05)
+    histogram = metrics.snapshot()["histograms"]['rag_stage_duration_seconds{stage="load_documents"}']
+    assert histogram["count"] == 1
+    assert 0.03 <= histogram["sum"] < 0.15
+
+
+def test_metrics_endpoint_serves_the_shared_metrics():
+    server = start_metrics_server(0)
+    assert start_metrics_server(0) is server
+    shared_metrics.inc("rag_answers_total", cache="hit")
+    host, port = server.server_address[:2]
+    with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+        body = response.read().decode()
+    assert response.headers["Content-Type"].startswith("text/plain")
+    assert 'rag_answers_total{cache="hit"}' in body
@@ -0,0 +1,119 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from rag_pipeline.local_vector_store import LocalVectorStore
+from rag_pipeline.quantization import (
+    BinaryQuantizer, ProductQuantizer, ScalarQuantizer, make_quantizer, min_training_vectors, rescore
+)
+
+
+def unit_vectors(count, dimensions=32, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, dimensions)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def recall_at_10(quantizer, vectors, queries):
+    codes = quantizer.encode(vectors)
+    hits = 0
+    for query in queries:
+        exact = set(np.argsort(-(vectors @ query))[:10])
+        hits += len(exact & set(np.argsort(-quantizer.scores(query, codes))[:10]))
+    return hits / (10 * len(queries))
+
+
+def test_scalar_quantizer_scores_close_to_exact():
+    vectors = unit_vectors(500)
+    quantizer = ScalarQuantizer().fit(vectors)
+    codes = quantizer.encode(vectors)
+    assert codes.dtype == np.uint8 and codes.shape == vectors.shape
+    assert np.allclose(quantizer.scores(vectors[0], codes), vectors @ vectors[0], atol=0.02)
+
+
+def test_binary_quantizer_packs_signs():
+    vectors = np.array([[1.0, -1.0, 0.5, -0.5, 1.0, 1.0, -1.0, -1.0, 1.0]])
+    codes = BinaryQuantizer().fit(vectors).encode(vectors)
+    assert codes.shape == (1, 2)
+    assert BinaryQuantizer().scores(vectors[0], codes)[0] == 0
+    assert BinaryQuantizer().scores(-vectors[0], codes)[0] == -9
+
+
+def test_product_quantizer_codes_and_recall():
+    vectors = unit_vectors(2000)
+    quantizer = ProductQuantizer(segments=8).fit(vectors)
+    codes = quantizer.encode(vectors)
+    assert codes.shape == (2000, 8) and codes.dtype == np.uint8
+    assert quantizer.codebooks.shape == (8, 256, 4)
+    recall = recall_at_10(quantizer, vectors, unit_vectors(20, seed=1))
+    # Far from trivially perfect, far better than chance
+    assert 0.3 < recall < 1.0
+
+
+def test_product_quantizer_needs_more_vectors_than_centroids():
+    with pytest.raises(ValueError, match="at least 256"):
+        ProductQuantizer(segments=8).fit(unit_vectors(100))
+    with pytest.raises(ValueError, match="must divide"):
+        ProductQuantizer(segments=5).fit(unit_vectors(300))
+    assert min_training_vectors("pq") == 256 and min_training_vectors("sq") == 1
+
+
+def test_make_quantizer_defaults_to_one_pq_segment_per_8_dimensions():
+    assert make_quantizer("pq", 768).segments == 96
+    assert make_quantizer("pq", 768, pq_segments=48).segments == 48
+    with pytest.raises(ValueError):
+        make_quantizer("none", 768)
+    with pytest.raises(ValueError, match="must divide"):
+        make_quantizer("pq", 768, pq_segments=100)
+
+
+def test_pq_segments_that_dont_divide_the_dimensions_fail_when_vectors_are_added(tmp_path):
+    store = LocalVectorStore(None, path=str(tmp_path / "store"), quantization="pq", pq_segments=5)
+    with pytest.raises(ValueError, match="must divide"):
+        add(store, unit_vectors(10))
+    assert len(store) == 0
+    saved = LocalVectorStore(None, path=str(tmp_path / "store"))
+    add(saved, unit_vectors(10))
+    saved.persist()
+    with pytest.raises(ValueError, match="must divide"):
+        LocalVectorStore(None, path=str(tmp_path / "store"), quantization="pq", pq_segments=5)
+
+
+def test_rescore_orders_by_full_precision_similarity():
+    pairs = [(Document(page_content=name), vector) for name, vector in
+             (("far", [0.0, 1.0]), ("near", [2.0, 0.1]), ("mid", [1.0, 1.0]))]
+    assert [doc.page_content for doc, _ in rescore([1.0, 0.0], pairs, 2)] == ["near", "mid"]
+    assert rescore([1.0, 0.0], [], 2) == []
+
+
+def add(store, vectors):
+    ids = [str(index) for index in range(len(vectors))]
+    store.add_vectors([Document(page_content=doc_id) for doc_id in ids], vectors, ids)
+
+
+@pytest.mark.parametrize("mode", ["sq", "pq"])
+def test_quantized_store_rescores_to_exact_scores(mode):
+    vectors = unit_vectors(1000)
+    exact, quantized = LocalVectorStore(None), LocalVectorStore(None, quantization=mode, rescore_factor=8)
+    add(exact, vectors)
+    add(quantized, vectors)
+    query = unit_vectors(1, seed=2)[0]
+    found = quantized.similarity_search_by_vector_with_score(query, k=5)
+    expected = dict((doc.id, score) for doc, score in exact.similarity_search_by_vector_with_score(query, k=1000))
+    for doc, score in found:
+        # Returned scores are full-precision similarities
+        assert score == pytest.approx(expected[doc.id], abs=1e-5)
+    assert found[0][0].id == max(expected, key=expected.get)
+    assert quantized.index_nbytes < exact.index_nbytes
+
+
+def test_small_pq_store_is_searched_uncompressed():
+    vectors = unit_vectors(100)
+    store = LocalVectorStore(None, quantization="pq")
+    add(store, vectors)
+    assert store.similarity_search_by_vector(vectors[7], k=1)[0].id == "7"
+    assert store.codebook_nbytes == 0 and store.index_nbytes == vectors.nbytes
+    # Replaces the 100 vectors and adds 156: enough to train 256 centroids
+    add(store, unit_vectors(256, seed=3))
+    assert len(store) == 256
+    # One float32 codebook of 256 centroids per 8 dimensions
+    assert store.codebook_nbytes == 4 * 256 * 8 * 4
+    assert store.index_nbytes == 256 * 4
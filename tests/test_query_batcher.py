@@ -0,0 +1,100 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from rag_pipeline.fakes import FakeEmbeddings
+from rag_pipeline.local_vector_store import LocalVectorStore
+from rag_pipeline.query_batcher import QueryBatcher
+
+
+class CountingEmbeddings(FakeEmbeddings):
+    """Records the texts of every batched query request."""
+
+    def __init__(self):
+        super().__init__(dimensions=16)
+        self.batches = []
+
+    def embed_queries(self, texts):
+        self.batches.append(list(texts))
+        return self.embed_documents(texts)
+
+
+class FailingEmbeddings(FakeEmbeddings):
+    def embed_queries(self, texts):
+        raise RuntimeError("embedding service down")
+
+
+def concurrently(function, arguments):
+    barrier = threading.Barrier(len(arguments))
+
+    def call(argument):
+        barrier.wait()
+        return function(argument)
+
+    with ThreadPoolExecutor(len(arguments)) as pool:
+        return list(pool.map(call, arguments))
+
+
+@pytest.fixture
+def batcher():
+    batcher = QueryBatcher(window=0.2, max_batch_size=8)
+    yield batcher
+    batcher.close()
+
+
+def test_concurrent_queries_are_embedded_in_one_request(batcher):
+    embeddings = CountingEmbeddings()
+    texts = ["payment terms", "warranty", "payment terms", "delivery"]
+    vectors = concurrently(lambda text: batcher.embed_query(embeddings, text), texts)
+    assert len(embeddings.batches) == 1
+    # Repeated questions are embedded once
+    assert sorted(embeddings.batches[0]) == ["delivery", "payment terms", "warranty"]
+    assert vectors == [embeddings.embed_query(text) for text in texts]
+
+
+def test_searches_of_one_store_run_as_one_batch(batcher, monkeypatch):
+    embeddings = CountingEmbeddings()
+    store = LocalVectorStore(embeddings)
+    texts = ["payment terms", "warranty period", "delivery schedule"]
+    store.add_vectors([Document(page_content=text) for text in texts], embeddings.embed_documents(texts),
+                      ["payment", "warranty", "delivery"])
+    calls = []
+    batched = LocalVectorStore.batch_similarity_search_with_vectors.__func__
+
+    def spy(cls, searches):
+        calls.append(len(searches))
+        return batched(cls, searches)
+
+    monkeypatch.setattr(LocalVectorStore, "batch_similarity_search_with_vectors", classmethod(spy))
+    results = concurrently(lambda text: batcher.search(store, text, k=1), texts)
+    assert calls == [3]
+    assert [pairs[0][0].id for _, pairs in results] == ["payment", "warranty", "delivery"]
+    for (query_vector, pairs), text in zip(results, texts):
+        assert np.allclose(query_vector, embeddings.embed_query(text))
+        assert np.allclose(pairs[0][1], query_vector, atol=1e-6)
+
+
+def test_errors_reach_every_caller_of_the_batch(batcher):
+    embeddings = FailingEmbeddings(dimensions=4)
+
+    def embed(text):
+        with pytest.raises(RuntimeError, match="embedding service down"):
+            batcher.embed_query(embeddings, text)
+        return True
+
+    assert all(concurrently(embed, ["a", "b"]))
+
+
+def test_batch_size_of_one_runs_in_the_caller():
+    embeddings = CountingEmbeddings()
+    batcher = QueryBatcher(max_batch_size=1)
+    assert batcher.embed_query(embeddings, "question") == embeddings.embed_query("question")
+    assert embeddings.batches == [] and batcher._collector is None
+
+
+def test_closed_batcher_rejects_requests(batcher):
+    batcher.embed_query(CountingEmbeddings(), "warm up")
+    batcher.close()
+    with pytest.raises(RuntimeError):
+        batcher.embed_query(CountingEmbeddings(), "question")
@@ -0,0 +1,94 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import query_rewriting_agent
+from query_rewriting_agent import QueryRewritingAgent, RewriteCache, get_query_rewriting_agent, normalize_query
+from rag_pipeline.fakes import FakeEmbeddings
+
+
+class FakeAgent:
+    """Records how many rewrites run on each agent at once."""
+
+    created = []
+
+    def __init__(self, **kwargs):
+        self.running = 0
+        self.most_running = 0
+        self.runs = 0
+        self._lock = threading.Lock()
+        FakeAgent.created.append(self)
+
+    def run(self, query):
+        with self._lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+            self.runs += 1
+        time.sleep(0.02)
+        with self._lock:
+            self.running -= 1
+        return f"{query} rewritten"
+
+
+@pytest.fixture
+def agents(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY", "test-key")
+    monkeypatch.delenv("LANGCHAIN_API_KEY", raising=False)
+    monkeypatch.setattr(query_rewriting_agent, "Agent", FakeAgent)
+    monkeypatch.setattr(FakeAgent, "created", [])
+    return FakeAgent.created
+
+
+def test_normalized_queries_share_a_cache_entry():
+    cache = RewriteCache()
+    cache.put("What is  covered?", "Coverage details")
+    assert normalize_query(" what is covered ") == "what is covered"
+    assert cache.get("what is covered") == "Coverage details"
+    assert cache.get("What is excluded?") is None
+    assert cache.stats() == {"hits": 1, "semantic_hits": 0, "misses": 1, "size": 1}
+
+
+def test_cache_evicts_least_recently_used_and_expired_entries():
+    cache = RewriteCache(max_size=2, ttl_seconds=60)
+    cache.put("first", "1")
+    cache.put("second", "2")
+    cache.get("first")
+    cache.put("third", "3")
+    assert cache.get("second") is None
+    assert cache.get("first") == "1"
+    expiring = RewriteCache(ttl_seconds=0)
+    expiring.put("first", "1")
+    assert expiring.get("first") is None
+
+
+def test_similar_queries_reuse_a_rewrite():
+    cache = RewriteCache(embeddings=FakeEmbeddings(dimensions=64), similarity_threshold=0.9)
+    cache.put("payment terms of the contract", "Contract payment terms")
+    assert cache.get("Contract: the terms of payment") == "Contract payment terms"
+    assert cache.get("warranty exclusions") is None
+    assert cache.stats()["semantic_hits"] == 1
+
+
+def test_concurrent_rewrites_never_share_an_agent(agents):
+    agent = QueryRewritingAgent(pool_size=2)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        rewrites = list(executor.map(agent.rewrite_query, [f"question {index}" for index in range(16)]))
+    assert rewrites == [f"question {index} rewritten" for index in range(16)]
+    assert 1 <= len(agents) <= 2
+    assert all(created.most_running == 1 for created in agents)
+    assert sum(created.runs for created in agents) == 16
+
+
+def test_cached_rewrites_skip_the_agent(agents):
+    agent = QueryRewritingAgent(cache=RewriteCache(), pool_size=1)
+    assert agent.rewrite_query("What is covered?") == "What is covered? rewritten"
+    assert agent.rewrite_query("what is covered") == "What is covered? rewritten"
+    assert sum(created.runs for created in agents) == 1
+
+
+def test_agent_is_created_once_per_process(agents, monkeypatch):
+    monkeypatch.setattr(query_rewriting_agent, "_shared_agent", None)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        shared = set(executor.map(lambda _: id(get_query_rewriting_agent()), range(8)))
+    assert len(shared) == 1
+    assert get_query_rewriting_agent().cache is not None
@@ -0,0 +1,104 @@
+import time
+import uuid
+import threading
+import pytest
+from langchain_core.documents import Document
+from rag_pipeline import rag_pipeline
+from rag_pipeline.fakes import FakeEmbeddings, FakeLLM, FakeQueryRewriter
+from rag_pipeline.rag_pipeline import initialize_prompt, query_rag, store_embeddings, stream_query_rag
+
+QUESTION = "What about payment?"
+
+
+def chunks(count, source="a.txt"):
+    return [
+        Document(page_content=f"Chunk {index} covers payment terms {index} and delivery {index}.",
+                 metadata={"source": source, "page": index})
+        for index in range(count)
+    ]
+
+
+@pytest.fixture
+def vector_store():
+    return store_embeddings(chunks(12), f"Test{uuid.uuid4().hex}", None, FakeEmbeddings(dimensions=32), batch_size=4)
+
+
+@pytest.fixture
+def rewriter(monkeypatch):
+    rewriter = FakeQueryRewriter()
+    monkeypatch.setattr(rag_pipeline, "get_query_agent", lambda: rewriter)
+    return rewriter
+
+
+def test_chunks_are_pulled_as_batches_are_written():
+    pulled = []
+    written = []
+
+    def generate():
+        for chunk in chunks(40):
+            pulled.append(chunk)
+            yield chunk
+
+    def on_batch(progress):
+        written.append((progress["embedded"], len(pulled)))
+
+    store = store_embeddings(generate(), f"Test{uuid.uuid4().hex}", None, FakeEmbeddings(dimensions=32),
+                             batch_size=4, max_concurrency=1, on_batch=on_batch)
+    assert len(store) == 40
+    # The first batch is stored long before the generator is exhausted
+    assert written[0][0] == 4 and written[0][1] < 40
+
+
+def test_slow_rewrite_is_not_waited_for(vector_store, rewriter, monkeypatch):
+    rewriter.latency = 1.0
+    monkeypatch.setattr(rag_pipeline, "REWRITE_TIMEOUT_SECONDS", 0.05)
+    started = time.perf_counter()
+    result = query_rag(QUESTION, vector_store, FakeLLM(answer_words=5), initialize_prompt())
+    assert time.perf_counter() - started < rewriter.latency
+    assert result["metadata"]["rewritten_query"] == QUESTION
+    assert result["metadata"]["timings"]["rewrite_timed_out"]
+    assert result["metadata"]["sources"]
+
+
+def test_original_question_is_searched_while_the_rewrite_runs(vector_store, rewriter):
+    searched = threading.Event()
+    embeddings = vector_store.embeddings
+    vector = embeddings._vector
+
+    def recording_vector(text):
+        if text == QUESTION:
+            searched.set()
+        return vector(text)
+
+    embeddings._vector = recording_vector
+    rewrite_query = rewriter.rewrite_query
+
+    def rewrite_after_search(query, **kwargs):
+        # Only returns early if the original search started without waiting for the rewrite
+        assert searched.wait(2)
+        return rewrite_query(query, **kwargs)
+
+    rewriter.rewrite_query = rewrite_after_search
+    result = query_rag(QUESTION, vector_store, FakeLLM(answer_words=5), initialize_prompt())
+    timings = result["metadata"]["timings"]
+    assert result["metadata"]["rewritten_query"] == "What about payment key facts and details"
+    assert "original_search_seconds" in timings and "rewritten_search_seconds" in timings
+    assert timings["rewrite_seconds"] < 2
+
+
+def test_answer_is_streamed_token_by_token(vector_store, rewriter):
+    llm = FakeLLM(latency=0.05, token_latency=0.05, answer_words=6)
+    answer = stream_query_rag(QUESTION, vector_store, llm, initialize_prompt())
+    started = time.perf_counter()
+    arrivals = []
+    pieces = []
+    for piece in answer:
+        arrivals.append(time.perf_counter() - started)
+        pieces.append(piece)
+    assert len(pieces) == 6
+    # The first token is shown before the rest have been generated
+    assert arrivals[-1] - arrivals[0] >= 0.2
+    timings = answer.result["metadata"]["timings"]
+    assert answer.result["answer"] == "".join(pieces)
+    assert 0 < timings["time_to_first_token_seconds"] <= timings["total_seconds"]
+    assert timings["output_tokens"] == 6
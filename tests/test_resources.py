@@ -0,0 +1,83 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from rag_pipeline.resources import ResourceRegistry
+
+
+class Resource:
+    def __init__(self, name, closed):
+        self.name = name
+        self.closed = closed
+        self.healthy = True
+
+    def close(self):
+        self.closed.append(self.name)
+
+
+def test_concurrent_first_use_creates_one_instance():
+    calls = []
+
+    def factory():
+        calls.append(threading.get_ident())
+        time.sleep(0.05)
+        return object()
+
+    registry = ResourceRegistry()
+    registry.register("llm", factory)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        instances = set(map(id, executor.map(lambda _: registry.get("llm"), range(8))))
+    assert len(calls) == 1
+    assert len(instances) == 1
+
+
+def test_failed_factory_is_reported_and_retried():
+    attempts = []
+
+    def factory():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("cluster unreachable")
+        return object()
+
+    registry = ResourceRegistry()
+    registry.register("weaviate", factory)
+    with pytest.raises(ConnectionError):
+        registry.get("weaviate")
+    assert registry.health() == {"weaviate": {"status": "error", "error": "cluster unreachable"}}
+    registry.get("weaviate")
+    assert registry.health() == {"weaviate": {"status": "ok"}}
+
+
+def test_health_reset_and_shutdown():
+    closed = []
+    registry = ResourceRegistry()
+    registry.register("embeddings", lambda: Resource("embeddings", closed), close=Resource.close)
+    registry.register("weaviate", lambda: Resource("weaviate", closed),
+                      health_check=lambda resource: resource.healthy, close=Resource.close)
+    registry.register("llm", lambda: Resource("llm", closed))
+    assert registry.health()["weaviate"] == {"status": "not_started"}
+
+    registry.warm_up(background=False)
+    weaviate = registry.get("weaviate")
+    weaviate.healthy = False
+    assert registry.health() == {"embeddings": {"status": "ok"}, "weaviate": {"status": "unhealthy"},
+                                 "llm": {"status": "ok"}}
+    registry.reset("weaviate")
+    assert closed == ["weaviate"]
+    assert registry.get("weaviate") is not weaviate
+
+    registry.shutdown()
+    # Newest first; resources without a close callable are just dropped
+    assert closed == ["weaviate", "weaviate", "embeddings"]
+    assert registry.health()["llm"] == {"status": "not_started"}
+
+
+def test_warm_up_runs_once():
+    calls = []
+    registry = ResourceRegistry()
+    registry.register("llm", lambda: calls.append(1) or object())
+    registry.warm_up(background=False)
+    registry.reset("llm")
+    registry.warm_up(background=False)
+    assert calls == [1]
@@ -0,0 +1,80 @@
+import os
+import uuid
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from langchain_core.documents import Document
+from rag_pipeline.fakes import FakeEmbeddings
+from rag_pipeline.manifest import IngestManifest
+from rag_pipeline.rag_pipeline import connect_vector_store, store_embeddings
+from rag_pipeline.tenants import TenantTracker, delete_tenant, local_store_path, tenant_name, tenant_scope
+
+
+def chunks(tenant, count=6):
+    return [
+        Document(page_content=f"{tenant} owns contract clause {index} about payment.",
+                 metadata={"source": f"{tenant}.txt", "page": index})
+        for index in range(count)
+    ]
+
+
+@pytest.fixture
+def collection():
+    return f"Test{uuid.uuid4().hex}"
+
+
+@pytest.fixture
+def embeddings():
+    return FakeEmbeddings(dimensions=32)
+
+
+def test_tenant_names_are_weaviate_safe_and_distinct():
+    assert tenant_name("alice_01") == "alice_01"
+    dotted, at = tenant_name("a.b"), tenant_name("a@b")
+    assert dotted != at
+    assert all(name.replace("-", "").replace("_", "").isalnum() for name in (dotted, at))
+    assert len(tenant_name("x" * 200)) <= 64
+    assert tenant_scope("Document") == "Document"
+    assert tenant_scope("Document", "alice") == "Document.alice"
+
+
+def test_concurrent_tenants_only_see_their_own_documents(collection, embeddings, tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    tenants = ["alice", "bob", "carol", "dave"]
+
+    def ingest(tenant):
+        store_embeddings(chunks(tenant), collection, None, embeddings, manifest=manifest, batch_size=2,
+                         tenant=tenant)
+
+    with ThreadPoolExecutor(max_workers=len(tenants)) as executor:
+        list(executor.map(ingest, tenants))
+    for tenant in tenants:
+        store = connect_vector_store(collection, None, embeddings, tenant=tenant)
+        hits = store.similarity_search("contract clause about payment", k=20)
+        assert len(hits) == 6
+        assert {hit.metadata["source"] for hit in hits} == {f"{tenant}.txt"}
+        assert manifest.sources(tenant_scope(collection, tenant)) == [f"{tenant}.txt"]
+    assert manifest.sources(collection) == []
+
+
+def test_deleting_a_tenant_leaves_the_others(collection, embeddings, tmp_path):
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    for tenant in ("alice", "bob"):
+        store_embeddings(chunks(tenant), collection, None, embeddings, manifest=manifest, tenant=tenant)
+    delete_tenant(collection, "alice", manifest=manifest)
+    assert not os.path.exists(local_store_path(tenant_scope(collection, "alice")))
+    assert manifest.sources(tenant_scope(collection, "alice")) == []
+    assert len(connect_vector_store(collection, None, embeddings, tenant="alice")) == 0
+    assert len(connect_vector_store(collection, None, embeddings, tenant="bob")) == 6
+
+
+def test_idle_tenants_are_offloaded(collection):
+    tracker = TenantTracker(idle_seconds=0.05)
+    assert tracker.touch(collection, "alice")
+    assert not tracker.touch(collection, "alice")
+    tracker.touch(collection, "bob")
+    time.sleep(0.1)
+    tracker.touch(collection, "bob")
+    assert tracker.offload_idle() == [(collection, "alice")]
+    # An offloaded tenant counts as inactive again on its next request
+    assert tracker.touch(collection, "alice")
@@ -0,0 +1,67 @@
+import threading
+import uuid
+from langsmith import tracing_context
+from langsmith.run_trees import RunTree
+from rag_pipeline.rag_pipeline import _trace_ids
+from rag_pipeline.tracing import FeedbackQueue
+
+
+class RecordingClient:
+    def __init__(self, release=None):
+        self.release = release
+        self.feedback = []
+
+    def create_feedback(self, **kwargs):
+        if self.release is not None:
+            self.release.wait(5)
+        self.feedback.append(kwargs)
+
+
+def test_feedback_is_sent_with_the_trace_id_it_was_submitted_with():
+    client = RecordingClient()
+    feedback = FeedbackQueue(lambda: client, flush_interval=0.05)
+    run_id, trace_id = uuid.uuid4(), uuid.uuid4()
+    assert feedback.submit(run_id, "query-rewrite", score=1, trace_id=trace_id)
+    assert feedback.submit(run_id, "user-feedback", score=0)
+    assert not feedback.submit(None, "user-feedback")
+    feedback.close()
+    assert [(item["run_id"], item["trace_id"], item["key"]) for item in client.feedback] == [
+        (run_id, trace_id, "query-rewrite"),
+        # A nested run's trace isn't its own ID, so none is guessed
+        (run_id, None, "user-feedback"),
+    ]
+    assert feedback.stats() == {"submitted": 2, "sent": 2, "dropped": 0, "failed": 0, "pending": 0}
+
+
+def test_full_queue_drops_feedback_without_blocking():
+    release = threading.Event()
+    client = RecordingClient(release)
+    feedback = FeedbackQueue(lambda: client, max_size=1, batch_size=1, flush_interval=0.05)
+    # The worker holds at most one item while the client is stuck, and the queue one more
+    accepted = [feedback.submit(uuid.uuid4(), "user-feedback") for _ in range(5)]
+    assert accepted.count(False) >= 3
+    release.set()
+    feedback.close()
+    stats = feedback.stats()
+    assert stats["submitted"] == accepted.count(True) == stats["sent"] == len(client.feedback)
+    assert stats["dropped"] == accepted.count(False)
+
+
+def test_unavailable_client_counts_feedback_as_failed():
+    def client_factory():
+        raise RuntimeError("no API key")
+
+    feedback = FeedbackQueue(client_factory, flush_interval=0.05)
+    feedback.submit(uuid.uuid4(), "user-feedback")
+    feedback.close()
+    assert feedback.stats()["failed"] == 1
+
+
+def test_nested_runs_report_their_root_as_the_trace():
+    root = RunTree(name="query")
+    child = root.create_child(name="query_rag")
+    with tracing_context(parent=child, enabled=True):
+        assert _trace_ids() == (child.id, root.id)
+    assert _trace_ids() == (None, None)
+    run_id = uuid.uuid4()
+    assert _trace_ids(run_id) == (run_id, None)